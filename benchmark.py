@@ -0,0 +1,437 @@
+"""
+Benchmarks of the performance critical parts of the game, these run without opening a window.
+Run all of them with 'python benchmark.py', or only some with 'python benchmark.py texture_upload ...'
+"""
+
+import sys
+import copy
+import glob
+import random
+import warnings
+from timeit import default_timer as timer
+
+import numpy as np
+from PIL import Image
+
+import graphics as gl
+from game_util import get_texture_data, move_distance_enemy, move_distance_player, RenderQueue, UpdateQueue
+
+
+def best_time(function, repeats=5):
+    # Best time of a number of runs, in seconds
+    best = float('inf')
+    for _ in range(repeats):
+        start = timer()
+        function()
+        best = min(best, timer() - start)
+    return best
+
+
+def benchmark_texture_upload():
+    # Compares preparing the pixels for glTexImage2D through a Python object per pixel (the old way) with passing the raw bytes
+    print('Texture upload preparation, best of 5')
+    print(f"{'image':<26}{'size':>12}{'per pixel':>12}{'raw bytes':>12}{'speedup':>10}{'memory':>16}")
+    total_old, total_new = 0, 0
+    for filename in sorted(glob.glob('./assets/UI/*.png')):
+        img = Image.open(filename)
+        img.load()
+
+        def per_pixel():
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', DeprecationWarning)
+                return np.array(list(img.getdata()), np.int32)
+
+        def raw_bytes():
+            return get_texture_data(img)[2]
+
+        old_time, new_time = best_time(per_pixel), best_time(raw_bytes)
+        total_old, total_new = total_old + old_time, total_new + new_time
+        memory = f"{per_pixel().nbytes / 2 ** 20:.1f}/{len(raw_bytes()) / 2 ** 20:.1f} MiB"
+        print(f"{filename.split('/')[-1]:<26}{'x'.join(map(str, img.size)):>12}{old_time * 1000:>10.1f}ms{new_time * 1000:>10.1f}ms"
+              f"{old_time / new_time:>9.0f}x{memory:>16}")
+        img.close()
+    print(f"{'total':<38}{total_old * 1000:>10.1f}ms{total_new * 1000:>10.1f}ms{total_old / total_new:>9.0f}x")
+
+
+def benchmark_render(difficulties=(1, 3, 5, 8, 12), frames=120, warmup_frames=10):
+    # Runs the update and culled render path on the recording backend, with the player walking through the map. Maps are seeded, so
+    # the draw work per frame is deterministic and can be compared between runs.
+    from map_generation import Map
+    from persons import Player
+
+    recorder = gl.use_backend(gl.RecordingBackend(keep_commands=False))
+    print(f'Update and render per frame on the recording backend, mean of {frames} frames')
+    print(f"{'difficulty':>10}{'map':>8}{'objects':>9}{'calls':>8}{'draws':>7}{'states':>8}{'vertices':>10}{'update':>10}{'render':>10}")
+    for difficulty in difficulties:
+        random.seed(difficulty)
+        np.random.seed(difficulty)
+        render_queue, update_queue = RenderQueue(), UpdateQueue()
+        map_grid_size = (int(2 * difficulty + 5), int(4 * difficulty + 11))
+        game_map = Map(render_queue, update_queue, map_grid_size=map_grid_size, difficulty=difficulty)
+        player = Player(game_map, render_queue, update_queue)
+        game_map.set_player_object(player)
+        render_queue.set_camera_focus(player)
+
+        update_time, render_time = 0, 0
+        statistics = gl.FrameStatistics()
+        for frame in range(warmup_frames + frames):
+            recorder.begin_frame()
+            player.move(0.2, (-1, 0))
+            start = timer()
+            update_queue.run_queue(1 / 45)
+            update_queue.interpolate(1)
+            update_end = timer()
+            render_queue.run_queue_culled()
+            render_end = timer()
+            if frame >= warmup_frames:
+                update_time += update_end - start
+                render_time += render_end - update_end
+                statistics.add(recorder.frame_statistics)
+        print(f"{difficulty:>10}{'x'.join(map(str, map_grid_size)):>8}{len(render_queue.queue):>9}{statistics.calls / frames:>8.0f}"
+              f"{statistics.draw_calls / frames:>7.0f}{statistics.state_changes / frames:>8.0f}{statistics.vertices / frames:>10.0f}"
+              f"{update_time / frames * 1000:>8.2f}ms{render_time / frames * 1000:>8.2f}ms")
+
+
+def animate_person_scalar(person, state):
+    # The walk animation as it was done per person before PersonAnimation, on a dict with the state of one person
+    location = person.location
+    if abs(location[0] - state['previous_location'][0]) > 0.005 or abs(location[1] - state['previous_location'][1]) > 0.005:
+        target_rotation = -np.rad2deg(np.arctan2(state['previous_location'][1] - location[1], state['previous_location'][0] - location[0]))
+        if state['limp_rotation_target'] == 0:
+            state['limp_rotation_target'] = 45
+        if state['limp_rotation'] >= 45:
+            state['limp_rotation_target'] = -45
+        if state['limp_rotation'] <= -45:
+            state['limp_rotation_target'] = 45
+        state['limp_rotation'] = state['previous_limp_rotation'] + (person.leg_rotation_speed * state['limp_rotation_target'] / 45 *
+                                                                    np.sqrt((location[0] - state['previous_location'][0]) ** 2 +
+                                                                            (location[1] - state['previous_location'][1]) ** 2))
+    else:
+        state['limp_rotation_target'] = 0
+        target_rotation = copy.deepcopy(state['previous_target_rotation'])
+    if (target_rotation - state['previous_rotation']) > 180:
+        state['previous_rotation'] += 360
+    if (target_rotation - state['previous_rotation']) < -180:
+        state['previous_rotation'] -= 360
+    state['rotation'] = state['previous_rotation'] + person.rotation_speed * (target_rotation - state['previous_rotation'])
+    person.place_body((location[0], location[1], state['rotation'], state['limp_rotation']))
+    state['previous_location'] = copy.deepcopy(location)
+    state['previous_rotation'] = copy.deepcopy(state['rotation'])
+    state['previous_limp_rotation'] = copy.deepcopy(state['limp_rotation'])
+    state['previous_target_rotation'] = copy.deepcopy(target_rotation)
+
+
+def benchmark_person_animation(difficulties=(1, 3, 5, 8, 12, 20), ticks=200):
+    # Compares the walk animation per person (the old way) with the vectorized PersonAnimation step and interpolation, on the
+    # movement of the persons in seeded maps. 'difference' is the largest difference in rotation between both, as a check.
+    from map_generation import Map
+    from persons import Player
+
+    gl.use_backend(gl.RecordingBackend(keep_commands=False))
+    print(f'Walk animation per tick, mean of {ticks} ticks')
+    print(f"{'difficulty':>10}{'persons':>9}{'per person':>14}{'vectorized':>14}{'per person':>14}{'vectorized':>14}{'difference':>12}")
+    print(f"{'':>19}{'(total)':>14}{'(total)':>14}{'(each)':>14}{'(each)':>14}")
+    for difficulty in difficulties:
+        random.seed(difficulty)
+        np.random.seed(difficulty)
+        render_queue, update_queue = RenderQueue(), UpdateQueue()
+        map_grid_size = (int(2 * difficulty + 5), int(4 * difficulty + 11))
+        game_map = Map(render_queue, update_queue, map_grid_size=map_grid_size, difficulty=difficulty)
+        player = Player(game_map, render_queue, update_queue)
+        game_map.set_player_object(player)
+        # The animation is timed on its own, after the persons have moved
+        animation = game_map.person_animation
+        update_queue.unsubscribe(animation)
+        persons = animation.persons
+        scalar_states = [{'previous_location': list(person.location), 'rotation': 180, 'previous_rotation': 180,
+                          'previous_target_rotation': 180, 'limp_rotation': 0, 'previous_limp_rotation': 0, 'limp_rotation_target': 45}
+                         for person in persons]
+
+        scalar_time, vectorized_time, difference = 0, 0, 0
+        for tick in range(ticks):
+            player.move(0.06, (-1, 0))
+            update_queue.run_queue(1 / 45)
+            start = timer()
+            for person, scalar_state in zip(persons, scalar_states):
+                animate_person_scalar(person, scalar_state)
+            scalar_end = timer()
+            animation.update_object(1 / 45)
+            animation.interpolate(1)
+            vectorized_end = timer()
+            scalar_time += scalar_end - start
+            vectorized_time += vectorized_end - scalar_end
+            difference = max([difference] + [abs(scalar_state['rotation'] - person.rotation)
+                                             for person, scalar_state in zip(persons, scalar_states)])
+        count = len(persons)
+        print(f"{difficulty:>10}{count:>9}{scalar_time / ticks * 1e6:>12.1f}us{vectorized_time / ticks * 1e6:>12.1f}us"
+              f"{scalar_time / ticks / count * 1e6:>12.1f}us{vectorized_time / ticks / count * 1e6:>12.1f}us{difference:>12.2g}")
+
+
+def check_collision_scalar(person, distance, direction, bounding_box):
+    # The collision test of a person before CollisionGrid: whether the point at the distance against the direction, plus the bounding
+    # box, is outside of the open cells
+    from persons import get_grid_index, get_location
+
+    grid_position = get_grid_index(get_location(person.location, distance, direction, bounding_box))
+    if 0 <= grid_position[0] < person.map_grid.shape[0] and 0 <= grid_position[1] < person.map_grid.shape[1]:
+        return not person.map_grid[grid_position]
+    else:
+        return True
+
+
+def is_here_scalar(player, location):
+    # The test of a sampled vision ray point against the player before GuardVision
+    return np.sqrt((player.location[0] - location[0]) ** 2 + (player.location[1] - location[1]) ** 2) < 0.1
+
+
+def trace_vision_cones_scalar(enemy):
+    # The vision cones of one enemy as they were traced before GuardVision, by sampling every ray in steps of 0.1
+    from persons import get_location
+
+    def trace(enemy_sight_distance, trace_direction):
+        step_division = 10
+        for trace_step in range(enemy_sight_distance * step_division):
+            if is_here_scalar(enemy.player_object, get_location(enemy.location, 2 * trace_step / step_division, trace_direction)):
+                enemy.player_object.spotted()
+            if check_collision_scalar(enemy, trace_step / step_division, trace_direction, 0.1):
+                return (trace_step + 3) / step_division
+        return enemy_sight_distance + 3
+
+    distances = []
+    for vision_slice in enemy.vision_slices:
+        direction_angle = enemy.rotation + vision_slice.rotation[1]
+        direction = (np.cos(np.deg2rad(direction_angle)), -np.sin(np.deg2rad(direction_angle)))
+        distances.append(trace(enemy.enemy_sight_distance, direction))
+    return distances
+
+
+def benchmark_vision(difficulties=(1, 3, 5, 8, 12, 20), ticks=100):
+    # Compares tracing the vision cones per enemy by sampling (the old way) with the vectorized grid traversal of GuardVision, in
+    # seeded maps. 'agree' is the share of cones of which the lengths differ less than the 0.1 step of the sampling, in the others the
+    # samples passed diagonally between two wall corners, which the exact traversal does not.
+    from map_generation import Map
+    from persons import Player
+
+    gl.use_backend(gl.RecordingBackend(keep_commands=False))
+    print(f'Vision cones per tick, mean of {ticks} ticks')
+    print(f"{'difficulty':>10}{'enemies':>9}{'rays':>7}{'sampled':>12}{'traversal':>12}{'speedup':>9}{'agree':>9}")
+    for difficulty in difficulties:
+        random.seed(difficulty)
+        np.random.seed(difficulty)
+        render_queue, update_queue = RenderQueue(), UpdateQueue()
+        map_grid_size = (int(2 * difficulty + 5), int(4 * difficulty + 11))
+        game_map = Map(render_queue, update_queue, map_grid_size=map_grid_size, difficulty=difficulty)
+        player = Player(game_map, render_queue, update_queue)
+        game_map.set_player_object(player)
+        # The vision is timed on its own, after the persons have moved
+        vision = game_map.guard_vision
+        update_queue.unsubscribe(vision)
+        enemies = vision.enemies
+        if not enemies:
+            continue
+
+        sampled_time, traversal_time, agreeing = 0, 0, 0
+        for tick in range(ticks):
+            update_queue.run_queue(1 / 45)
+            start = timer()
+            sampled_lengths = [length for enemy in enemies for length in trace_vision_cones_scalar(enemy)]
+            sampled_end = timer()
+            vision.update_object(1 / 45)
+            traversal_end = timer()
+            sampled_time += sampled_end - start
+            traversal_time += traversal_end - sampled_end
+            lengths = [vision_slice.size[0] for enemy in enemies for vision_slice in enemy.vision_slices]
+            agreeing += sum(abs(sampled - length) <= 0.15 for sampled, length in zip(sampled_lengths, lengths))
+        print(f"{difficulty:>10}{len(enemies):>9}{len(vision.slice_rows):>7}{sampled_time / ticks * 1000:>10.2f}ms"
+              f"{traversal_time / ticks * 1000:>10.2f}ms{sampled_time / traversal_time:>8.0f}x"
+              f"{agreeing / ticks / len(lengths):>9.1%}")
+
+
+def walk_enemy_scalar(enemy, walking_direction, tick_duration):
+    # The walk of one enemy as it was done per enemy before EnemySwarm, drawing directions until one is not blocked
+    def get_new_walking_direction():
+        direction = [random.randint(-1, 1), random.randint(-1, 1)]
+        if sum(direction) == 0 and random.uniform(0, 1) < 0.9:
+            direction[1] = random.choice((-1, 1))
+        return tuple(direction)
+
+    if random.uniform(0, 1) > 0.99:
+        walking_direction = get_new_walking_direction()
+    while check_collision_scalar(enemy, 0.3, walking_direction, 0.25):
+        walking_direction = get_new_walking_direction()
+    distance = move_distance_enemy(tick_duration)
+    if not check_collision_scalar(enemy, distance, walking_direction, 0.25):
+        enemy.location[0] -= walking_direction[0] * distance
+        enemy.location[1] -= walking_direction[1] * distance
+    return walking_direction
+
+
+def benchmark_enemy_swarm(difficulties=(1, 3, 5, 8, 12, 20, 40), ticks=200, replays=3):
+    # Compares walking the enemies one by one in random directions (the old way) with the EnemySwarm step, in which they follow the
+    # flow fields to their patrol waypoints, both from the same locations every tick. Next to the mean time per tick, the slowest
+    # tick shows how much the retries of the random directions vary. Every seeded round is replayed and every tick takes its fastest
+    # replay, so the slowest tick is the cost of that tick and not a hiccup of the machine.
+    from map_generation import Map
+
+    gl.use_backend(gl.RecordingBackend(keep_commands=False))
+    print(f'Enemy walking per tick, of {ticks} ticks, fastest of {replays} replays')
+    print(f"{'difficulty':>10}{'enemies':>9}{'waypoints':>11}{'navigation':>12}{'per enemy':>12}{'swarm':>10}{'speedup':>9}"
+          f"{'per enemy':>12}{'swarm':>10}")
+    print(f"{'':>30}{'(build)':>12}{'(mean)':>12}{'(mean)':>10}{'':>9}{'(slowest)':>12}{'(slowest)':>10}")
+    for difficulty in difficulties:
+        scalar_times, swarm_times = np.zeros((replays, ticks)), np.zeros((replays, ticks))
+        for replay in range(replays):
+            random.seed(difficulty)
+            np.random.seed(difficulty)
+            map_grid_size = (int(2 * difficulty + 5), int(4 * difficulty + 11))
+            game_map = Map(RenderQueue(), UpdateQueue(), map_grid_size=map_grid_size, difficulty=difficulty)
+            swarm = game_map.enemy_swarm
+            enemies = swarm.enemies
+            walking_directions = [(random.randint(-1, 1), random.randint(-1, 1)) for _ in enemies]
+
+            for tick in range(ticks):
+                start = timer()
+                walking_directions = [walk_enemy_scalar(enemy, walking_direction, 1 / 45)
+                                      for enemy, walking_direction in zip(enemies, walking_directions)]
+                scalar_end = timer()
+                swarm.update_object(1 / 45)
+                swarm_end = timer()
+                scalar_times[replay, tick] = scalar_end - start
+                swarm_times[replay, tick] = swarm_end - scalar_end
+        scalar_times, swarm_times = scalar_times.min(axis=0), swarm_times.min(axis=0)
+        print(f"{difficulty:>10}{len(enemies):>9}{len(swarm.navigation.waypoints):>11}{swarm.navigation.build_time * 1000:>10.1f}ms"
+              f"{np.mean(scalar_times) * 1000:>10.2f}ms{np.mean(swarm_times) * 1000:>8.2f}ms"
+              f"{np.mean(scalar_times) / np.mean(swarm_times):>8.1f}x{max(scalar_times) * 1000:>10.2f}ms{max(swarm_times) * 1000:>8.2f}ms")
+
+
+def benchmark_collision(difficulties=(5, 20, 40), movers=1000, ticks=50):
+    # Compares moving many persons one by one with the leading point test of check_collision_scalar (the old way) with one batch slide
+    # of CollisionGrid, with persons at sprint speed in random directions. 'clipping' is the share of the moves of the point test that
+    # end with the circle of the person in a wall, which the swept circles of the collision grid never do.
+    from collision import CollisionGrid
+    from map_generation import Map
+    from persons import Person, get_grid_index
+
+    gl.use_backend(gl.RecordingBackend(keep_commands=False))
+    radius = Person.collision_radius
+    print(f'Moving {movers} persons per tick, mean of {ticks} ticks')
+    print(f"{'difficulty':>10}{'map':>9}{'build':>10}{'point test':>13}{'batch slide':>13}{'speedup':>9}{'clipping':>10}")
+    for difficulty in difficulties:
+        random.seed(difficulty)
+        np.random.seed(difficulty)
+        map_grid_size = (int(2 * difficulty + 5), int(4 * difficulty + 11))
+        game_map = Map(RenderQueue(), UpdateQueue(), map_grid_size=map_grid_size, difficulty=difficulty)
+        map_grid = game_map.map_grid
+        start = timer()
+        collision_grid = CollisionGrid(map_grid)
+        build_time = timer() - start
+
+        open_cells = np.argwhere(map_grid)
+        locations = 2 * open_cells[np.random.randint(len(open_cells), size=movers), ::-1].astype(np.float64)
+        point_test_time, slide_time, clipping = 0, 0, 0
+        for tick in range(ticks):
+            angles = np.random.uniform(0, 2 * np.pi, movers)
+            moves = np.stack((np.cos(angles), np.sin(angles)), axis=1) * move_distance_player(1 / 45, sprint=True)
+            point_locations = locations.tolist()
+            start = timer()
+            for location, (move_x, move_z) in zip(point_locations, moves.tolist()):
+                length = (move_x ** 2 + move_z ** 2) ** 0.5
+                grid_index = get_grid_index((location[0] + move_x * (1 + radius / length), location[1] + move_z * (1 + radius / length)))
+                if 0 <= grid_index[0] < map_grid.shape[0] and 0 <= grid_index[1] < map_grid.shape[1] and map_grid[grid_index]:
+                    location[0] += move_x
+                    location[1] += move_z
+            point_test_end = timer()
+            locations = collision_grid.slide(locations, moves, radius)
+            slide_end = timer()
+            point_test_time += point_test_end - start
+            slide_time += slide_end - point_test_end
+            point_locations = np.array(point_locations)
+            clipping += (~collision_grid.is_path_free(point_locations, point_locations, radius)).mean()
+        print(f"{difficulty:>10}{'x'.join(map(str, map_grid_size)):>9}{build_time * 1000:>8.1f}ms{point_test_time / ticks * 1000:>11.2f}ms"
+              f"{slide_time / ticks * 1000:>11.2f}ms{point_test_time / slide_time:>8.1f}x{clipping / ticks:>10.1%}")
+
+
+def benchmark_line_of_sight(difficulties=(1, 5, 10, 20, 40, 80)):
+    # Build time and memory of the line of sight table of the guards, for seeded maps up to far beyond the difficulties usually reached
+    from map_generation import Map
+
+    gl.use_backend(gl.RecordingBackend(keep_commands=False))
+    print('Line of sight table per map')
+    print(f"{'difficulty':>10}{'map':>9}{'open cells':>12}{'offsets':>9}{'build':>11}{'memory':>12}{'per cell':>10}")
+    for difficulty in difficulties:
+        random.seed(difficulty)
+        np.random.seed(difficulty)
+        map_grid_size = (int(2 * difficulty + 5), int(4 * difficulty + 11))
+        game_map = Map(RenderQueue(), UpdateQueue(), map_grid_size=map_grid_size, difficulty=difficulty)
+        line_of_sight = game_map.guard_vision.line_of_sight
+        print(f"{difficulty:>10}{'x'.join(map(str, map_grid_size)):>9}{line_of_sight.cell_count:>12}{len(line_of_sight.offsets):>9}"
+              f"{line_of_sight.build_time * 1000:>9.1f}ms{line_of_sight.bits.nbytes / 1024:>8.1f} KiB"
+              f"{line_of_sight.bits.nbytes / line_of_sight.bits[..., 0].size:>8.0f} B")
+
+
+def dig_map_grid_scalar(map_grid, starting_point):
+    # Reference: the digging of the map as it was, one random draw and one cell at a time, with the neighbour cleanup in place
+    for y_i in range(map_grid.shape[1]):
+        map_grid[starting_point[0], y_i] = True
+    for _ in range(int(map_grid.shape[0] * map_grid.shape[1] * 0.6)):
+        map_grid[random.randint(0, map_grid.shape[0] - 1), random.randint(1, map_grid.shape[1] - 2)] = True
+    for _ in range(int(map_grid.shape[0] * map_grid.shape[1] * 0.05)):
+        rand_line = random.randint(0, map_grid.shape[0] - 1), random.randint(3, map_grid.shape[1] - 4), random.randint(2, int(map_grid.shape[1] / 4))
+        for y_i in range(0, rand_line[2]):
+            if rand_line[1] + y_i < map_grid.shape[1]:
+                map_grid[rand_line[0]][rand_line[1] + y_i] = True
+    for x_i in range(map_grid.shape[0]):
+        for y_i in range(map_grid.shape[1]):
+            above = y_i + 1 < map_grid.shape[1] and map_grid[x_i][y_i + 1]
+            bellow = map_grid[x_i][y_i - 1]
+            left = x_i + 1 < map_grid.shape[0] and map_grid[x_i + 1][y_i]
+            right = x_i + 1 < map_grid.shape[0] and map_grid[x_i + 1][y_i]
+            if not above and not bellow and not left and not right and map_grid[x_i][y_i]:
+                map_grid[x_i][y_i] = False
+            if above and bellow and left and right and not map_grid[x_i][y_i]:
+                map_grid[x_i][y_i] = True
+
+
+def benchmark_map_generation(difficulties=(1, 5, 10, 20, 40, 80, 160, 320), scalar_difficulty_limit=160, seeds=5):
+    # Time to dig the map grid, per cell and draw at a time against all at once, and the share of open cells of both to compare them
+    from map_generation import dig_map_grid
+
+    # The first draws of a random generator set up NumPy, which is not part of the generation
+    dig_map_grid(np.zeros((7, 15), bool), (3, 0), np.random.default_rng(0))
+    print('Map generation (digging algorithm)')
+    print(f"{'difficulty':>10}{'map':>10}{'scalar':>11}{'vectorized':>12}{'speedup':>9}{'open scalar':>13}{'open vectorized':>17}")
+    for difficulty in difficulties:
+        map_grid_size = (int(2 * difficulty + 5), int(4 * difficulty + 11))
+        starting_point = (int(map_grid_size[0] / 2), 0)
+        scalar_time = vectorized_time = 0
+        scalar_open = vectorized_open = 0
+        for seed in range(seeds):
+            if difficulty <= scalar_difficulty_limit:
+                random.seed(seed)
+                map_grid = np.zeros(map_grid_size, bool)
+                start = timer()
+                dig_map_grid_scalar(map_grid, starting_point)
+                scalar_time += timer() - start
+                scalar_open += map_grid.mean()
+            map_grid = np.zeros(map_grid_size, bool)
+            start = timer()
+            dig_map_grid(map_grid, starting_point, np.random.default_rng(seed))
+            vectorized_time += timer() - start
+            vectorized_open += map_grid.mean()
+        if difficulty <= scalar_difficulty_limit:
+            scalar_columns = f"{scalar_time / seeds * 1000:>9.1f}ms{vectorized_time / seeds * 1000:>10.2f}ms{scalar_time / vectorized_time:>8.0f}x" \
+                             f"{scalar_open / seeds:>13.1%}"
+        else:
+            scalar_columns = f"{'-':>11}{vectorized_time / seeds * 1000:>10.2f}ms{'-':>9}{'-':>13}"
+        print(f"{difficulty:>10}{'x'.join(map(str, map_grid_size)):>10}{scalar_columns}{vectorized_open / seeds:>17.1%}")
+
+
+benchmarks = {'texture_upload': benchmark_texture_upload, 'render': benchmark_render, 'person_animation': benchmark_person_animation,
+              'vision': benchmark_vision, 'line_of_sight': benchmark_line_of_sight, 'enemy_swarm': benchmark_enemy_swarm,
+              'collision': benchmark_collision, 'map_generation': benchmark_map_generation}
+
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or benchmarks:
+        benchmarks[name]()
+        print()
@@ -0,0 +1,148 @@
+"""
+Collision of the persons with the walls of a map. Persons are circles, walls are the 2 by 2 unit cells of map_grid that are not open,
+and everything outside of the map is wall as well.
+"""
+
+import numpy as np
+
+
+# Offsets of the cells of a block of 2 by 2 cells, and of the corners of a cell from its center
+block_offsets = np.array(((0, 0), (0, 1), (1, 0), (1, 1)))
+corner_offsets = np.array(((-1, -1), (-1, 1), (1, -1), (1, 1)), np.float64)
+
+
+def distance_to_cells(points, cell_centers):
+    # Distance of points to the squares of cells (zero inside), arrays of (x, z) with matching shapes
+    outside = np.maximum(np.abs(points - cell_centers) - 1, 0)
+    return np.hypot(outside[..., 0], outside[..., 1])
+
+
+def distance_to_segments(points, starts, ends):
+    # Distance of points to line segments, arrays of (x, z) with matching shapes
+    segment_x, segment_z = ends[..., 0] - starts[..., 0], ends[..., 1] - starts[..., 1]
+    relative_x, relative_z = points[..., 0] - starts[..., 0], points[..., 1] - starts[..., 1]
+    # Fraction along the segment of the point closest by, segments of length zero are points
+    along = (relative_x * segment_x + relative_z * segment_z) / np.maximum(segment_x * segment_x + segment_z * segment_z, 1e-12)
+    np.clip(along, 0, 1, out=along)
+    return np.hypot(relative_x - segment_x * along, relative_z - segment_z * along)
+
+
+class CollisionGrid:
+    """
+    Collision queries against the walls of a map, built once per map. map_grid is padded with two cells of wall, so cells around any
+    location in or next to the map can be looked up without bounds checks. A distance field holds the distance to the nearest wall,
+    capped at max_distance, sampled samples_per_cell times per cell along each axis.
+
+    A move of a circle is a swept circle (a capsule). It is free without further checks when the distance field at its start leaves
+    room for the radius and the length of the move. Near walls, the capsule is tested exactly against the wall cells it can overlap,
+    which are at most 2 by 2 cells for moves and radii that add up to at most one unit.
+    """
+
+    padding = 2
+
+    def __init__(self, map_grid, samples_per_cell=8, max_distance=2):
+        self.occupied = ~np.pad(map_grid, self.padding)
+        self.samples_per_cell = samples_per_cell
+        self.max_distance = max_distance
+        self.last_cell = np.array(self.occupied.shape) - 1
+
+        # Offsets (x, z) of the samples from the center of their cell. The distance of a sample to a cell nearby only depends on these
+        # offsets and the offset between both cells, so it is computed once per offset and applied to the cells that are walls
+        sample_spacing = 2 / samples_per_cell
+        sample_offsets = (np.arange(samples_per_cell) + 0.5) * sample_spacing - 1
+        rows, columns = self.occupied.shape
+        distance_field = np.full((rows, samples_per_cell, columns, samples_per_cell), max_distance, np.float32)
+        # Walls further than max_distance away do not count, so only the cells up to reach away are checked
+        reach = int(np.ceil(max_distance / 2))
+        reach_occupied = np.pad(self.occupied, reach, constant_values=True)
+        for row_offset in range(-reach, reach + 1):
+            for column_offset in range(-reach, reach + 1):
+                outside_x = np.maximum(np.abs(sample_offsets - 2 * column_offset) - 1, 0)
+                outside_z = np.maximum(np.abs(sample_offsets - 2 * row_offset) - 1, 0)
+                distances = np.minimum(np.hypot(outside_z[:, np.newaxis], outside_x[np.newaxis, :]), max_distance)
+                if distances.min() >= max_distance:
+                    continue
+                wall = reach_occupied[reach + row_offset:reach + row_offset + rows, reach + column_offset:reach + column_offset + columns]
+                np.minimum(distance_field, np.where(wall[:, np.newaxis, :, np.newaxis], distances[np.newaxis, :, np.newaxis, :], max_distance),
+                           out=distance_field)
+        self.distance_field = distance_field.reshape(rows * samples_per_cell, columns * samples_per_cell)
+        self.last_sample = np.array(self.distance_field.shape) - 1
+        # A location is at most this far from the center of its sample, so the field is off by at most this much
+        self.field_error = sample_spacing * np.sqrt(2) / 2
+
+    def get_sample(self, locations):
+        # Indices (row, column) of the samples of (x, z) locations, clipped to the field
+        samples = np.floor((np.asarray(locations, np.float64)[..., ::-1] + 1 + 2 * self.padding) * (self.samples_per_cell / 2)).astype(np.intp)
+        # np.minimum and np.maximum instead of np.clip, which costs more than the clipping itself for the few locations of a tick
+        return np.minimum(np.maximum(samples, 0, out=samples), self.last_sample, out=samples)
+
+    def get_clearance(self, locations):
+        # Distance of (x, z) locations to the nearest wall as sampled by the distance field, at most max_distance
+        samples = self.get_sample(locations)
+        return self.distance_field[samples[..., 0], samples[..., 1]]
+
+    def is_path_free(self, starts, ends, radius):
+        """
+        :param starts: Array of (x, z) start locations of circles, of shape (..., 2)
+        :param ends: Array of (x, z) end locations, of the same shape
+        :param radius: Radius of the circles
+        :return: Boolean array of shape (...), True where the circle can move from start to end without touching a wall
+        """
+        starts, ends = np.asarray(starts, np.float64), np.asarray(ends, np.float64)
+        if starts.shape != ends.shape:
+            starts, ends = np.broadcast_arrays(starts, ends)
+        moves = ends - starts
+        free = self.get_clearance(starts) - self.field_error >= radius + np.hypot(moves[..., 0], moves[..., 1])
+        if np.count_nonzero(free) == free.size:
+            return free
+        near_wall = ~free
+
+        # Exact test of the capsules near walls against the wall cells they can overlap, starting at the cell of their lowest corner
+        starts, ends = starts[near_wall][:, np.newaxis], ends[near_wall][:, np.newaxis]
+        lowest_cells = np.floor((np.minimum(starts, ends)[..., ::-1] - radius + 1) / 2).astype(np.intp) + self.padding
+        cells = np.clip(lowest_cells + block_offsets, 0, self.last_cell)
+        wall = self.occupied[cells[..., 0], cells[..., 1]]
+        centers = 2 * (cells[..., ::-1] - self.padding).astype(np.float64)
+        # Two convex shapes that do not overlap are closest at a corner of one of them
+        distances = np.minimum(distance_to_cells(starts, centers), distance_to_cells(ends, centers))
+        corners = centers[..., np.newaxis, :] + corner_offsets
+        corner_distances = distance_to_segments(corners, starts[..., np.newaxis, :], ends[..., np.newaxis, :]).min(axis=-1)
+        touching = wall & (np.minimum(distances, corner_distances) < radius)
+        free[near_wall] = ~touching.any(axis=-1)
+        return free
+
+    def slide(self, locations, moves, radius):
+        """
+        Moves circles as far as they can go. A move that is blocked slides along the wall: only its x part is made when that is free,
+        otherwise only its z part, otherwise the circle stays.
+        :param locations: (n, 2) array of (x, z) locations
+        :param moves: (n, 2) array of (x, z) moves
+        :param radius: Radius of the circles
+        :return: (n, 2) array of the new locations
+        """
+        locations = np.asarray(locations, np.float64)
+        moves = np.asarray(moves, np.float64)
+        new_locations = locations + moves
+        free = self.is_path_free(locations, new_locations, radius)
+        if np.count_nonzero(free) == len(free):
+            return new_locations
+        # Rows that are still blocked
+        rows = np.flatnonzero(~free)
+        for part in ((1, 0), (0, 1)):
+            ends = locations[rows] + moves[rows] * part
+            free = self.is_path_free(locations[rows], ends, radius)
+            new_locations[rows[free]] = ends[free]
+            rows = rows[~free]
+            if not len(rows):
+                break
+        new_locations[rows] = locations[rows]
+        return new_locations
+
+    def move(self, location, move, radius):
+        # Slide of one circle, given as (x, z) sequences. Returns the new (x, z) location, away from walls without any array work
+        end = (location[0] + move[0], location[1] + move[1])
+        sample_row = min(max(int((location[1] + 1 + 2 * self.padding) * self.samples_per_cell / 2), 0), self.distance_field.shape[0] - 1)
+        sample_column = min(max(int((location[0] + 1 + 2 * self.padding) * self.samples_per_cell / 2), 0), self.distance_field.shape[1] - 1)
+        if self.distance_field.item(sample_row, sample_column) - self.field_error >= radius + (move[0] ** 2 + move[1] ** 2) ** 0.5:
+            return end
+        return tuple(self.slide((location,), (move,), radius)[0].tolist())
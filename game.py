@@ -1,7 +1,8 @@
 from map_generation import Map
 from persons import Player
-from OpenGL.GL import *
-from game_objects import UIElement
+import graphics as gl
+from game_objects import UIElement, TextElement, delete_unused_display_lists
+from game_util import texture_manager, TextureAtlas
 import pygame as pg
 from random import randint
 
@@ -16,6 +17,9 @@ class Game:
         self.window_size = window_size
 
         self.round_running = False
+        # Set when a round has started, after the blocking screens and the map generation. The game loop then resets its simulation
+        # clock, so the time spent there is not simulated
+        self.round_started = False
 
         self.round = 0
         self.round_difficulty = 1
@@ -25,10 +29,19 @@ class Game:
 
         self.ui_elements = []
 
+        # Set to a profiler.RoundMemoryReport to report the memory freed at the end of every round
+        self.memory_report = None
+
         self.theme_sound = theme_sound
         self.succes_sound = succes_sound
         self.failed_sounds = failed_sounds
 
+        # Pack all UI images and the font into one texture, so the whole overlay is drawn with a single texture bind
+        if 'ui_atlas' not in texture_manager.atlases:
+            texture_manager.add_atlas(TextureAtlas('ui_atlas', ['./assets/UI/caught_red.png', './assets/UI/caught_white.png',
+                                                                './assets/UI/next_level_white.png', './assets/UI/next_level_green.png',
+                                                                './assets/UI/key.png', './assets/UI/consolas_font.png']))
+
         self.caught_screen_red = UIElement('./assets/UI/caught_red.png')
         self.caught_screen_red.set_offset((0, 0.8))
         self.caught_screen_white = UIElement('./assets/UI/caught_white.png')
@@ -48,10 +61,18 @@ class Game:
         self.ui_elements.append(self.key_ui)
 
         for ui_element in self.ui_elements:
-            self.render_queue.subscribe(ui_element)
+            self.render_queue.subscribe(ui_element, dynamic=True)
+
+        # In debug mode the GL work per frame is shown in the corner of the screen
+        self.statistics_text = None
+        if self.debug_mode:
+            self.statistics_text = TextElement('', activated=True)
+            self.statistics_text.set_scale((0.06, 0.06, 0.06))
+            self.statistics_text.set_offset((-1.75, -0.9))
+            self.render_queue.subscribe(self.statistics_text, dynamic=True)
 
     def start_round(self):
-        glPushMatrix()
+        gl.glPushMatrix()
 
         # generate map and player instances
         self.theme_sound.play(-1)
@@ -64,22 +85,25 @@ class Game:
         self.round += 1
 
         # Place camera in begin position
-        glRotatef(85, 1, 0, 0)
-        glTranslatef(0, -12, -(2 * self.map.starting_point[0] + 1))
+        gl.glRotatef(85, 1, 0, 0)
+        gl.glTranslatef(0, -12, -(2 * self.map.starting_point[0] + 1))
 
         # Alternate camera position
-        # glRotatef(65, 1, 0, 0)
-        # glTranslatef(0, -6, -(2*self.map.starting_point[0]+4))
+        # gl.glRotatef(65, 1, 0, 0)
+        # gl.glTranslatef(0, -6, -(2*self.map.starting_point[0]+4))
 
         self.round_running = True
+        self.round_started = True
 
     def end_round(self):
         # reset position, delete instances and flush queues
+        if self.memory_report is not None:
+            self.memory_report.before_end_round()
         self.theme_sound.stop()
         self.round_running = False
-        glTranslatef(0, 12, (2 * self.map.starting_point[0] + 1))
-        glRotatef(-85, 1, 0, 0)
-        glPopMatrix()
+        gl.glTranslatef(0, 12, (2 * self.map.starting_point[0] + 1))
+        gl.glRotatef(-85, 1, 0, 0)
+        gl.glPopMatrix()
         del self.map
         del self.player
         self.render_queue.flush()
@@ -88,7 +112,16 @@ class Game:
         self.object_update_queue.subscribe(self)
         for ui_element in self.ui_elements:
             ui_element.activated = False
-            self.render_queue.subscribe(ui_element)
+            self.render_queue.subscribe(ui_element, dynamic=True)
+        if self.statistics_text is not None:
+            self.render_queue.subscribe(self.statistics_text, dynamic=True)
+        # Textures and display lists of the previous round that are no longer used can be deleted now
+        texture_manager.evict()
+        delete_unused_display_lists()
+        if self.debug_mode:
+            print('Textures:', texture_manager.get_stats())
+        if self.memory_report is not None:
+            self.memory_report.after_end_round(self.round)
 
     def restart_screen(self):
         self.theme_sound.stop()
@@ -100,9 +133,9 @@ class Game:
         while waiting:
             self.caught_screen_white.flip()
             self.caught_screen_red.flip()
-            glClearColor(0.3, 0.3, 0.3, 0)
-            glClearDepthf(1.0)
-            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            gl.glClearColor(0.3, 0.3, 0.3, 0)
+            gl.glClearDepthf(1.0)
+            gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
             self.render_queue.run_queue_culled()
             pg.display.flip()
             pg.time.wait(500)
@@ -110,7 +143,7 @@ class Game:
                 if event.type == pg.KEYDOWN:
                     waiting = False
                 if event.type == pg.QUIT:
-                    glPopMatrix()
+                    gl.glPopMatrix()
                     pg.quit()
                     raise SystemExit
         self.failed_sounds[song_select].stop()
@@ -125,9 +158,9 @@ class Game:
         while waiting:
             self.next_level_white.flip()
             self.next_level_green.flip()
-            glClearColor(0.3, 0.3, 0.3, 0)
-            glClearDepthf(1.0)
-            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+            gl.glClearColor(0.3, 0.3, 0.3, 0)
+            gl.glClearDepthf(1.0)
+            gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
             self.render_queue.run_queue_culled()
             pg.display.flip()
             pg.time.wait(500)
@@ -135,15 +168,14 @@ class Game:
                 if event.type == pg.KEYDOWN:
                     waiting = False
                 if event.type == pg.QUIT:
-                    glPopMatrix()
+                    gl.glPopMatrix()
                     pg.quit()
                     raise SystemExit
         self.succes_sound.stop()
 
     def update_object(self):
-        for ui_element in self.ui_elements:
-            ui_element.set_location((self.player.location[0] + ui_element.offset[0], 10, self.player.location[1] + ui_element.offset[1]))
         if self.round_running:
+            self.map.update_chunks()
             if self.player.seen:
                 self.restart_screen()
                 self.end_round()
@@ -159,3 +191,15 @@ class Game:
                 self.next_level_screen()
                 self.end_round()
                 self.start_round()
+
+    def interpolate(self, alpha):
+        # The UI follows the camera, which moves with the interpolated player
+        for ui_element in self.ui_elements + ([self.statistics_text] if self.statistics_text is not None else []):
+            ui_element.set_location((self.player.render_location[0] + ui_element.offset[0], 10,
+                                     self.player.render_location[1] + ui_element.offset[1]))
+
+    def show_statistics(self, statistics):
+        # Shows a dict of statistics (like the GL calls per frame) in debug mode, one per line. The font has no punctuation, the
+        # names are written with spaces and a slash starts a new line.
+        if self.statistics_text is not None:
+            self.statistics_text.set_text('/'.join(f"{name.replace('_', ' ')} {int(value)}" for name, value in statistics.items()))
@@ -46,3 +46,86 @@ def normalize_vector(vector):
 
 def angle_between_2_vectors(vector_1, vector_2):
     return np.arccos((np.dot(vector_1, vector_2)) / (np.linalg.norm(vector_1) * np.linalg.norm(vector_2)))
+
+
+def transform_matrix(location, rotation, size):
+    """
+    Returns the 4x4 matrix of a translation, rotations around x, y and z and a scale, the same as glTranslatef, glRotatef around x, y
+    and z and glScalef applied in that order
+    :param location: Translation in x, y, z
+    :param rotation: Rotation around x, y and z in degrees
+    :param size: Scale in x, y, z
+    """
+    sin_x, sin_y, sin_z = np.sin(np.deg2rad(rotation))
+    cos_x, cos_y, cos_z = np.cos(np.deg2rad(rotation))
+    # Rx * Ry * Rz, written out
+    matrix = np.array([[cos_y * cos_z, -cos_y * sin_z, sin_y, location[0]],
+                       [cos_x * sin_z + sin_x * sin_y * cos_z, cos_x * cos_z - sin_x * sin_y * sin_z, -sin_x * cos_y, location[1]],
+                       [sin_x * sin_z - cos_x * sin_y * cos_z, sin_x * cos_z + cos_x * sin_y * sin_z, cos_x * cos_y, location[2]],
+                       [0, 0, 0, 1]])
+    matrix[:3, :3] *= size
+    return matrix
+
+
+class Transform:
+    """
+    Location, rotation (in degrees) and scale of an object, with its local matrix and its world matrix (the local matrix of every
+    parent applied as well) cached. The matrices are only recomputed after the object or one of its parents has changed.
+    """
+
+    __slots__ = ('location', 'rotation', 'size', 'parent', 'local_matrix', 'world_matrix', 'gl_matrix', 'world_version',
+                 'parent_world_version')
+
+    def __init__(self):
+        self.location = [0, 0, 0]
+        self.rotation = [0, 0, 0]
+        self.size = [1, 1, 1]
+        self.parent = None
+
+        self.local_matrix = None
+        self.world_matrix = None
+        self.gl_matrix = None
+        # Increases every time the world matrix changes, so children know when theirs is outdated
+        self.world_version = 0
+        self.parent_world_version = None
+
+    def set(self, name, applied):
+        # Sets 'location', 'rotation' or 'size' in place
+        values = getattr(self, name)
+        values[0], values[1], values[2] = applied[0], applied[1], applied[2]
+        self.local_matrix = None
+
+    def add(self, name, applied):
+        values = getattr(self, name)
+        values[0] += applied[0]
+        values[1] += applied[1]
+        values[2] += applied[2]
+        self.local_matrix = None
+
+    def get_local_matrix(self):
+        if self.local_matrix is None:
+            self.local_matrix = transform_matrix(self.location, self.rotation, self.size)
+            self.world_matrix = None
+        return self.local_matrix
+
+    def get_world_matrix(self):
+        local_matrix = self.get_local_matrix()
+        if self.parent is None:
+            if self.world_matrix is None:
+                self.world_matrix = local_matrix
+                self.world_version += 1
+        else:
+            parent_world_matrix = self.parent.get_world_matrix()
+            if self.world_matrix is None or self.parent_world_version != self.parent.world_version:
+                self.world_matrix = np.dot(parent_world_matrix, local_matrix)
+                self.parent_world_version = self.parent.world_version
+                self.world_version += 1
+        return self.world_matrix
+
+    def get_gl_matrix(self):
+        # The world matrix in the column-major float layout glMultMatrixf and glLoadMatrixf take
+        world_version = self.world_version
+        world_matrix = self.get_world_matrix()
+        if self.gl_matrix is None or world_version != self.world_version:
+            self.gl_matrix = np.ascontiguousarray(world_matrix.T, dtype=np.float32)
+        return self.gl_matrix
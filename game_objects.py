@@ -1,6 +1,178 @@
-from OpenGL.GL import *
-from game_util import read_texture
+import numpy as np
+import graphics as gl
+from game_util import read_texture, release_texture, texture_manager, opaque_pass, translucent_pass, overlay_pass
 from PIL import Image
+from game_linear_algebra import rotation_matrix, Transform
+
+
+# Display lists of the unit geometry of every object type, compiled once per GL context on first use
+display_lists = {}
+
+
+# Display lists of deleted objects, deleted on the next call of delete_unused_display_lists when the GL context is current
+unused_display_lists = []
+
+
+def clear_display_lists():
+    # Call when a new GL context is created, as display lists do not survive their context
+    display_lists.clear()
+    unused_display_lists.clear()
+
+
+def delete_unused_display_lists():
+    for display_list in unused_display_lists:
+        gl.glDeleteLists(display_list, 1)
+    unused_display_lists.clear()
+
+
+def transform_property(name):
+    # Location, rotation or size of an object, kept in its Transform. Setting it marks the cached matrices as outdated.
+    def get_value(self):
+        return getattr(self.object_transform, name)
+
+    def set_value(self, applied):
+        self.object_transform.set(name, applied)
+    return property(get_value, set_value)
+
+
+# GL primitive type of every object type, part of the sort key of the render queue. Looked up by name on the graphics backend.
+primitive_types = {'wire_cube': 'GL_LINES', 'solid_cube': 'GL_QUADS', 'wire_plane': 'GL_LINES', 'solid_plane': 'GL_QUADS', 'triangle': 'GL_TRIANGLES'}
+
+
+class ObjectStore:
+    """
+    Columnar store of the location, rotation, size, speeds, color and type of all SimpleObjects, in contiguous NumPy arrays with one
+    row per object. A SimpleObject is a handle holding its row index. Freed rows are reused, the arrays double in size when full.
+    Rows returned by the properties of a SimpleObject are views into the arrays, which are replaced when the store grows, so they
+    should not be kept.
+    """
+
+    object_types = ('wire_cube', 'solid_cube', 'wire_plane', 'solid_plane', 'triangle')
+
+    def __init__(self, capacity=256):
+        self.capacity = 0
+        self.count = 0
+        self.free_rows = []
+
+        self.location = np.zeros((0, 3))
+        self.rotation = np.zeros((0, 3))
+        self.size = np.zeros((0, 3))
+        self.location_speed = np.zeros((0, 3))
+        self.rotation_speed = np.zeros((0, 3))
+        self.size_speed = np.zeros((0, 3))
+        self.color = np.zeros((0, 4))
+        self.object_type = np.zeros(0, np.int8)
+        # Set for rows changed in the store instead of through their handle, which recomputes the cached matrices on the next draw
+        self.matrix_dirty = np.zeros(0, bool)
+        # Set for rows with a speed that is not zero, which apply_speeds moves every tick
+        self.moving = np.zeros(0, bool)
+
+        self.grow(capacity)
+
+    def grow(self, capacity):
+        for name in ('location', 'rotation', 'size', 'location_speed', 'rotation_speed', 'size_speed', 'color', 'object_type', 'matrix_dirty',
+                     'moving'):
+            old_array = getattr(self, name)
+            new_array = np.zeros((capacity,) + old_array.shape[1:], old_array.dtype)
+            new_array[:self.capacity] = old_array
+            setattr(self, name, new_array)
+        self.capacity = capacity
+
+    def allocate(self, object_type):
+        if self.free_rows:
+            row = self.free_rows.pop()
+        else:
+            if self.count == self.capacity:
+                self.grow(self.capacity * 2)
+            row = self.count
+            self.count += 1
+        self.location[row] = 0
+        self.rotation[row] = 0
+        self.size[row] = 1
+        self.location_speed[row] = 0
+        self.rotation_speed[row] = 0
+        self.size_speed[row] = 0
+        self.color[row] = 1
+        self.object_type[row] = self.object_types.index(object_type)
+        self.matrix_dirty[row] = False
+        self.moving[row] = False
+        return row
+
+    def free(self, row):
+        self.moving[row] = False
+        self.free_rows.append(row)
+
+    def update_moving(self, row):
+        # Call after changing the speeds of a row
+        self.moving[row] = self.location_speed[row].any() or self.rotation_speed[row].any() or self.size_speed[row].any()
+
+    def apply_speeds(self):
+        # Moves, rotates and scales all objects with a speed by it, in one step over the moving rows
+        rows = np.flatnonzero(self.moving[:self.count])
+        if len(rows):
+            self.location[rows] += self.location_speed[rows]
+            self.rotation[rows] += self.rotation_speed[rows]
+            self.size[rows] += self.size_speed[rows]
+            self.matrix_dirty[rows] = True
+
+    def get_rows_in_box(self, rows, center, extent):
+        """
+        Returns the rows of which the location lies within a box around a center on the ground plane.
+        :param rows: Array of the rows to check
+        :param center: Center (x, z) of the box
+        :param extent: Half the width (x, z) of the box, per row or for all rows
+        """
+        locations = self.location[rows]
+        inside = (np.abs(locations[:, 0] - center[0]) < extent[0]) & (np.abs(locations[:, 2] - center[1]) < extent[1])
+        return rows[inside]
+
+    def update_object(self, tick_duration):
+        # Subscribed to the update queue as a system by the map, the speeds are per tick
+        self.apply_speeds()
+
+
+object_store = ObjectStore()
+
+
+class StoreTransform(Transform):
+    # Transform of which the location, rotation and size are a row of the object store
+
+    __slots__ = ('row',)
+
+    def __init__(self, row):
+        self.row = row
+        super().__init__()
+
+    location = property(lambda self: object_store.location[self.row], lambda self, applied: self.set('location', applied))
+    rotation = property(lambda self: object_store.rotation[self.row], lambda self, applied: self.set('rotation', applied))
+    size = property(lambda self: object_store.size[self.row], lambda self, applied: self.set('size', applied))
+
+    def get_local_matrix(self):
+        if object_store.matrix_dirty[self.row]:
+            object_store.matrix_dirty[self.row] = False
+            self.local_matrix = None
+        return super().get_local_matrix()
+
+
+def store_property(name):
+    # Row of a column of the object store, set in place
+    def get_value(self):
+        return getattr(object_store, name)[self.row]
+
+    def set_value(self, applied):
+        getattr(object_store, name)[self.row] = applied
+    return property(get_value, set_value)
+
+
+def speed_property(name):
+    # Speed column of the object store, setting it also updates whether the row is moving
+    def get_value(self):
+        return getattr(object_store, name)[self.row]
+
+    def set_value(self, applied):
+        getattr(object_store, name)[self.row] = applied
+        object_store.update_moving(self.row)
+    return property(get_value, set_value)
 
 
 class SimpleObject:
@@ -12,45 +184,55 @@ class SimpleObject:
         - wire_plane
         - solid_plane
         - triangle
+    The location, rotation, size, speeds and color are kept in the object store, the object itself is a small handle.
     """
 
+    __slots__ = ('row', 'object_type', 'object_transform', 'texture_id', 'texture_filename', 'texture_enabled', 'visible_faces')
+
+    supported_object_types = ObjectStore.object_types
+    # The render queue culls the objects of a store that have no parent together, with one box query over their rows
+    store = object_store
+
+    # Unit geometry of all object types, compiled into display lists shared by all objects
+    cube_vertices = ((1, 1, 1), (1, 1, -1), (1, -1, -1), (1, -1, 1), (-1, 1, 1), (-1, -1, -1), (-1, -1, 1), (-1, 1, -1))
+    cube_edges = ((0, 1), (0, 3), (0, 4), (1, 2), (1, 7), (2, 5), (2, 3), (3, 6), (4, 6), (4, 7), (5, 6), (5, 7))
+    cube_quads = ((0, 3, 6, 4), (2, 5, 6, 3), (1, 2, 5, 7), (1, 0, 4, 7), (7, 4, 6, 5), (2, 3, 0, 1))
+    cube_texture_coordinates = ((0, 0), (1, 0), (0, 0), (1, 0), (0, 1), (0, 1), (1, 1), (1, 1))
+    # Direction every cube quad faces to
+    cube_quad_directions = ('z+', 'y-', 'z-', 'y+', 'x-', 'x+')
+
+    plane_vertices = ((1, 0, -1), (1, 0, 1), (-1, 0, 1), (-1, 0, -1))
+    plane_edges = ((0, 1), (0, 3), (1, 2), (2, 3))
+    plane_quad = (0, 1, 2, 3)
+    plane_texture_coordinates = ((1, 0), (1, 1), (0, 1), (0, 0))
+
+    triangle_vertices = ((0, 0, 0), (-1, 0, 1), (-1, 0, -1))
+    triangle_edges = ((0, 1), (1, 2), (2, 0))
+    triangle_tri = (0, 1, 2)
+
     def __init__(self, object_type='solid_cube'):
         """
-        This function initialises the object with all vectors as 0 and a white color. It also generates vertex maps.
+        This function initialises the object with all vectors as 0 and a white color.
         :param object_type: Type of object that should be generated ('wire_cube', 'solid_cube', 'wire_plane', 'solid_plane', 'triangle')
         """
-        self.supported_object_types = ('wire_cube', 'solid_cube', 'wire_plane', 'solid_plane', 'triangle')
+        self.row = None
         if object_type in self.supported_object_types:
             self.object_type = object_type
+        self.row = object_store.allocate(object_type)
 
-        self.location = [0, 0, 0]
-        self.rotation = [0, 0, 0]
-        self.size = [1, 1, 1]
-
-        self.location_speed = [0, 0, 0]
-        self.rotation_speed = [0, 0, 0]
-        self.size_speed = [0, 0, 0]
-
-        self.color = [1, 1, 1, 1]
+        self.object_transform = StoreTransform(self.row)
 
         self.texture_id = None
+        self.texture_filename = None
         self.texture_enabled = False
 
-        self.cube_vertices = ((1, 1, 1), (1, 1, -1), (1, -1, -1), (1, -1, 1), (-1, 1, 1), (-1, -1, -1), (-1, -1, 1), (-1, 1, -1))
-        self.cube_normals = (())
-        self.cube_edges = ((0, 1), (0, 3), (0, 4), (1, 2), (1, 7), (2, 5), (2, 3), (3, 6), (4, 6), (4, 7), (5, 6), (5, 7))
-        self.cube_quads = ((0, 3, 6, 4), (2, 5, 6, 3), (1, 2, 5, 7), (1, 0, 4, 7), (7, 4, 6, 5), (2, 3, 0, 1))
-        self.cube_texture_coordinates = ((0, 0), (1, 0), (0, 0), (1, 0), (0, 1), (0, 1), (1, 1), (1, 1))
-
-        self.plane_vertices = ((1, 0, -1), (1, 0, 1), (-1, 0, 1), (-1, 0, -1))
-        self.plane_normals = ((0, 1, 0), (0, 1, 0), (0, 1, 0), (0, 1, 0))
-        self.plane_edges = ((0, 1), (0, 3), (1, 2), (2, 3))
-        self.plane_quad = (0, 1, 2, 3)
-        self.plane_texture_coordinates = ((1, 0), (1, 1), (0, 1), (0, 0))
+        # Faces of the cube that are drawn, None for all of them
+        self.visible_faces = None
 
-        self.triangle_vertices = ((0, 0, 0), (-1, 0, 1), (-1, 0, -1))
-        self.triangle_edges = ((0, 1), (1, 2), (2, 0))
-        self.triangle_tri = (0, 1, 2)
+    location_speed = speed_property('location_speed')
+    rotation_speed = speed_property('rotation_speed')
+    size_speed = speed_property('size_speed')
+    color = store_property('color')
 
     def make_object_opaque(self):
         if self.object_type == 'wire_cube':
@@ -66,145 +248,144 @@ class SimpleObject:
         if self.object_type == 'triangle':
             self.triangle()
 
+    def compile_display_list(self):
+        """
+        Compiles the unit geometry of this object type into a display list, shared by all objects of the same type.
+        The list only contains the vertices (and texture coordinates), the transform and color are set per object.
+        :return: The display list id
+        """
+        display_list = gl.glGenLists(1)
+        gl.glNewList(display_list, gl.GL_COMPILE)
+        if self.object_type == 'solid_cube':
+            gl.glBegin(gl.GL_QUADS)
+            for cube_quad, cube_quad_direction in zip(self.cube_quads, self.cube_quad_directions):
+                if self.visible_faces is not None and cube_quad_direction not in self.visible_faces:
+                    continue
+                for cube_vertex in cube_quad:
+                    gl.glTexCoord2fv(self.cube_texture_coordinates[cube_vertex])
+                    gl.glVertex3fv(self.cube_vertices[cube_vertex])
+            gl.glEnd()
+        if self.object_type == 'wire_cube':
+            gl.glBegin(gl.GL_LINES)
+            for cube_edge in self.cube_edges:
+                for cube_vertex in cube_edge:
+                    gl.glVertex3fv(self.cube_vertices[cube_vertex])
+            gl.glEnd()
+        if self.object_type == 'solid_plane':
+            gl.glBegin(gl.GL_QUADS)
+            for plane_vertex in self.plane_quad:
+                gl.glTexCoord2fv(self.plane_texture_coordinates[plane_vertex])
+                gl.glVertex3fv(self.plane_vertices[plane_vertex])
+            gl.glEnd()
+        if self.object_type == 'wire_plane':
+            gl.glBegin(gl.GL_LINES)
+            for plane_edge in self.plane_edges:
+                for plane_vertex in plane_edge:
+                    gl.glVertex3fv(self.plane_vertices[plane_vertex])
+            gl.glEnd()
+        if self.object_type == 'triangle':
+            gl.glBegin(gl.GL_TRIANGLES)
+            for triangle_vertex in self.triangle_tri:
+                gl.glVertex3fv(self.triangle_vertices[triangle_vertex])
+            gl.glEnd()
+        gl.glEndList()
+        return display_list
+
+    def get_draw_states(self):
+        """
+        Returns the draw work of this object for the render queue, which groups it on these sort keys and sets the state once per group.
+        :return: List of (render pass, texture id (0 for none), primitive type, color)
+        """
+        if self.object_type == 'wire_cube':
+            # Wireframes are drawn in the current color, which is always reset to white
+            return [(opaque_pass, 0, gl.GL_LINES, (1, 1, 1, 1))]
+        red, green, blue, _ = object_store.color[self.row].tolist()
+        if self.object_type == 'triangle':
+            texture_id = self.texture_id if self.texture_enabled else 0
+            return [(translucent_pass, texture_id, gl.GL_TRIANGLES, (red, green, blue, 0.4))]
+        texture_id = self.texture_id if self.texture_enabled and self.object_type in ('solid_cube', 'solid_plane') else 0
+        return [(opaque_pass, texture_id, getattr(gl, primitive_types[self.object_type]), (red, green, blue, 1))]
+
+    def draw(self, draw_state):
+        # The render queue has already set the state of the draw_state
+        self.draw_geometry()
+
+    def draw_primitive(self, color=None, textured=False):
+        if color is not None:
+            gl.glColor4f(color[0], color[1], color[2], color[3])
+        if textured:
+            gl.glEnable(gl.GL_TEXTURE_2D)
+            gl.glBindTexture(gl.GL_TEXTURE_2D, self.texture_id)
+        self.draw_geometry()
+        gl.glColor4f(1, 1, 1, 1)
+        if textured:
+            gl.glDisable(gl.GL_TEXTURE_2D)
+
+    def draw_geometry(self):
+        # Push new matrix over the camera matrix and apply the cached world matrix of the object (including its parents)
+        gl.glPushMatrix()
+        gl.glMultMatrixf(self.object_transform.get_gl_matrix())
+        display_list_key = self.object_type if self.visible_faces is None else (self.object_type, self.visible_faces)
+        try:
+            gl.glCallList(display_lists[display_list_key])
+        except KeyError:
+            display_lists[display_list_key] = self.compile_display_list()
+            gl.glCallList(display_lists[display_list_key])
+        gl.glPopMatrix()
+
     def solid_cube(self):
-        # Push new matrix over main matrix (Translational statements take effect in reverse)
-        glPushMatrix()
-        # Move to object location
-        glTranslatef(self.location[0], self.location[1], self.location[2])
-        glRotatef(self.rotation[0], 1, 0, 0)
-        glRotatef(self.rotation[1], 0, 1, 0)
-        glRotatef(self.rotation[2], 0, 0, 1)
-        glScalef(self.size[0], self.size[1], self.size[2])
-        glColor4f(self.color[0], self.color[1], self.color[2], 1)
-        if self.texture_enabled:
-            glEnable(GL_TEXTURE_2D)
-            glBindTexture(GL_TEXTURE_2D, self.texture_id)
-        glBegin(GL_QUADS)
-        for cube_quad in self.cube_quads:
-            for cube_vertex in cube_quad:
-                if self.texture_enabled:
-                    glTexCoord2fv(self.cube_texture_coordinates[cube_vertex])
-                glVertex3fv(self.cube_vertices[cube_vertex])
-        glEnd()
-        glColor4f(1, 1, 1, 1)
-        if self.texture_enabled:
-            glDisable(GL_TEXTURE_2D)
-        glPopMatrix()
+        self.draw_primitive((self.color[0], self.color[1], self.color[2], 1), self.texture_enabled)
 
     def wire_cube(self):
-        # Same as solid_cube, but different object
-        glPushMatrix()
-        glTranslatef(self.location[0], self.location[1], self.location[2])
-        glRotatef(self.rotation[0], 1, 0, 0)
-        glRotatef(self.rotation[1], 0, 1, 0)
-        glRotatef(self.rotation[2], 0, 0, 1)
-        glScalef(self.size[0], self.size[1], self.size[2])
-        glBegin(GL_LINES)
-        for cube_edge in self.cube_edges:
-            for cube_vertex in cube_edge:
-                glVertex3fv(self.cube_vertices[cube_vertex])
-        glEnd()
-        glColor3f(1, 1, 1)
-        glPopMatrix()
+        # Wireframes are drawn in the current color
+        self.draw_primitive()
 
     def solid_plane(self):
-        # Same as solid_cube, but different object
-        glPushMatrix()
-        glTranslatef(self.location[0], self.location[1], self.location[2])
-        glRotatef(self.rotation[0], 1, 0, 0)
-        glRotatef(self.rotation[1], 0, 1, 0)
-        glRotatef(self.rotation[2], 0, 0, 1)
-        glScalef(self.size[0], self.size[1], self.size[2])
-        glColor3f(self.color[0], self.color[1], self.color[2])
-        if self.texture_enabled:
-            glEnable(GL_TEXTURE_2D)
-            glBindTexture(GL_TEXTURE_2D, self.texture_id)
-        glBegin(GL_QUADS)
-        for plane_vertex in self.plane_quad:
-            if self.texture_enabled:
-                glTexCoord2fv(self.plane_texture_coordinates[plane_vertex])
-            glVertex3fv(self.plane_vertices[plane_vertex])
-        glEnd()
-        glColor3f(1, 1, 1)
-        if self.texture_enabled:
-            glDisable(GL_TEXTURE_2D)
-        glPopMatrix()
+        self.draw_primitive((self.color[0], self.color[1], self.color[2], 1), self.texture_enabled)
 
     def wire_plane(self):
-        # Same as solid_cube, but different object
-        glPushMatrix()
-        glTranslatef(self.location[0], self.location[1], self.location[2])
-        glRotatef(self.rotation[0], 1, 0, 0)
-        glRotatef(self.rotation[1], 0, 1, 0)
-        glRotatef(self.rotation[2], 0, 0, 1)
-        glScalef(self.size[0], self.size[1], self.size[2])
-        glColor3f(self.color[0], self.color[1], self.color[2])
-        glBegin(GL_LINES)
-        for plane_edge in self.plane_edges:
-            for plane_vertex in plane_edge:
-                glVertex3fv(self.plane_vertices[plane_vertex])
-        glEnd()
-        glColor3f(1, 1, 1)
-        glPopMatrix()
+        self.draw_primitive((self.color[0], self.color[1], self.color[2], 1))
 
     def triangle(self):
-        # Same as solid_cube, but different object
-        glPushMatrix()
-        glTranslatef(self.location[0], self.location[1], self.location[2])
-        glRotatef(self.rotation[0], 1, 0, 0)
-        glRotatef(self.rotation[1], 0, 1, 0)
-        glRotatef(self.rotation[2], 0, 0, 1)
-        glScalef(self.size[0], self.size[1], self.size[2])
-        glColor4f(self.color[0], self.color[1], self.color[2], 0.4)
-        if self.texture_enabled:
-            glEnable(GL_TEXTURE_2D)
-            glBindTexture(GL_TEXTURE_2D, self.texture_id)
-        glBegin(GL_TRIANGLES)
-        for triangle_vertex in self.triangle_tri:
-            glVertex3fv(self.triangle_vertices[triangle_vertex])
-        glEnd()
-        # glColor4f(self.color[0], self.color[1], self.color[2], 1)
-        # glBegin(GL_LINES)
-        # for triangle_edge in self.triangle_edges:
-        #     for triangle_vertex in triangle_edge:
-        #         glVertex3fv(self.triangle_vertices[triangle_vertex])
-        # glEnd()
-        glColor4f(1, 1, 1, 1)
-        if self.texture_enabled:
-            glDisable(GL_TEXTURE_2D)
-        glPopMatrix()
+        self.draw_primitive((self.color[0], self.color[1], self.color[2], 0.4), self.texture_enabled)
 
     def update_object(self):
-        self.transform(self.location_speed)
-        self.rotate(self.rotation_speed)
-        self.scale(self.size_speed)
+        # The speeds of all objects are applied at once by the object store, see ObjectStore.apply_speeds
+        pass
+
+    location = transform_property('location')
+    rotation = transform_property('rotation')
+    size = transform_property('size')
 
     def transform(self, applied):
-        self.location = [self.location[i] + applied[i] for i in range(len(self.location))]
+        self.object_transform.add('location', applied)
 
     def rotate(self, applied):
-        self.rotation = [self.rotation[i] + applied[i] for i in range(len(self.rotation))]
+        self.object_transform.add('rotation', applied)
 
     def scale(self, applied):
-        self.size = [self.size[i] + applied[i] for i in range(len(self.size))]
+        self.object_transform.add('size', applied)
 
     def set_location(self, applied):
-        self.location = [applied[i] for i in range(len(self.location))]
+        self.object_transform.set('location', applied)
 
     def set_rotation(self, applied):
-        self.rotation = [applied[i] for i in range(len(self.rotation))]
+        self.object_transform.set('rotation', applied)
 
     def set_scale(self, applied):
-        self.size = [applied[i] for i in range(len(self.size))]
+        self.object_transform.set('size', applied)
 
     def transform_speed(self, applied):
-        self.location_speed = [self.location_speed[i] + applied[i] for i in range(len(self.location_speed))]
+        object_store.location_speed[self.row] += applied
+        object_store.update_moving(self.row)
 
     def rotate_speed(self, applied):
-        self.rotation_speed = [self.rotation_speed[i] + applied[i] for i in range(len(self.rotation_speed))]
+        object_store.rotation_speed[self.row] += applied
+        object_store.update_moving(self.row)
 
     def scale_speed(self, applied):
-        self.size_speed = [self.size_speed[i] + applied[i] for i in range(len(self.size_speed))]
+        object_store.size_speed[self.row] += applied
+        object_store.update_moving(self.row)
 
     def set_transform_speed(self, applied):
         self.location_speed = applied
@@ -222,89 +403,302 @@ class SimpleObject:
             self.color = applied
 
     def set_texture(self, texture_filename):
+        self.unset_texture()
         self.texture_id = read_texture(texture_filename)
+        self.texture_filename = texture_filename
         self.texture_enabled = True
 
     def unset_texture(self):
+        if self.texture_filename is not None:
+            release_texture(self.texture_filename)
+            self.texture_filename = None
         self.texture_enabled = False
 
+    def __del__(self):
+        try:
+            self.unset_texture()
+            if self.row is not None:
+                object_store.free(self.row)
+        except (AttributeError, TypeError):
+            # Interpreter shutdown
+            pass
+
+    def set_visible_faces(self, faces):
+        # Only draws the given faces of a cube ('x+', 'x-', 'y+', 'y-', 'z+', 'z-'), objects with the same faces share a display list
+        self.visible_faces = None if faces is None else tuple(sorted(faces))
+
+
+class MeshBuilder:
+    """
+    Collects static geometry in world coordinates with the color baked into every vertex, so it can be drawn at once by a MeshChunk.
+    """
+
+    # Corners of every face of the unit cube, by the direction the face points to
+    cube_faces = {'x+': ((1, -1, -1), (1, -1, 1), (1, 1, 1), (1, 1, -1)),
+                  'x-': ((-1, -1, -1), (-1, 1, -1), (-1, 1, 1), (-1, -1, 1)),
+                  'y+': ((-1, 1, -1), (1, 1, -1), (1, 1, 1), (-1, 1, 1)),
+                  'y-': ((-1, -1, -1), (-1, -1, 1), (1, -1, 1), (1, -1, -1)),
+                  'z+': ((-1, -1, 1), (-1, 1, 1), (1, 1, 1), (1, -1, 1)),
+                  'z-': ((-1, -1, -1), (1, -1, -1), (1, 1, -1), (-1, 1, -1))}
+    cube_edges = (((1, 1, 1), (1, 1, -1)), ((1, 1, 1), (1, -1, 1)), ((1, 1, 1), (-1, 1, 1)), ((1, 1, -1), (1, -1, -1)),
+                  ((1, 1, -1), (-1, 1, -1)), ((1, -1, -1), (-1, -1, -1)), ((1, -1, -1), (1, -1, 1)), ((1, -1, 1), (-1, -1, 1)),
+                  ((-1, 1, 1), (-1, -1, 1)), ((-1, 1, 1), (-1, 1, -1)), ((-1, -1, -1), (-1, -1, 1)), ((-1, -1, -1), (-1, 1, -1)))
+    plane_corners = ((1, 0, -1), (1, 0, 1), (-1, 0, 1), (-1, 0, -1))
+    plane_edges = ((0, 1), (0, 3), (1, 2), (2, 3))
+
+    def __init__(self):
+        self.quad_vertices = []
+        self.quad_colors = []
+        self.line_vertices = []
+        self.line_colors = []
+
+    @staticmethod
+    def place(corner, location, size):
+        return (location[0] + corner[0] * size[0], location[1] + corner[1] * size[1], location[2] + corner[2] * size[2])
+
+    @staticmethod
+    def rgba(color):
+        return (color[0], color[1], color[2], color[3] if len(color) == 4 else 1)
+
+    def add_box(self, location, size, color, faces=('x+', 'x-', 'y+', 'y-', 'z+', 'z-')):
+        color = self.rgba(color)
+        for face in faces:
+            for corner in self.cube_faces[face]:
+                self.quad_vertices.append(self.place(corner, location, size))
+                self.quad_colors.append(color)
+
+    def add_wire_box(self, location, size, color):
+        color = self.rgba(color)
+        for cube_edge in self.cube_edges:
+            for corner in cube_edge:
+                self.line_vertices.append(self.place(corner, location, size))
+                self.line_colors.append(color)
+
+    def add_plane(self, location, size, color):
+        color = self.rgba(color)
+        for corner in self.plane_corners:
+            self.quad_vertices.append(self.place(corner, location, size))
+            self.quad_colors.append(color)
+
+    def add_wire_plane(self, location, size, color):
+        color = self.rgba(color)
+        for plane_edge in self.plane_edges:
+            for plane_vertex in plane_edge:
+                self.line_vertices.append(self.place(self.plane_corners[plane_vertex], location, size))
+                self.line_colors.append(color)
+
+
+class MeshChunk:
+    """
+    A block of static level geometry, baked into vertex arrays with per vertex colors and drawn with a single display list call.
+    The render queue culls a chunk as a unit, using its location (center) and cull_extent (half size in x and z).
+    """
+
+    __slots__ = ('location', 'cull_extent', 'quad_vertices', 'quad_colors', 'line_vertices', 'line_colors', 'display_list',
+                 'stale_display_lists')
+
+    def __init__(self, location, cull_extent):
+        self.location = location
+        self.cull_extent = cull_extent
+
+        self.quad_vertices = np.zeros((0, 3), np.float32)
+        self.quad_colors = np.zeros((0, 4), np.float32)
+        self.line_vertices = np.zeros((0, 3), np.float32)
+        self.line_colors = np.zeros((0, 4), np.float32)
+
+        self.display_list = None
+        self.stale_display_lists = []
+
+    def set_geometry(self, mesh_builder):
+        self.quad_vertices = np.array(mesh_builder.quad_vertices, np.float32).reshape((-1, 3))
+        self.quad_colors = np.array(mesh_builder.quad_colors, np.float32).reshape((-1, 4))
+        self.line_vertices = np.array(mesh_builder.line_vertices, np.float32).reshape((-1, 3))
+        self.line_colors = np.array(mesh_builder.line_colors, np.float32).reshape((-1, 4))
+        # The display list is recompiled on the next draw, as a GL context is needed for it
+        if self.display_list is not None:
+            self.stale_display_lists.append(self.display_list)
+            self.display_list = None
+
+    def compile_display_list(self):
+        unused_display_lists.extend(self.stale_display_lists)
+        self.stale_display_lists = []
+        delete_unused_display_lists()
+        self.display_list = gl.glGenLists(1)
+        gl.glNewList(self.display_list, gl.GL_COMPILE)
+        gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
+        gl.glEnableClientState(gl.GL_COLOR_ARRAY)
+        if len(self.quad_vertices):
+            gl.glVertexPointer(3, gl.GL_FLOAT, 0, self.quad_vertices)
+            gl.glColorPointer(4, gl.GL_FLOAT, 0, self.quad_colors)
+            gl.glDrawArrays(gl.GL_QUADS, 0, len(self.quad_vertices))
+        if len(self.line_vertices):
+            gl.glVertexPointer(3, gl.GL_FLOAT, 0, self.line_vertices)
+            gl.glColorPointer(4, gl.GL_FLOAT, 0, self.line_colors)
+            gl.glDrawArrays(gl.GL_LINES, 0, len(self.line_vertices))
+        gl.glDisableClientState(gl.GL_COLOR_ARRAY)
+        gl.glDisableClientState(gl.GL_VERTEX_ARRAY)
+        gl.glColor4f(1, 1, 1, 1)
+        gl.glEndList()
+
+    def get_draw_states(self):
+        # The colors are part of the vertex arrays, so there is no color state
+        return [(opaque_pass, 0, gl.GL_QUADS, ())]
+
+    def draw(self, draw_state):
+        if self.display_list is None:
+            self.compile_display_list()
+        gl.glCallList(self.display_list)
+
+    def make_object_opaque(self):
+        self.draw(None)
+
+    def make_object_translucent(self):
+        pass
+
+    def __del__(self):
+        # The display lists are deleted later, as there may be no GL context now
+        try:
+            unused_display_lists.extend(self.stale_display_lists)
+            if self.display_list is not None:
+                unused_display_lists.append(self.display_list)
+        except (AttributeError, TypeError):
+            # Interpreter shutdown
+            pass
+
+
+class ObjectBuilder:
+    """
+    Same interface as the MeshBuilder, but places a separate SimpleObject for every part of the geometry instead of baking it.
+    """
+
+    def __init__(self):
+        self.objects = []
+
+    def add_box(self, location, size, color, faces=None):
+        cube = SimpleObject('solid_cube')
+        cube.transform(location)
+        cube.set_scale(size)
+        cube.set_color(color)
+        cube.set_visible_faces(faces)
+        self.objects.append(cube)
+
+    def add_wire_box(self, location, size, color):
+        cube = SimpleObject('wire_cube')
+        cube.transform(location)
+        cube.set_scale(size)
+        cube.set_color(color)
+        self.objects.append(cube)
+
+    def add_plane(self, location, size, color):
+        plane = SimpleObject('solid_plane')
+        plane.transform(location)
+        plane.set_scale(size)
+        plane.set_color(color)
+        self.objects.append(plane)
+
+    def add_wire_plane(self, location, size, color):
+        plane = SimpleObject('wire_plane')
+        plane.transform(location)
+        plane.set_scale(size)
+        plane.set_color(color)
+        self.objects.append(plane)
+
 
 class Parent:  # AKA Jozef
 
+    __slots__ = ('object_transform', 'children')
+
     def __init__(self):
-        self.location = [0, 0, 0]
-        self.rotation = [0, 0, 0]
-        self.size = [1, 1, 1]
+        self.object_transform = Transform()
         self.children = []
 
     def add_child(self, child):
         self.children.append(child)
+        # The world matrices of the children include the transform of the parent
+        child.object_transform.parent = self.object_transform
 
     def remove_child(self, child):
         self.children.pop(child)
 
     def make_object_opaque(self):
-        glPushMatrix()
-        glTranslatef(self.location[0], self.location[1], self.location[2])
-        glRotatef(self.rotation[0], 1, 0, 0)
-        glRotatef(self.rotation[1], 0, 1, 0)
-        glRotatef(self.rotation[2], 0, 0, 1)
-        glScalef(self.size[0], self.size[1], self.size[2])
+        # Every child applies its own world matrix, so the parent does not change the matrix itself
         for child in self.children:
             child.make_object_opaque()
-        glPopMatrix()
 
     def make_object_translucent(self):
-        glPushMatrix()
-        glTranslatef(self.location[0], self.location[1], self.location[2])
-        glRotatef(self.rotation[0], 1, 0, 0)
-        glRotatef(self.rotation[1], 0, 1, 0)
-        glRotatef(self.rotation[2], 0, 0, 1)
-        glScalef(self.size[0], self.size[1], self.size[2])
         for child in self.children:
             child.make_object_translucent()
-        glPopMatrix()
 
     def update_object(self):
         for child in self.children:
             child.update_object()
 
+    location = transform_property('location')
+    rotation = transform_property('rotation')
+    size = transform_property('size')
+
     def transform(self, applied):
-        self.location = [self.location[i] + applied[i] for i in range(len(self.location))]
+        self.object_transform.add('location', applied)
 
     def rotate(self, applied):
-        self.rotation = [self.rotation[i] + applied[i] for i in range(len(self.rotation))]
+        self.object_transform.add('rotation', applied)
 
     def scale(self, applied):
-        self.size = [self.size[i] + applied[i] for i in range(len(self.size))]
+        self.object_transform.add('size', applied)
 
     def set_location(self, applied):
-        self.location = [applied[i] for i in range(len(self.location))]
+        self.object_transform.set('location', applied)
 
     def set_rotation(self, applied):
-        self.rotation = [applied[i] for i in range(len(self.rotation))]
+        self.object_transform.set('rotation', applied)
 
     def set_scale(self, applied):
-        self.size = [applied[i] for i in range(len(self.size))]
+        self.object_transform.set('size', applied)
 
     def set_color(self, color):
         for child in self.children:
             child.set_color(color)
 
 
+def draw_textured_quads(elements, draw_state):
+    # Draws the quads of all given elements (UIElements and TextElements sharing a texture) with a single draw call
+    vertices = np.concatenate([element.get_world_vertices() for element in elements])
+    texture_coordinates = np.concatenate([element.get_texture_coordinates() for element in elements])
+    if not len(vertices):
+        return
+    gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
+    gl.glEnableClientState(gl.GL_TEXTURE_COORD_ARRAY)
+    gl.glVertexPointer(3, gl.GL_FLOAT, 0, vertices)
+    gl.glTexCoordPointer(2, gl.GL_FLOAT, 0, texture_coordinates)
+    gl.glDrawArrays(gl.GL_QUADS, 0, len(vertices))
+    gl.glDisableClientState(gl.GL_TEXTURE_COORD_ARRAY)
+    gl.glDisableClientState(gl.GL_VERTEX_ARRAY)
+
+
 class UIElement:
 
-    def __init__(self, texture_filename, activated=False):
-        self.plane_vertices = ((2, 0, -1), (2, 0, 1), (-2, 0, 1), (-2, 0, -1))
-        self.plane_quad = (0, 1, 2, 3)
-        self.plane_texture_coordinates = ((1, 0), (1, 1), (0, 1), (0, 0))
+    __slots__ = ('location', 'size', 'offset', 'texture_filename', 'texture_id', 'texture_coordinates', 'world_vertices', 'world_transform',
+                 'activated')
+
+    plane_vertices = ((2, 0, -1), (2, 0, 1), (-2, 0, 1), (-2, 0, -1))
+    plane_quad = (0, 1, 2, 3)
 
+    def __init__(self, texture_filename, activated=False):
         self.location = (0, 0, 0)
         self.size = [1, 1, 1]
 
         self.offset = (0, 0)
 
+        self.texture_filename = texture_filename
         self.texture_id = read_texture(texture_filename)
+        # The image can be a part of a texture atlas, so the texture coordinates are mapped to its region
+        u_start, v_start, u_end, v_end = texture_manager.get_region(texture_filename)
+        plane_texture_coordinates = ((u_end, v_start), (u_end, v_end), (u_start, v_end), (u_start, v_start))
+        self.texture_coordinates = np.array([plane_texture_coordinates[vertex] for vertex in self.plane_quad], np.float32)
+
+        # Quad vertices in world coordinates, cached for the transform they were computed with
+        self.world_vertices = None
+        self.world_transform = None
 
         self.activated = activated
 
@@ -313,20 +707,34 @@ class UIElement:
 
     def make_object_translucent(self):
         if self.activated:
-            glPushMatrix()
-            glDisable(GL_DEPTH_TEST)
-            glEnable(GL_TEXTURE_2D)
-            glBindTexture(GL_TEXTURE_2D, self.texture_id)
-            glTranslatef(self.location[0], self.location[1], self.location[2])
-            glScalef(self.size[0], self.size[1], self.size[2])
-            glBegin(GL_QUADS)
-            for vertex in self.plane_quad:
-                glTexCoord2fv(self.plane_texture_coordinates[vertex])
-                glVertex3fv(self.plane_vertices[vertex])
-            glEnd()
-            glDisable(GL_TEXTURE_2D)
-            glEnable(GL_DEPTH_TEST)
-            glPopMatrix()
+            gl.glDisable(gl.GL_DEPTH_TEST)
+            gl.glEnable(gl.GL_TEXTURE_2D)
+            gl.glBindTexture(gl.GL_TEXTURE_2D, self.texture_id)
+            self.draw(None)
+            gl.glDisable(gl.GL_TEXTURE_2D)
+            gl.glEnable(gl.GL_DEPTH_TEST)
+
+    def get_draw_states(self):
+        # UI is drawn on top of everything, in the overlay pass
+        if self.activated:
+            return [(overlay_pass, self.texture_id, gl.GL_QUADS, (1, 1, 1, 1))]
+        return []
+
+    def get_world_vertices(self):
+        transform = (tuple(self.location), tuple(self.size))
+        if transform != self.world_transform:
+            self.world_vertices = np.array([[self.location[i] + self.plane_vertices[vertex][i] * self.size[i] for i in range(3)]
+                                            for vertex in self.plane_quad], np.float32)
+            self.world_transform = transform
+        return self.world_vertices
+
+    def get_texture_coordinates(self):
+        return self.texture_coordinates
+
+    def draw(self, draw_state):
+        draw_textured_quads([self], draw_state)
+
+    draw_batch = staticmethod(draw_textured_quads)
 
     def set_location(self, applied):
         self.location = [applied[i] for i in range(len(self.location))]
@@ -346,10 +754,56 @@ class UIElement:
     def flip(self):
         self.activated = not self.activated
 
+    def __del__(self):
+        try:
+            release_texture(self.texture_filename)
+        except (AttributeError, TypeError):
+            # Interpreter shutdown
+            pass
+
+
+class FontMetrics:
+    """
+    Bitmap font with the texture coordinates of every letter, loaded once per font and shared by all text elements.
+    """
+
+    def __init__(self, font):
+        if font == 'consolas':
+            self.texture_filename = './assets/UI/consolas_font.png'
+            self.letter_height_pixel = 72
+            # width of each letter in the bitmap
+            self.letter_width_pixels = [47, 42, 44, 47, 40, 42, 46, 47, 41, 43, 48, 40, 48, 41, 47, 41, 47, 42, 44, 45, 41, 46, 43, 44, 47, 42, 44,
+                                        44, 43, 47, 42, 44, 43, 44, 44, 44]
+            self.letter_width = 0.7
+        else:
+            raise ValueError(f"Unknown font '{font}'")
+        img = Image.open(self.texture_filename)
+        # get letter bounding boxes, letter i runs from letter_offsets_uv[i - 1] to letter_offsets_uv[i]
+        self.letter_offsets_uv = np.concatenate(([0], np.cumsum(self.letter_width_pixels) / img.size[0]))
+        self.letter_height_uv = self.letter_height_pixel / img.size[1]
+        self.letter_height = self.letter_height_uv
+        img.close()
+
+
+# Loaded fonts by name
+fonts = {}
+
+
+def get_font(font):
+    try:
+        return fonts[font]
+    except KeyError:
+        fonts[font] = FontMetrics(font)
+        return fonts[font]
+
 
 class TextElement:
 
-    # Scratch build text rendering engine
+    # Scratch build text rendering engine. The glyph quads are laid out once per text, all visible text (and UI sharing its texture
+    # atlas) is drawn in one batch.
+
+    __slots__ = ('text', 'activated', 'font', 'location', 'rotation', 'size', 'offset', 'font_metrics', 'texture_id', 'letters',
+                 'glyph_vertices', 'glyph_texture_coordinates', 'world_vertices', 'world_transform')
 
     def __init__(self, text, activated=False, font='consolas'):
         self.text = text
@@ -360,30 +814,22 @@ class TextElement:
         self.size = [1, 1, 1]
         self.offset = (0, 0)
 
-        if font == 'consolas':
-            # Load font bitmap
-            self.texture_id = read_texture('./assets/UI/consolas_font.png')
-            self.letter_height_pixel = 72
-            # width of each letter in the bitmap
-            self.letter_width_pixels = [47, 42, 44, 47, 40, 42, 46, 47, 41, 43, 48, 40, 48, 41, 47, 41, 47, 42, 44, 45, 41, 46, 43, 44, 47, 42, 44,
-                                        44, 43, 47, 42, 44, 43, 44, 44, 44]
-            img = Image.open('./assets/UI/consolas_font.png')
-            # get letter bounding boxes
-            self.letter_width_uv = [width_pixel / img.size[0] for width_pixel in self.letter_width_pixels]
-            self.letter_height_uv = self.letter_height_pixel / img.size[1]
-            self.letter_height = self.letter_height_uv
-            self.letter_width = [0.7 for _ in self.letter_width_uv]
-            img.close()
+        self.font_metrics = get_font(font)
+        self.texture_id = read_texture(self.font_metrics.texture_filename)
 
         self.letters = []
-        self.letter_positions = []
-        self.letter_vertices = []
-        self.letter_face = (0, 1, 2, 3)
-        self.letter_texture_coordinates = []
+        self.glyph_vertices = np.zeros((0, 3), np.float32)
+        self.glyph_texture_coordinates = np.zeros((0, 2), np.float32)
+
+        # Glyph vertices in world coordinates, cached for the transform they were computed with
+        self.world_vertices = None
+        self.world_transform = None
 
         self.generate_letters()
 
     def generate_letters(self):
+        # Lays out the glyph quads of the text in local coordinates, only needed when the text changes
+        self.letters = []
         for letter in self.text:
             char = ord(letter) - 96
             if 1 <= char <= 26:
@@ -396,65 +842,86 @@ class TextElement:
                 self.letters.append(10 + 26)
             if char == -49:
                 self.letters.append(-1)
+        glyphs = []
+        glyph_positions = []
         caret_position = [0, 0]
         for letter in self.letters:
             if letter == -1:
                 # New line: move caret back to beginning and one line down
                 caret_position[1] += 1
                 caret_position[0] = 0
-                self.letter_texture_coordinates.append(None)
-                self.letter_vertices.append(None)
             elif letter == 0:
                 # Space: move caret one space to the right
                 caret_position[0] += 1
-                self.letter_texture_coordinates.append(None)
-                self.letter_vertices.append(None)
             else:
-                uv_start_position = (sum(self.letter_width_uv[0:letter - 1]), 0)
-                uv_end_position = (sum(self.letter_width_uv[0:letter]), self.letter_height_uv)
-                self.letter_texture_coordinates.append(((uv_start_position[0], uv_start_position[1]),
-                                                        (uv_end_position[0], uv_start_position[1]),
-                                                        (uv_end_position[0], uv_end_position[1]),
-                                                        (uv_start_position[0], uv_end_position[1])))
-                letter_center_position = ((self.letter_width[letter - 1] / 2) + (caret_position[0] * self.letter_width[letter - 1]),
-                                          (self.letter_height / 2) + (caret_position[1] * self.letter_height))
-                self.letter_vertices.append(((letter_center_position[0] - self.letter_width[letter - 1] / 2, 0,
-                                              letter_center_position[1] - self.letter_height / 2),
-
-                                             (letter_center_position[0] + self.letter_width[letter - 1] / 2, 0,
-                                              letter_center_position[1] - self.letter_height / 2),
-
-                                             (letter_center_position[0] + self.letter_width[letter - 1] / 2, 0,
-                                              letter_center_position[1] + self.letter_height / 2),
-
-                                             (letter_center_position[0] - self.letter_width[letter - 1] / 2, 0,
-                                              letter_center_position[1] + self.letter_height / 2)))
+                glyphs.append(letter)
+                glyph_positions.append((caret_position[0], caret_position[1]))
                 caret_position[0] += 1
+        glyphs = np.array(glyphs, np.int64)
+        glyph_positions = np.array(glyph_positions, np.float64).reshape((-1, 2))
+
+        letter_width, letter_height = self.font_metrics.letter_width, self.font_metrics.letter_height
+        left = glyph_positions[:, 0] * letter_width
+        top = glyph_positions[:, 1] * letter_height
+        zero = np.zeros_like(left)
+        # Four corners per glyph: (left, top), (right, top), (right, bottom), (left, bottom)
+        self.glyph_vertices = np.stack((np.stack((left, zero, top), axis=1),
+                                        np.stack((left + letter_width, zero, top), axis=1),
+                                        np.stack((left + letter_width, zero, top + letter_height), axis=1),
+                                        np.stack((left, zero, top + letter_height), axis=1)), axis=1).reshape((-1, 3)).astype(np.float32)
+        # The font can be a part of a texture atlas, so the texture coordinates are mapped to its region
+        u_start, v_start, u_end, v_end = texture_manager.get_region(self.font_metrics.texture_filename)
+        uv_start = u_start + self.font_metrics.letter_offsets_uv[glyphs - 1] * (u_end - u_start)
+        uv_end = u_start + self.font_metrics.letter_offsets_uv[glyphs] * (u_end - u_start)
+        uv_zero = np.full_like(uv_start, v_start)
+        uv_height = np.full_like(uv_start, v_start + self.font_metrics.letter_height_uv * (v_end - v_start))
+        self.glyph_texture_coordinates = np.stack((np.stack((uv_start, uv_zero), axis=1),
+                                                   np.stack((uv_end, uv_zero), axis=1),
+                                                   np.stack((uv_end, uv_height), axis=1),
+                                                   np.stack((uv_start, uv_height), axis=1)), axis=1).reshape((-1, 2)).astype(np.float32)
+        self.world_transform = None
+
+    def set_text(self, text):
+        if text != self.text:
+            self.text = text
+            self.generate_letters()
+
+    def get_world_vertices(self):
+        # Glyph vertices moved to the location, rotation and scale of the element, only recomputed when these have changed
+        transform = (tuple(self.location), tuple(self.rotation), tuple(self.size))
+        if transform != self.world_transform:
+            rotation = np.dot(np.dot(rotation_matrix((1, 0, 0), np.deg2rad(self.rotation[0])),
+                                     rotation_matrix((0, 1, 0), np.deg2rad(self.rotation[1]))),
+                              rotation_matrix((0, 0, 1), np.deg2rad(self.rotation[2])))
+            self.world_vertices = (np.dot(self.glyph_vertices * np.array(self.size), rotation.T) + np.array(self.location)).astype(np.float32)
+            self.world_transform = transform
+        return self.world_vertices
 
     def make_object_opaque(self):
         pass
 
     def make_object_translucent(self):
         if self.activated:
-            glPushMatrix()
-            glDisable(GL_DEPTH_TEST)
-            glEnable(GL_TEXTURE_2D)
-            glBindTexture(GL_TEXTURE_2D, self.texture_id)
-            glTranslatef(self.location[0], self.location[1], self.location[2])
-            glRotatef(self.rotation[0], 1, 0, 0)
-            glRotatef(self.rotation[1], 0, 1, 0)
-            glRotatef(self.rotation[2], 0, 0, 1)
-            glScalef(self.size[0], self.size[1], self.size[2])
-            glBegin(GL_QUADS)
-            for letter_i in range(len(self.letters)):
-                if self.letters[letter_i] > 0:
-                    for vertex in self.letter_face:
-                        glTexCoord2fv(self.letter_texture_coordinates[letter_i][vertex])
-                        glVertex3fv(self.letter_vertices[letter_i][vertex])
-            glEnd()
-            glDisable(GL_TEXTURE_2D)
-            glEnable(GL_DEPTH_TEST)
-            glPopMatrix()
+            gl.glDisable(gl.GL_DEPTH_TEST)
+            gl.glEnable(gl.GL_TEXTURE_2D)
+            gl.glBindTexture(gl.GL_TEXTURE_2D, self.texture_id)
+            self.draw(None)
+            gl.glDisable(gl.GL_TEXTURE_2D)
+            gl.glEnable(gl.GL_DEPTH_TEST)
+
+    def get_draw_states(self):
+        # Text is drawn on top of everything, in the overlay pass
+        if self.activated:
+            return [(overlay_pass, self.texture_id, gl.GL_QUADS, (1, 1, 1, 1))]
+        return []
+
+    def get_texture_coordinates(self):
+        return self.glyph_texture_coordinates
+
+    def draw(self, draw_state):
+        draw_textured_quads([self], draw_state)
+
+    draw_batch = staticmethod(draw_textured_quads)
 
     def set_location(self, applied):
         self.location = [applied[i] for i in range(len(self.location))]
@@ -471,10 +938,6 @@ class TextElement:
     def set_scale(self, applied):
         self.size = [applied[i] for i in range(len(self.size))]
 
-    def set_text(self, text):
-        self.text = text
-        self.generate_letters()
-
     def activate(self):
         self.activated = True
 
@@ -483,3 +946,10 @@ class TextElement:
 
     def flip_activated(self):
         self.activated = not self.activated
+
+    def __del__(self):
+        try:
+            release_texture(self.font_metrics.texture_filename)
+        except (AttributeError, TypeError):
+            # Interpreter shutdown
+            pass
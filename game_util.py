@@ -1,22 +1,33 @@
-import numpy as np
 from PIL import Image
+from collections import OrderedDict
+import os
+from timeit import default_timer as timer
+import numpy as np
+
+import graphics as gl
+
 
-from OpenGL.GL import *
-from OpenGL.GLUT import *
+# Render passes of the render queue, in drawing order. The overlay pass is drawn without depth testing.
+opaque_pass = 0
+translucent_pass = 1
+overlay_pass = 2
 
 
-textures = []
+# Walking speeds, in units per second
+player_speed = 2.7
+player_sprint_speed = 5.4
+enemy_speed = 1.6
 
 
 def move_distance_player(duration, sprint=False):
     if sprint:
-        return 2 * duration ** 0.74
+        return player_sprint_speed * duration
     else:
-        return 1 * duration ** 0.74
+        return player_speed * duration
 
 
 def move_distance_enemy(duration):
-    return 0.6 * duration ** 0.74
+    return enemy_speed * duration
 
 
 def clamp(value, low_limit, high_limit):
@@ -28,100 +39,545 @@ def clamp(value, low_limit, high_limit):
         return value
 
 
-def read_texture(filename):
-    global textures
-    try:
-        return textures.index(filename) + 1
-    except ValueError:
-        textures.append(filename)
-        img = Image.open(filename)
-        img_data = np.array(list(img.getdata()), np.int32)
-        texture_id = glGenTextures(1)
-        # print(f'New texture loaded, currently loaded {len(textures)} texture(s) at texture id {texture_id}')
-        glBindTexture(GL_TEXTURE_2D, texture_id)
-        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
-        glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP)
-        glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP)
-        glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
-        glTexParameterf(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
-        glTexEnvf(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_REPLACE)
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, img.size[0], img.size[1], 0,
-                     GL_RGBA, GL_UNSIGNED_BYTE, img_data)
+def get_texture_data(img):
+    """
+    Returns the pixels of an image as raw RGBA bytes, ready to be handed to gl.glTexImage2D without any per pixel Python objects.
+    :param img: PIL image of any mode
+    :return: width, height and the RGBA bytes
+    """
+    if img.mode != 'RGBA':
+        img = img.convert('RGBA')
+    return img.size[0], img.size[1], img.tobytes()
+
+
+class TextureAtlas:
+    """
+    Packs a number of images into one texture, so everything using them can be drawn with a single texture bind. The images are
+    placed on shelves (rows) sorted by height, the texture coordinates of every image are kept in a lookup table.
+    """
+
+    def __init__(self, name, filenames, max_width=2048, padding=1):
+        """
+        :param name: Name under which the texture manager loads the atlas, should not be an existing filename
+        :param filenames: Images to pack
+        :param max_width: Width of the atlas in pixels, images that are wider are not packed
+        :param padding: Empty pixels around every image, so neighbouring images do not bleed into each other
+        """
+        self.name = name
+        self.filenames = [os.path.normpath(filename) for filename in filenames]
+        self.positions = {}
+
+        image_sizes = {}
+        for filename in self.filenames:
+            with Image.open(filename) as img:
+                image_sizes[filename] = img.size
+
+        # First fit shelf packing, every shelf is as high as its first (highest) image
+        shelves = []
+        for filename in sorted(self.filenames, key=lambda packed_filename: -image_sizes[packed_filename][1]):
+            width, height = image_sizes[filename][0] + 2 * padding, image_sizes[filename][1] + 2 * padding
+            if width > max_width:
+                continue
+            for shelf in shelves:
+                if shelf[2] + width <= max_width and height <= shelf[1]:
+                    break
+            else:
+                shelf = [sum(packed_shelf[1] for packed_shelf in shelves), height, 0]
+                shelves.append(shelf)
+            self.positions[filename] = (shelf[2] + padding, shelf[0] + padding) + image_sizes[filename]
+            shelf[2] += width
+        self.size = (max([shelf[2] for shelf in shelves] + [1]), max(sum(shelf[1] for shelf in shelves), 1))
+
+    def __contains__(self, filename):
+        return os.path.normpath(filename) in self.positions
+
+    def get_region(self, filename):
+        # Texture coordinates (u_start, v_start, u_end, v_end) of an image in the atlas
+        x, y, width, height = self.positions[os.path.normpath(filename)]
+        return x / self.size[0], y / self.size[1], (x + width) / self.size[0], (y + height) / self.size[1]
+
+    def build_image(self):
+        atlas = Image.new('RGBA', self.size)
+        for filename, (x, y, _, _) in self.positions.items():
+            with Image.open(filename) as img:
+                atlas.paste(img.convert('RGBA'), (x, y))
+        return atlas
+
+
+class LoadedTexture:
+    # Bookkeeping of a texture that is resident on the GPU
+
+    def __init__(self, texture_id, size_bytes):
+        self.texture_id = texture_id
+        self.size_bytes = size_bytes
+        self.references = 0
+
+
+class TextureManager:
+    """
+    Loads every texture file once and hands out its GL handle. Objects using a texture hold a reference to it, textures without
+    references stay loaded for reuse until the VRAM budget is exceeded, and are then deleted least recently used first.
+    """
+
+    def __init__(self, vram_budget=64 * 2 ** 20):
+        """
+        :param vram_budget: Bytes of texture data that may stay resident, textures that are in use are never evicted
+        """
+        self.vram_budget = vram_budget
+        self.textures = {}
+        # Atlases by name, and the atlas every packed filename is in
+        self.atlases = {}
+        self.packed = {}
+        # Filenames of textures without references, least recently used first
+        self.unused = OrderedDict()
+
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def add_atlas(self, atlas):
+        # From now on the images in the atlas are loaded as part of it, get_region gives their texture coordinates
+        self.atlases[atlas.name] = atlas
+        for filename in atlas.positions:
+            self.packed[filename] = atlas
+
+    def get_key(self, filename):
+        # Filenames are normalised, and images that are packed in an atlas share the texture of the atlas
+        filename = os.path.normpath(filename)
+        if filename in self.packed:
+            return self.packed[filename].name
+        return filename
+
+    def get_region(self, filename):
+        # Texture coordinates (u_start, v_start, u_end, v_end) of an image in its texture
+        filename = os.path.normpath(filename)
+        if filename in self.packed:
+            return self.packed[filename].get_region(filename)
+        return 0, 0, 1, 1
+
+    def acquire(self, filename):
+        # Returns the GL handle of the texture and adds a reference to it
+        filename = self.get_key(filename)
+        texture = self.textures.get(filename)
+        if texture is None:
+            self.misses += 1
+            texture = self.load(filename)
+        else:
+            self.hits += 1
+        if texture.references == 0:
+            self.unused.pop(filename, None)
+        texture.references += 1
+        self.evict()
+        return texture.texture_id
+
+    def release(self, filename):
+        # Removes a reference, makes no GL calls so it is safe to call from __del__
+        filename = self.get_key(filename)
+        texture = self.textures.get(filename)
+        if texture is None or texture.references == 0:
+            return
+        texture.references -= 1
+        if texture.references == 0:
+            self.unused[filename] = None
+
+    def load(self, filename):
+        img = self.atlases[filename].build_image() if filename in self.atlases else Image.open(filename)
+        width, height, img_data = get_texture_data(img)
         img.close()
-        return texture_id
+        texture_id = gl.glGenTextures(1)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, texture_id)
+        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
+        gl.glTexParameterf(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S, gl.GL_CLAMP)
+        gl.glTexParameterf(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_T, gl.GL_CLAMP)
+        gl.glTexParameterf(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_NEAREST)
+        gl.glTexParameterf(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_NEAREST)
+        gl.glTexEnvf(gl.GL_TEXTURE_ENV, gl.GL_TEXTURE_ENV_MODE, gl.GL_REPLACE)
+        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA, width, height, 0,
+                     gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, img_data)
+        texture = LoadedTexture(texture_id, len(img_data))
+        self.textures[filename] = texture
+        self.resident_bytes += texture.size_bytes
+        return texture
+
+    def evict(self):
+        # Deletes unused textures, least recently used first, until the resident textures fit in the budget
+        while self.resident_bytes > self.vram_budget and self.unused:
+            filename, _ = self.unused.popitem(last=False)
+            texture = self.textures.pop(filename)
+            gl.glDeleteTextures([texture.texture_id])
+            self.resident_bytes -= texture.size_bytes
+            self.evictions += 1
+
+    def get_stats(self):
+        return {'resident_textures': len(self.textures), 'unused_textures': len(self.unused), 'resident_bytes': self.resident_bytes,
+                'vram_budget': self.vram_budget, 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+texture_manager = TextureManager()
+
+
+def read_texture(filename):
+    # Returns the GL handle of a texture, the caller holds a reference until it calls release_texture
+    return texture_manager.acquire(filename)
+
+
+def release_texture(filename):
+    texture_manager.release(filename)
 
 
 class RenderQueue:
     # The render queue runs the render function 'make_object()' for every object that is subscribed to the queue.
-    def __init__(self):
+    # For culled rendering every object is also sorted into a uniform grid on its (x, z) location, so only the cells around the
+    # camera focus have to be visited. Objects that move have to be subscribed as dynamic, these are re-sorted every culled run.
+    # Objects with a 'cull_extent' (half size in x and z, like baked map chunks) are sorted into every cell they cover.
+    # Static objects kept in a 'store' (see game_objects.ObjectStore) without a parent skip the grid, and are culled in one box query
+    # over their rows instead, which are kept sorted on x so the query only has to check the rows within the cull distance in x.
+    def __init__(self, cell_size=4, cull_distance=(15, 10)):
         self.queue = []
         self.focus = None
 
-    def subscribe(self, render_object):
+        self.cell_size = cell_size
+        self.cull_distance = cull_distance
+        self.grid = {}
+        self.object_cells = {}
+        self.dynamic_objects = []
+        self.unculled_objects = []
+        self.store = None
+        # Entry of every row of the store objects, and the row of every store object by id
+        self.store_entries = {}
+        self.store_rows = {}
+        # Rows of the store objects sorted on their x location, and those x locations. Sorted again after a (un)subscription.
+        self.store_row_array = None
+        self.store_x = None
+        # ids of the subscribed objects, an object subscribed twice would get a second grid entry that is never removed
+        self.subscribed = set()
+        self.subscription_count = 0
+        # Set to a profiler.CostAccounting to measure the draw cost per object
+        self.cost_accounting = None
+
+    def subscribe(self, render_object, dynamic=False):
+        if id(render_object) in self.subscribed:
+            return
+        self.subscribed.add(id(render_object))
         self.queue.append(render_object)
+        self.subscription_count += 1
+        # The subscription number keeps the culled rendering in subscription order, which matters for blending
+        extent = getattr(render_object, 'cull_extent', (0, 0))
+        entry = (self.subscription_count, render_object, extent[0], extent[1])
+        store = getattr(render_object, 'store', None)
+        if store is not None and (self.store is None or store is self.store) and not dynamic and not extent[0] and not extent[1] \
+                and render_object.object_transform.parent is None:
+            self.store = store
+            self.store_entries[render_object.row] = entry
+            self.store_rows[id(render_object)] = render_object.row
+            self.store_row_array = None
+            return
+        try:
+            cells = self.get_cells(render_object.location, extent)
+        except (AttributeError, IndexError, TypeError):
+            # Objects without a location can not be culled and are always rendered
+            self.unculled_objects.append(entry)
+            return
+        for cell in cells:
+            self.grid.setdefault(cell, []).append(entry)
+        self.object_cells[id(render_object)] = (cells, entry)
+        if dynamic:
+            self.dynamic_objects.append(render_object)
 
     def unsubscribe(self, render_object):
         self.queue.remove(render_object)
+        self.subscribed.discard(id(render_object))
+        if id(render_object) in self.store_rows:
+            del self.store_entries[self.store_rows.pop(id(render_object))]
+            self.store_row_array = None
+            return
+        try:
+            cells, entry = self.object_cells.pop(id(render_object))
+            for cell in cells:
+                self.grid[cell].remove(entry)
+        except KeyError:
+            self.unculled_objects = [entry for entry in self.unculled_objects if entry[1] is not render_object]
+        if render_object in self.dynamic_objects:
+            self.dynamic_objects.remove(render_object)
+
+    def get_cells(self, location, extent=(0, 0)):
+        if not extent[0] and not extent[1]:
+            return [(int(location[0] // self.cell_size), int(location[2] // self.cell_size))]
+        return [(cell_x, cell_z)
+                for cell_x in range(int((location[0] - extent[0]) // self.cell_size), int((location[0] + extent[0]) // self.cell_size) + 1)
+                for cell_z in range(int((location[2] - extent[1]) // self.cell_size), int((location[2] + extent[1]) // self.cell_size) + 1)]
+
+    def move_object(self, render_object):
+        # Re-sorts an object into the grid cells of its current location
+        cells, entry = self.object_cells[id(render_object)]
+        new_cells = self.get_cells(render_object.location, (entry[2], entry[3]))
+        if new_cells != cells:
+            for cell in cells:
+                self.grid[cell].remove(entry)
+            for cell in new_cells:
+                self.grid.setdefault(cell, []).append(entry)
+            self.object_cells[id(render_object)] = (new_cells, entry)
 
     def set_camera_focus(self, focus_object):
         self.focus = focus_object
 
     def run_queue(self):
-        for render_object in self.queue:
-            try:
-                render_object.make_object_opaque()
-            except AttributeError as e:
-                print("Error", e)
+        self.render(self.queue)
+
+    def render(self, render_objects):
+        """
+        Draws the objects grouped on the sort key of their draw work: render pass, then texture, then primitive type, then color. Every
+        state change is made once per group, objects with a 'draw_batch' get the work of their whole group at once. Objects without
+        'get_draw_states' are drawn with their own 'make_object_opaque' and 'make_object_translucent' at the start of the opaque and
+        translucent pass, and set their own state.
+        :param render_objects: Objects to draw, in subscription order
+        """
+        draw_work = []
+        unsorted_objects = []
+        for object_i, render_object in enumerate(render_objects):
             try:
-                render_object.make_object_translucent()
-            except AttributeError as e:
-                print("Error", e)
+                draw_states = render_object.get_draw_states()
+            except AttributeError:
+                unsorted_objects.append(render_object)
+                continue
+            for draw_state in draw_states:
+                draw_work.append((draw_state, object_i, render_object))
+        # Measures the draw calls per object when set, see profiler.CostAccounting
+        cost_accounting = self.cost_accounting
+        # Objects within a group keep their subscription order
+        draw_work.sort(key=lambda work: (work[0], work[1]))
+
+        work_i = 0
+        current_texture = 0
+        current_color = None
+        for render_pass in (opaque_pass, translucent_pass, overlay_pass):
+            if render_pass == overlay_pass:
+                gl.glDisable(gl.GL_DEPTH_TEST)
+            if render_pass != overlay_pass and unsorted_objects:
+                for render_object in unsorted_objects:
+                    draw_start = timer() if cost_accounting is not None else 0
+                    try:
+                        if render_pass == opaque_pass:
+                            render_object.make_object_opaque()
+                        else:
+                            render_object.make_object_translucent()
+                    except AttributeError as e:
+                        print("Error", e)
+                    if cost_accounting is not None:
+                        cost_accounting.add('draw', render_object, timer() - draw_start)
+                # These objects leave the texture disabled and the color white
+                if current_texture:
+                    gl.glEnable(gl.GL_TEXTURE_2D)
+                    gl.glBindTexture(gl.GL_TEXTURE_2D, current_texture)
+                current_color = None
+            while work_i < len(draw_work) and draw_work[work_i][0][0] == render_pass:
+                draw_state, _, render_object = draw_work[work_i]
+                texture_id, color = draw_state[1], draw_state[3]
+                if texture_id != current_texture:
+                    if not texture_id:
+                        gl.glDisable(gl.GL_TEXTURE_2D)
+                    else:
+                        if not current_texture:
+                            gl.glEnable(gl.GL_TEXTURE_2D)
+                        gl.glBindTexture(gl.GL_TEXTURE_2D, texture_id)
+                    current_texture = texture_id
+                if color != current_color:
+                    if color:
+                        gl.glColor4f(color[0], color[1], color[2], color[3])
+                    current_color = color
+                draw_batch = getattr(type(render_object), 'draw_batch', None)
+                draw_start = timer() if cost_accounting is not None else 0
+                if draw_batch is None:
+                    render_object.draw(draw_state)
+                    work_i += 1
+                    if cost_accounting is not None:
+                        cost_accounting.add('draw', render_object, timer() - draw_start)
+                else:
+                    # Objects that share a batch function (like text and UI) get all work of their group in one call
+                    batch_end = work_i + 1
+                    while batch_end < len(draw_work) and draw_work[batch_end][0] == draw_state \
+                            and getattr(type(draw_work[batch_end][2]), 'draw_batch', None) is draw_batch:
+                        batch_end += 1
+                    batch_objects = [work[2] for work in draw_work[work_i:batch_end]]
+                    draw_batch(batch_objects, draw_state)
+                    work_i = batch_end
+                    if cost_accounting is not None:
+                        cost_accounting.add_batch('draw', batch_objects, timer() - draw_start)
+                if not color:
+                    # Draw work without a color (like vertex colored meshes) leaves the current color unknown
+                    current_color = None
+            if render_pass == overlay_pass:
+                gl.glEnable(gl.GL_DEPTH_TEST)
+        if current_texture:
+            gl.glDisable(gl.GL_TEXTURE_2D)
+        gl.glColor4f(1, 1, 1, 1)
+
+    def get_visible_objects(self):
+        # Only visits the grid cells around the focus, objects in those cells are still checked on their exact distance
+        for dynamic_object in self.dynamic_objects:
+            self.move_object(dynamic_object)
+        focus_x, focus_z = self.focus.location[0], self.focus.location[1]
+        cull_x, cull_z = self.cull_distance
+        # Keyed on subscription number, as objects with an extent can be found in multiple cells
+        visible_objects = {entry[0]: entry[1] for entry in self.unculled_objects}
+        for cell_x in range(int((focus_x - cull_x) // self.cell_size), int((focus_x + cull_x) // self.cell_size) + 1):
+            for cell_z in range(int((focus_z - cull_z) // self.cell_size), int((focus_z + cull_z) // self.cell_size) + 1):
+                for entry in self.grid.get((cell_x, cell_z), ()):
+                    location = entry[1].location
+                    if abs(focus_x - location[0]) < cull_x + entry[2] and abs(focus_z - location[2]) < cull_z + entry[3]:
+                        visible_objects[entry[0]] = entry[1]
+        if self.store_entries:
+            if self.store_row_array is None:
+                rows = np.fromiter(self.store_entries, int, len(self.store_entries))
+                self.store_row_array = rows[np.argsort(self.store.location[rows, 0])]
+                self.store_x = self.store.location[self.store_row_array, 0]
+            start, stop = np.searchsorted(self.store_x, (focus_x - cull_x, focus_x + cull_x))
+            for row in self.store.get_rows_in_box(self.store_row_array[start:stop], (focus_x, focus_z), self.cull_distance).tolist():
+                entry = self.store_entries[row]
+                visible_objects[entry[0]] = entry[1]
+        return [visible_objects[subscription_number] for subscription_number in sorted(visible_objects)]
 
     def run_queue_culled(self):
         # Only renders object if close enough to the player and thus the camera, to increase performance (by a lot).
-        # Renders opaque objects first and translucent objects second, to make sure proper blending occurs.
-        for render_object in self.queue:
-            try:
-                if abs(self.focus.location[0] - render_object.location[0]) < 15 and abs(self.focus.location[1] - render_object.location[2]) < 10:
-                    render_object.make_object_opaque()
-            except AttributeError:
-                pass
-            except NameError:
-                print("Culling failed, reverting to normal rendering mode.")
-                render_object.make_object_opaque()
-        for render_object in self.queue:
-            try:
-                if abs(self.focus.location[0] - render_object.location[0]) < 15 and abs(self.focus.location[1] - render_object.location[2]) < 10:
-                    render_object.make_object_translucent()
-            except AttributeError:
-                pass
-            except NameError:
-                print("Culling failed, reverting to normal rendering mode.")
-                render_object.make_object_translucent()
+        # Renders opaque objects first, then translucent objects and then the overlay, to make sure proper blending occurs.
+        if self.focus is None:
+            print("Culling failed, reverting to normal rendering mode.")
+            self.run_queue()
+            return
+        self.render(self.get_visible_objects())
 
     def flush(self):
+        # Also lets go of the focus, which would otherwise keep the objects of the last round alive
         self.queue = []
+        self.focus = None
+        self.grid = {}
+        self.object_cells = {}
+        self.dynamic_objects = []
+        self.unculled_objects = []
+        self.store = None
+        self.store_entries = {}
+        self.store_rows = {}
+        self.store_row_array = None
+        self.store_x = None
+        self.subscribed = set()
+
+
+class SimulationClock:
+    """
+    Fixed timestep clock. The time of every rendered frame is added to an accumulator, which is spent in ticks of a fixed duration,
+    so the simulation behaves the same at every frame rate. Rendering is interpolated between the last two ticks with 'alpha'.
+    """
+
+    def __init__(self, tick_rate=45, max_ticks_per_frame=5):
+        """
+        :param tick_rate: Simulation ticks per second
+        :param max_ticks_per_frame: Maximum of ticks to run after one frame, time above this after a slow frame is dropped
+        """
+        self.tick_duration = tick_rate ** -1
+        self.max_ticks_per_frame = max_ticks_per_frame
+        self.accumulator = 0
+        self.ticks = 0
+        self.dropped_time = 0
+
+    def advance(self, frame_duration):
+        # Adds the duration of a frame and returns the amount of ticks to run for it
+        self.accumulator += frame_duration
+        ticks = int(self.accumulator / self.tick_duration)
+        if ticks > self.max_ticks_per_frame:
+            self.dropped_time += (ticks - self.max_ticks_per_frame) * self.tick_duration
+            ticks = self.max_ticks_per_frame
+            self.accumulator = self.tick_duration * ticks + self.accumulator % self.tick_duration
+        self.accumulator -= ticks * self.tick_duration
+        self.ticks += ticks
+        return ticks
+
+    def get_alpha(self):
+        # Fraction of a tick the rendered frame is past the last tick
+        return clamp(self.accumulator / self.tick_duration, 0, 1)
+
+    def reset(self):
+        # Forgets the accumulated time, for example after a blocking screen
+        self.accumulator = 0
+
+    def get_report(self):
+        return f"Simulation: {self.ticks} ticks, {self.dropped_time * 1000:.0f} ms dropped after slow frames"
 
 
 class UpdateQueue:
     # The update queue runs the update function 'update_object()' for every object that is subscribed to the queue.
+    # Objects subscribed as system (like the animation of all persons at once) are updated after all other objects in every run, and
+    # are interpolated before them, as the other objects can depend on what they place.
     def __init__(self):
         self.queue = []
+        self.systems = []
+        # Counts the flushes. An update can flush the queue (like the game ending a round), the objects of the old round that are
+        # still in the lists being run are then skipped
+        self.flush_count = 0
+        # Set to a profiler.CostAccounting to measure the update cost per object
+        self.cost_accounting = None
 
-    def subscribe(self, render_object):
-        self.queue.append(render_object)
+    def subscribe(self, render_object, system=False):
+        if render_object in self.systems or render_object in self.queue:
+            return
+        if system:
+            self.systems.append(render_object)
+        else:
+            self.queue.append(render_object)
 
     def unsubscribe(self, render_object):
-        self.queue.remove(render_object)
+        if render_object in self.systems:
+            self.systems.remove(render_object)
+        else:
+            self.queue.remove(render_object)
 
     def run_queue(self, previous_frame_duration):
-        for render_object in self.queue:
-            try:
-                render_object.update_object(previous_frame_duration)
-            except TypeError:
-                render_object.update_object()
-            except AttributeError as e:
-                print("Error", e)
+        if self.cost_accounting is not None:
+            self.run_queue_accounted(previous_frame_duration)
+            return
+        flush_count = self.flush_count
+        for queue in (self.queue, self.systems):
+            for render_object in queue:
+                try:
+                    render_object.update_object(previous_frame_duration)
+                except TypeError:
+                    render_object.update_object()
+                except AttributeError as e:
+                    print("Error", e)
+                if self.flush_count != flush_count:
+                    return
+
+    def run_queue_accounted(self, previous_frame_duration):
+        # The same as run_queue, but measures the update of every object
+        flush_count = self.flush_count
+        for queue in (self.queue, self.systems):
+            for render_object in queue:
+                update_start = timer()
+                try:
+                    render_object.update_object(previous_frame_duration)
+                except TypeError:
+                    render_object.update_object()
+                except AttributeError as e:
+                    print("Error", e)
+                self.cost_accounting.add('update', render_object, timer() - update_start)
+                if self.flush_count != flush_count:
+                    return
+
+    def interpolate(self, alpha):
+        # Places the objects that interpolate between their last two ticks for rendering
+        cost_accounting = self.cost_accounting
+        for queue in (self.systems, self.queue):
+            for render_object in queue:
+                interpolate = getattr(render_object, 'interpolate', None)
+                if interpolate is not None:
+                    if cost_accounting is None:
+                        interpolate(alpha)
+                    else:
+                        interpolate_start = timer()
+                        interpolate(alpha)
+                        cost_accounting.add('interpolate', render_object, timer() - interpolate_start)
 
     def flush(self):
         self.queue = []
+        self.systems = []
+        self.flush_count += 1
@@ -0,0 +1,271 @@
+"""
+Graphics backend layer. All drawing in the game goes through the GL functions and constants of this module, which are bound to the
+active backend. Use it as 'import graphics as gl' and call for example 'gl.glBegin(gl.GL_QUADS)'.
+
+Backends:
+    - PyOpenGLBackend: draws with PyOpenGL in the current GL context (the default), optionally without PyOpenGL's checks
+    - CountingBackend: wraps another backend and counts its calls, draw calls, state changes and vertices per frame
+    - RecordingBackend: draws nothing, but records every call in an in-memory command buffer and counts the draw calls, state
+      changes and vertices, so the render path can run and be benchmarked without a display
+"""
+
+import sys
+
+
+# Calls that change the GL state, and calls that send vertices, as counted by the backends
+state_functions = frozenset(('glEnable', 'glDisable', 'glBindTexture', 'glColor3f', 'glColor4f', 'glBlendFunc', 'glDepthFunc', 'glDepthMask',
+                             'glDepthRangef', 'glTexEnvf', 'glTexParameterf', 'glPixelStorei', 'glEnableClientState', 'glDisableClientState',
+                             'glVertexPointer', 'glColorPointer', 'glTexCoordPointer', 'glClearColor', 'glClearDepthf'))
+vertex_functions = frozenset(('glVertex2f', 'glVertex3f', 'glVertex3fv'))
+
+
+class FrameStatistics:
+    # Counts of the GL work of one frame (or of one display list)
+
+    def __init__(self):
+        self.calls = 0
+        self.draw_calls = 0
+        self.state_changes = 0
+        self.vertices = 0
+
+    def reset(self):
+        self.calls = 0
+        self.draw_calls = 0
+        self.state_changes = 0
+        self.vertices = 0
+
+    def add(self, other):
+        self.calls += other.calls
+        self.draw_calls += other.draw_calls
+        self.state_changes += other.state_changes
+        self.vertices += other.vertices
+
+    def as_dict(self):
+        return {'calls': self.calls, 'draw_calls': self.draw_calls, 'state_changes': self.state_changes, 'vertices': self.vertices}
+
+
+class PyOpenGLBackend:
+    """
+    Draws with PyOpenGL, in the GL context that is current (opened by pygame in main.run).
+
+    PyOpenGL converts array arguments to the type of the GL function. Arrays that already are contiguous arrays of that type are
+    passed on without a copy, so all arrays drawn every frame (vertex, color and texture coordinate pointers, and the matrices of
+    glMultMatrixf) are kept as contiguous float32 arrays. The glVertex3fv and glTexCoord2fv calls on the unit geometry tables do
+    convert, but they only run while display lists are compiled, once per object type and GL context.
+    """
+
+    def __init__(self, fast_mode=False):
+        """
+        :param fast_mode: Turn off the error checking, error logging and array checks PyOpenGL does on every call. Has to be chosen
+                          before PyOpenGL is imported for the first time.
+        """
+        self.fast_mode = fast_mode
+
+    def get_names(self):
+        if self.fast_mode:
+            if 'OpenGL.GL' in sys.modules:
+                print('WARNING: PyOpenGL was already imported, fast mode has no effect')
+            import OpenGL
+            OpenGL.ERROR_CHECKING = False
+            OpenGL.ERROR_LOGGING = False
+            OpenGL.CONTEXT_CHECKING = False
+            OpenGL.ARRAY_SIZE_CHECKING = False
+            # Arrays given as pointers are not kept alive by PyOpenGL anymore, they are all drawn before they go out of scope
+            OpenGL.STORE_POINTERS = False
+        from OpenGL import GL, GLU
+        names = {}
+        for module in (GL, GLU):
+            names.update({name: getattr(module, name) for name in dir(module) if name.startswith(('gl', 'GL_'))})
+        return names
+
+
+class CallCounter:
+    """
+    Counts the GL calls, draw calls, state changes and vertices per frame. Calls made while a display list is compiled are counted
+    for that list, calling the list counts its contents.
+    """
+
+    def __init__(self):
+        self.frame_statistics = FrameStatistics()
+        self.total_statistics = FrameStatistics()
+        self.frames = 0
+
+        # Display list id -> statistics of its contents, and the list that is being compiled
+        self.display_list_statistics = {}
+        self.compiling = None
+
+    def begin_frame(self):
+        # Clears the counters of the previous frame
+        self.total_statistics.add(self.frame_statistics)
+        self.frame_statistics.reset()
+        self.frames += 1
+
+    def count(self, name, arguments):
+        if name == 'glEndList':
+            self.compiling = None
+        statistics = self.frame_statistics if self.compiling is None else self.display_list_statistics[self.compiling]
+        statistics.calls += 1
+        if name in state_functions:
+            statistics.state_changes += 1
+        elif name in vertex_functions:
+            statistics.vertices += 1
+        elif name == 'glEnd':
+            statistics.draw_calls += 1
+        elif name == 'glDrawArrays':
+            statistics.draw_calls += 1
+            statistics.vertices += arguments[2]
+        elif name == 'glCallList':
+            list_statistics = self.display_list_statistics.get(arguments[0])
+            if list_statistics is not None:
+                statistics.add(list_statistics)
+        elif name == 'glNewList':
+            self.display_list_statistics[arguments[0]] = FrameStatistics()
+            self.compiling = arguments[0]
+        elif name == 'glDeleteLists':
+            for deleted_list in range(arguments[0], arguments[0] + arguments[1]):
+                self.display_list_statistics.pop(deleted_list, None)
+        return statistics
+
+
+class CountingBackend(CallCounter):
+    """
+    Wraps the GL functions of another backend to count the calls per frame, for example CountingBackend(PyOpenGLBackend()). The
+    wrapping costs some time per call, so it is meant for debugging.
+    """
+
+    def __init__(self, wrapped_backend):
+        super().__init__()
+        self.wrapped_backend = wrapped_backend
+
+    def get_names(self):
+        names = self.wrapped_backend.get_names()
+        for name, value in names.items():
+            if name.startswith('gl') and callable(value):
+                names[name] = self.wrap(name, value)
+        return names
+
+    def __getattr__(self, name):
+        # GL functions the wrapped backend only provides on request
+        if not name.startswith('gl') or name == 'wrapped_backend':
+            raise AttributeError(name)
+        return self.wrap(name, getattr(self.wrapped_backend, name))
+
+    def wrap(self, name, gl_function):
+        count = self.count
+
+        def counted_function(*arguments):
+            count(name, arguments)
+            return gl_function(*arguments)
+        return counted_function
+
+
+class RecordingBackend(CallCounter):
+    """
+    Headless backend, every GL call is appended to an in-memory command buffer as (name, arguments) instead of being drawn. Per frame
+    it counts the calls, draw calls, state changes and vertices. Display lists are recorded as well, calling one counts its contents.
+    """
+
+    # Values of the GL constants, the same as in the GL headers
+    constants = {'GL_FALSE': 0, 'GL_TRUE': 1, 'GL_LINES': 0x0001, 'GL_TRIANGLES': 0x0004, 'GL_QUADS': 0x0007, 'GL_DEPTH_BUFFER_BIT': 0x0100,
+                 'GL_COLOR_BUFFER_BIT': 0x4000, 'GL_LEQUAL': 0x0203, 'GL_SRC_ALPHA': 0x0302, 'GL_ONE_MINUS_SRC_ALPHA': 0x0303,
+                 'GL_DEPTH_TEST': 0x0B71, 'GL_BLEND': 0x0BE2, 'GL_UNPACK_ALIGNMENT': 0x0CF5, 'GL_TEXTURE_2D': 0x0DE1, 'GL_COMPILE': 0x1300,
+                 'GL_UNSIGNED_BYTE': 0x1401, 'GL_FLOAT': 0x1406, 'GL_MODELVIEW': 0x1700, 'GL_PROJECTION': 0x1701, 'GL_RGBA': 0x1908,
+                 'GL_REPLACE': 0x1E01, 'GL_TEXTURE_ENV_MODE': 0x2200, 'GL_TEXTURE_ENV': 0x2300, 'GL_NEAREST': 0x2600,
+                 'GL_TEXTURE_MAG_FILTER': 0x2800, 'GL_TEXTURE_MIN_FILTER': 0x2801, 'GL_TEXTURE_WRAP_S': 0x2802, 'GL_TEXTURE_WRAP_T': 0x2803,
+                 'GL_CLAMP': 0x2900, 'GL_VERTEX_ARRAY': 0x8074, 'GL_COLOR_ARRAY': 0x8076, 'GL_TEXTURE_COORD_ARRAY': 0x8078}
+
+    def __init__(self, keep_commands=True):
+        """
+        :param keep_commands: Keep the command buffer of the current frame, turn off to only count
+        """
+        super().__init__()
+        self.keep_commands = keep_commands
+        self.commands = []
+
+        # Recorded commands of the display lists
+        self.display_lists = {}
+        self.next_display_list = 1
+        self.next_texture = 1
+
+    def get_names(self):
+        names = dict(self.constants)
+        for name in dir(self):
+            if name.startswith('gl'):
+                names[name] = getattr(self, name)
+        return names
+
+    def __getattr__(self, name):
+        # Any other GL function is recorded as a plain call
+        if not name.startswith('gl'):
+            raise AttributeError(name)
+
+        def gl_function(*arguments):
+            self.record(name, arguments)
+        return gl_function
+
+    def begin_frame(self):
+        # Clears the command buffer and the counters of the previous frame
+        super().begin_frame()
+        self.commands = []
+
+    def record(self, name, arguments):
+        if self.compiling is not None and name != 'glEndList':
+            self.display_lists[self.compiling].append((name, arguments))
+        elif self.keep_commands:
+            self.commands.append((name, arguments))
+        self.count(name, arguments)
+        if name == 'glNewList':
+            self.display_lists[arguments[0]] = []
+
+    def glGenLists(self, count):
+        display_list = self.next_display_list
+        self.next_display_list += count
+        self.record('glGenLists', (count,))
+        return display_list
+
+    def glDeleteLists(self, display_list, count):
+        self.record('glDeleteLists', (display_list, count))
+        for deleted_list in range(display_list, display_list + count):
+            self.display_lists.pop(deleted_list, None)
+
+    def glGenTextures(self, count):
+        texture = self.next_texture
+        self.next_texture += count
+        self.record('glGenTextures', (count,))
+        return texture if count == 1 else list(range(texture, texture + count))
+
+
+# Backend the module functions are bound to, and the names that were bound for it
+backend = None
+bound_names = []
+
+
+def use_backend(new_backend):
+    """
+    Binds the GL functions and constants of this module to a backend, for example: use_backend(RecordingBackend())
+    :return: The backend
+    """
+    global backend, bound_names
+    module_globals = globals()
+    for name in bound_names:
+        module_globals.pop(name, None)
+    names = new_backend.get_names()
+    module_globals.update(names)
+    bound_names = list(names)
+    backend = new_backend
+    return new_backend
+
+
+def get_backend():
+    return backend if backend is not None else use_backend(PyOpenGLBackend())
+
+
+def __getattr__(name):
+    # Names that are not bound yet: use the default backend when none is chosen, otherwise ask the backend itself
+    if not name.startswith(('gl', 'GL_')):
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+    current_backend = get_backend()
+    module_globals = sys.modules[__name__].__dict__
+    if name in module_globals:
+        return module_globals[name]
+    return getattr(current_backend, name)
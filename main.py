@@ -9,16 +9,15 @@ for the competition project
 import pygame as pg
 from pygame.locals import *
 
-from OpenGL.GL import *
-from OpenGL.GLU import *
-from OpenGL.GLUT import *
+import graphics as gl
 
 from timeit import default_timer as timer
 
 # Local imports
-from game_util import RenderQueue, UpdateQueue, move_distance_player
-from game_objects import UIElement
+from game_util import RenderQueue, UpdateQueue, SimulationClock, move_distance_player, texture_manager
+from game_objects import UIElement, clear_display_lists
 from game import Game
+from profiler import FrameProfiler, FrameCapture, RoundMemoryReport
 
 
 def run():
@@ -29,25 +28,62 @@ def run():
     height = 1080  # pixels
     fov = 60  # deg
 
+    # Frames rendered per second at most, set to 0 to render as fast as possible
     target_frame_rate = 45
 
+    # The simulation runs in fixed ticks, independent of the frame rate. After a slow frame at most this many ticks are run to catch up
+    simulation_tick_rate = 45
+    max_ticks_per_frame = 5
+
+    # Memory that textures which are no longer used may keep occupying, before they are deleted
+    texture_budget = 64 * 2 ** 20  # bytes
+
     # Set to true to analyze timing and grid borders
     verbose_mode = True
 
+    # Turns off the error checking PyOpenGL does on every GL call, which costs a lot of time. Turn off to find GL errors.
+    gl_fast_mode = True
+
+    # Counts the GL calls, draw calls, state changes and vertices per frame, shown on screen and in the profiler in verbose mode.
+    # Every GL call is wrapped in a Python function to count it, which undoes much of the fast mode, so it is off by default.
+    count_gl_calls = False
+    gl_statistics_interval = 0.5  # seconds
+
+    # Profiling of the frame phases in verbose mode: percentiles are printed every interval, F12 writes a Chrome trace file
+    profiler_report_interval = 5  # seconds
+    profiler_trace_filename = 'frame_trace.json'
+
+    # Prints the memory and live objects before and after the end of every round, to find leaks in long sessions. Slows the game down.
+    memory_report_mode = False
+
+    # In verbose mode F11 captures the cost of every object in the queues and a cProfile of the next frames, and reports the top
+    capture_frames = 120
+    capture_report_top = 20
+
     # ------------------------
     window_size = (width, height)
 
-    target_frame_duration = target_frame_rate ** -1
-    previous_frame_duration = target_frame_duration
+    target_frame_duration = target_frame_rate ** -1 if target_frame_rate else 0
+
+    texture_manager.vram_budget = texture_budget
+    simulation_clock = SimulationClock(simulation_tick_rate, max_ticks_per_frame)
+
+    # Draw with PyOpenGL in the window opened by PyGame
+    gl_backend = gl.PyOpenGLBackend(gl_fast_mode)
+    if count_gl_calls:
+        gl_backend = gl.CountingBackend(gl_backend)
+    gl.use_backend(gl_backend)
 
     # Initialising PyGame
     pg.init()
     pg.display.set_caption('CORPORATE ESPIONAGE: THE GAME')
     pg.display.set_mode(window_size, FULLSCREEN | DOUBLEBUF | OPENGL)
+    # Display lists of an earlier GL context are not valid in the new one
+    clear_display_lists()
     # Clearing the screen
-    glClearColor(0.3, 0.3, 0.3, 0)
-    glClearDepthf(1.0)
-    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+    gl.glClearColor(0.3, 0.3, 0.3, 0)
+    gl.glClearDepthf(1.0)
+    gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
     pg.display.flip()
 
     # Loading sounds
@@ -60,17 +96,17 @@ def run():
                      pg.mixer.Sound('./assets/music/failed-004.wav')]  # Scratch
 
     # Setting the camera frustum
-    gluPerspective(fov, (window_size[0] / window_size[1]), 0.1, 100)
+    gl.gluPerspective(fov, (window_size[0] / window_size[1]), 0.1, 100)
 
     # Setting object occlusion parameters
-    glEnable(GL_DEPTH_TEST)
-    glDepthMask(GL_TRUE)
-    glDepthFunc(GL_LEQUAL)
-    glDepthRangef(0, 1)
+    gl.glEnable(gl.GL_DEPTH_TEST)
+    gl.glDepthMask(gl.GL_TRUE)
+    gl.glDepthFunc(gl.GL_LEQUAL)
+    gl.glDepthRangef(0, 1)
 
     # Setting translucency parameters
-    glEnable(GL_BLEND)
-    glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+    gl.glEnable(gl.GL_BLEND)
+    gl.glBlendFunc(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
 
     def event_handler():
         for event in pg.event.get():
@@ -81,30 +117,16 @@ def run():
                 if event.key == pg.K_ESCAPE:
                     game.end_round()
                     game.start_round()
+                if event.key == pg.K_F12 and verbose_mode:
+                    event_count = profiler.export_chrome_trace(profiler_trace_filename)
+                    print(f'Wrote {event_count} profiler events to {profiler_trace_filename}')
+                if event.key == pg.K_F11 and verbose_mode:
+                    print(f'Capturing the next {capture_frames} frames')
+                    frame_capture.start()
             else:
                 pass
         keys = pg.key.get_pressed()
         mods = pg.key.get_mods()
-        if keys[pg.K_w]:
-            if mods & pg.KMOD_SHIFT:
-                game.player.move(move_distance_player(previous_frame_duration, True), (0, 1))
-            else:
-                game.player.move(move_distance_player(previous_frame_duration, False), (0, 1))
-        if keys[pg.K_s]:
-            if mods & pg.KMOD_SHIFT:
-                game.player.move(move_distance_player(previous_frame_duration, True), (0, -1))
-            else:
-                game.player.move(move_distance_player(previous_frame_duration, False), (0, -1))
-        if keys[pg.K_a]:
-            if mods & pg.KMOD_SHIFT:
-                game.player.move(move_distance_player(previous_frame_duration, True), (1, 0))
-            else:
-                game.player.move(move_distance_player(previous_frame_duration, False), (1, 0))
-        if keys[pg.K_d]:
-            if mods & pg.KMOD_SHIFT:
-                game.player.move(move_distance_player(previous_frame_duration, True), (-1, 0))
-            else:
-                game.player.move(move_distance_player(previous_frame_duration, False), (-1, 0))
         if keys[pg.K_SPACE] and verbose_mode:
             # Induced Latency for testing purposes
             pg.time.wait(50)
@@ -113,6 +135,19 @@ def run():
             raise SystemExit
         pg.event.pump()
 
+    def move_player(tick_duration):
+        # Moves the player for one simulation tick, with the keys that are held down
+        keys = pg.key.get_pressed()
+        sprint = bool(pg.key.get_mods() & pg.KMOD_SHIFT)
+        if keys[pg.K_w]:
+            game.player.move(move_distance_player(tick_duration, sprint), (0, 1))
+        if keys[pg.K_s]:
+            game.player.move(move_distance_player(tick_duration, sprint), (0, -1))
+        if keys[pg.K_a]:
+            game.player.move(move_distance_player(tick_duration, sprint), (1, 0))
+        if keys[pg.K_d]:
+            game.player.move(move_distance_player(tick_duration, sprint), (-1, 0))
+
     running = True
 
     # Initialise render queue and update queue, for easy game tick management
@@ -120,18 +155,18 @@ def run():
     object_update_queue = UpdateQueue()
 
     # Display loading screen
-    glClearColor(0.3, 0.3, 0.3, 0)
-    glClearDepthf(1.0)
-    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-    glPushMatrix()
-    glRotatef(90, 1, 0, 0)
-    glTranslatef(-0.05, -1.9, 0)
+    gl.glClearColor(0.3, 0.3, 0.3, 0)
+    gl.glClearDepthf(1.0)
+    gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+    gl.glPushMatrix()
+    gl.glRotatef(90, 1, 0, 0)
+    gl.glTranslatef(-0.05, -1.9, 0)
     titlescreen = UIElement('assets/UI/titlescreen.png', True)
     titlescreen.set_scale((1, 1, 1.1))
     render_queue.subscribe(titlescreen)
     render_queue.run_queue()
     pg.display.flip()
-    glPopMatrix()
+    gl.glPopMatrix()
     titlescreen.deactivate()
 
     # Unload loading screen
@@ -141,20 +176,22 @@ def run():
     # Initialise game object
     game = Game(1, render_queue, object_update_queue, verbose_mode, window_size, theme_sound, succes_sound, failed_sounds)
     object_update_queue.subscribe(game)
+    if memory_report_mode:
+        game.memory_report = RoundMemoryReport()
 
     # Show waiting screen
-    glClearColor(0.3, 0.3, 0.3, 0)
-    glClearDepthf(1.0)
-    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-    glPushMatrix()
-    glRotatef(90, 1, 0, 0)
-    glTranslatef(-0.05, -1.9, 0)
+    gl.glClearColor(0.3, 0.3, 0.3, 0)
+    gl.glClearDepthf(1.0)
+    gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+    gl.glPushMatrix()
+    gl.glRotatef(90, 1, 0, 0)
+    gl.glTranslatef(-0.05, -1.9, 0)
     titlescreen_done = UIElement('assets/UI/titlescreen_done.png', True)
     titlescreen_done.set_scale((1, 1, 1.1))
     render_queue.subscribe(titlescreen_done)
     render_queue.run_queue()
     pg.display.flip()
-    glPopMatrix()
+    gl.glPopMatrix()
 
     # Unload waiting screen
     render_queue.unsubscribe(titlescreen_done)
@@ -174,58 +211,78 @@ def run():
     # Start the first round
     game.start_round()
 
-    # Timing for verbose mode
-    timing_start = 0
+    # Profiler for verbose mode, it records nothing otherwise
+    profiler = FrameProfiler(enabled=verbose_mode)
+    frame_capture = FrameCapture((render_queue, object_update_queue), capture_frames, capture_report_top)
+    previous_report = timer()
+    previous_gl_statistics = timer()
+    previous_frame_start = timer()
 
     # Game loop
     while running:
-        # Timer for framerate statistics
+        # Timer for framerate statistics, the simulation advances by the time since the start of the previous frame
         frame_start = timer()
-
-        if verbose_mode:
-            timing_start = timer()
-
-        # Handle keyboard events
-        event_handler()
-
-        if verbose_mode:
-            print('1', timer() - timing_start)
-            timing_start = timer()
-
-        # Clear screen
-        glClearColor(0.3, 0.3, 0.3, 0)
-        glClearDepthf(1.0)
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-
-        if verbose_mode:
-            print('2', timer() - timing_start)
-            timing_start = timer()
-
-        # Update all subscribed objects
-        object_update_queue.run_queue(previous_frame_duration)
-
-        if verbose_mode:
-            print('3', timer() - timing_start)
-            timing_start = timer()
-
-        # Render all subscribed objects
-        render_queue.run_queue_culled()
-        # Flip display
-        pg.display.flip()
-
-        if verbose_mode:
-            print('4', timer() - timing_start)
-            timing_start = timer()
-
-        # Framerate statistics
-        frame_duration = timer() - frame_start
-        previous_frame_duration = frame_duration
-        frame_rate = frame_duration ** -1
-        if verbose_mode:
-            print(f"target: {target_frame_duration}, frame: {frame_duration}, delay: {int((target_frame_duration - frame_duration) * 1000)}")
-            print('6', timer() - timing_start, '\n\n')
-        if frame_rate > target_frame_rate:
-            pg.time.wait(int((target_frame_duration - frame_duration) * 1000))
+        previous_frame_duration = frame_start - previous_frame_start
+        previous_frame_start = frame_start
+        profiler.next_frame()
+        frame_capture.next_frame()
+        if count_gl_calls:
+            # The GL work of the previous frame
+            gl_statistics = gl_backend.frame_statistics.as_dict()
+            profiler.record_counters(gl_statistics)
+            if frame_start - previous_gl_statistics > gl_statistics_interval:
+                game.show_statistics(gl_statistics)
+                previous_gl_statistics = frame_start
+            gl_backend.begin_frame()
+
+        with profiler.scope('frame'):
+            # Handle keyboard events
+            with profiler.scope('events'):
+                event_handler()
+
+            # Clear screen
+            with profiler.scope('clear'):
+                gl.glClearColor(0.3, 0.3, 0.3, 0)
+                gl.glClearDepthf(1.0)
+                gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+
+            # Update all subscribed objects, in as many fixed ticks as the time of the previous frame covers
+            with profiler.scope('update'):
+                if not game.round_started:
+                    for tick in range(simulation_clock.advance(previous_frame_duration)):
+                        move_player(simulation_clock.tick_duration)
+                        object_update_queue.run_queue(simulation_clock.tick_duration)
+                        if game.round_started:
+                            break
+
+                # A new round started after a blocking screen (or the Escape key): its first frame is drawn before it is simulated,
+                # and the time the screen and the map generation took is not caught up with
+                if game.round_started:
+                    game.round_started = False
+                    simulation_clock.reset()
+                    previous_frame_start = timer()
+
+                # Place the objects between their last two ticks
+                object_update_queue.interpolate(simulation_clock.get_alpha())
+
+            # Render all subscribed objects
+            with profiler.scope('render'):
+                render_queue.run_queue_culled()
+
+            # Flip display
+            with profiler.scope('flip'):
+                pg.display.flip()
+
+            # Wait for the rest of the frame when the frame rate is above the target
+            frame_duration = timer() - frame_start
+            if target_frame_rate and frame_duration < target_frame_duration:
+                with profiler.scope('sleep'):
+                    pg.time.wait(int((target_frame_duration - frame_duration) * 1000))
+
+        if verbose_mode and frame_start - previous_report > profiler_report_interval:
+            print(profiler.get_report())
+            print(simulation_clock.get_report(), '\n')
+            previous_report = frame_start
 
     # To make sure the system exits correctly
     pg.quit()
@@ -2,14 +2,88 @@ import numpy as np
 import pygame as pg
 from random import randint, choice
 
-from game_objects import SimpleObject, TextElement, UIElement
-from persons import Enemy
+from collision import CollisionGrid
+from game_objects import MeshBuilder, MeshChunk, ObjectBuilder, TextElement, UIElement, object_store
+from persons import Enemy, EnemySwarm, PersonAnimation
+from vision import GuardVision
+
+
+def greedy_rectangles(mask):
+    """
+    Merges the True cells of a 2D mask into rectangles, by growing every rectangle as wide and then as high as possible.
+    :param mask: 2D boolean array
+    :return: A list of rectangles as (row, column, number of rows, number of columns)
+    """
+    mask = mask.copy()
+    rectangles = []
+    for row in range(mask.shape[0]):
+        column = 0
+        while column < mask.shape[1]:
+            if not mask[row, column]:
+                column += 1
+                continue
+            width = 1
+            while column + width < mask.shape[1] and mask[row, column + width]:
+                width += 1
+            height = 1
+            while row + height < mask.shape[0] and mask[row + height, column:column + width].all():
+                height += 1
+            mask[row:row + height, column:column + width] = False
+            rectangles.append((row, column, height, width))
+            column += width
+    return rectangles
+
+
+def merge_walls(wall_mask):
+    # Greedy meshing in both directions, the maze has runs along rows and along columns, so keep the one with the fewest boxes
+    by_rows = greedy_rectangles(wall_mask)
+    by_columns = [(row, column, height, width) for column, row, width, height in greedy_rectangles(wall_mask.T)]
+    return by_rows if len(by_rows) <= len(by_columns) else by_columns
+
+
+def true_runs(line):
+    # Returns the (start, stop) of every run of True values in a 1D boolean array
+    edges = np.diff(np.concatenate(([0], line.astype(np.int8), [0])))
+    return list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+
+
+def dig_map_grid(map_grid, starting_point, random_generator):
+    """
+    Digs random points and tunnels in a map grid, in place. The starting row is dug through, then random cells and random horizontal
+    tunnels are dug, all drawn at once. Last, open cells without any open neighbour are closed and closed cells with only open
+    neighbours are opened, from the counts of open neighbours of all cells at once (cells outside of the map count as closed).
+    :param map_grid: 2D boolean array, True where the map is open
+    :param starting_point: (row, column) of the start, its row is dug through
+    :param random_generator: NumPy random generator
+    """
+    rows, columns = map_grid.shape
+    map_grid[starting_point[0], :] = True
+
+    # Random cells, not in the first and last column
+    point_count = int(rows * columns * 0.6)
+    map_grid[random_generator.integers(0, rows, point_count), random_generator.integers(1, columns - 1, point_count)] = True
+
+    # Random tunnels along the rows, marked by +1 at their start and -1 past their end, cut off at the edge of the map
+    tunnel_count = int(rows * columns * 0.05)
+    tunnel_rows = random_generator.integers(0, rows, tunnel_count)
+    tunnel_starts = random_generator.integers(3, columns - 3, tunnel_count)
+    tunnel_ends = np.minimum(tunnel_starts + random_generator.integers(2, int(columns / 4) + 1, tunnel_count), columns)
+    tunnel_edges = np.zeros((rows, columns + 1), np.int32)
+    np.add.at(tunnel_edges, (tunnel_rows, tunnel_starts), 1)
+    np.add.at(tunnel_edges, (tunnel_rows, tunnel_ends), -1)
+    map_grid |= np.cumsum(tunnel_edges, axis=1)[:, :columns] > 0
+
+    # Open neighbours (above, below, left and right) of every cell
+    padded_grid = np.pad(map_grid, 1).astype(np.int8)
+    open_neighbours = padded_grid[:-2, 1:-1] + padded_grid[2:, 1:-1] + padded_grid[1:-1, :-2] + padded_grid[1:-1, 2:]
+    map_grid[open_neighbours == 0] = False
+    map_grid[open_neighbours == 4] = True
 
 
 class Map:
 
     def __init__(self, render_queue, update_queue, map_grid_size=(7, 15), difficulty=0, round_number=0, wall_color=(0.15, 0.15, 0.15),
-                 ground_color=(0.5, 0.5, 0.5), debug_mode=False):
+                 ground_color=(0.5, 0.5, 0.5), debug_mode=False, bake_static_geometry=True, chunk_size=8):
         self.map_grid_size = map_grid_size
         # map_grid
         self.map_grid = np.zeros(map_grid_size).astype(bool)
@@ -23,6 +97,17 @@ class Map:
 
         self.debug_mode = debug_mode
 
+        # Static level geometry is baked into chunks of chunk_size x chunk_size grid cells, unless bake_static_geometry is False
+        self.bake_static_geometry = bake_static_geometry
+        self.chunk_size = chunk_size
+        self.chunks = {}
+        # Chunks of which cells have changed since they were baked, re-baked by update_chunks
+        self.dirty_chunks = set()
+        self.static_boxes = []
+
+        # Number of wall boxes left per chunk after merging the wall cells
+        self.wall_box_counts = {}
+
         # Generate the map using either algorithm (only digging works)
         # self.generate_map_quota_algorithm()
         self.generate_map_digging_algorithm()
@@ -50,9 +135,24 @@ class Map:
 
         self.generate_objects(render_queue)
 
+        # Walls the persons collide with, map_grid does not change anymore
+        self.collision_grid = CollisionGrid(self.map_grid)
+        # Applies the speeds of all objects at once, before the systems below
+        update_queue.subscribe(object_store, system=True)
+        # Walks the enemies of this map at once, and then animates the walk of the enemies and the player at once
+        self.enemy_swarm = EnemySwarm(self.collision_grid, update_queue)
+        self.person_animation = PersonAnimation(update_queue)
+        # Traces the vision cones of all enemies at once, after they have moved
+        self.guard_vision = GuardVision(self.map_grid, self.person_animation, update_queue)
         self.enemies = []
         for enemy in range(int(difficulty * 1.5)):
             self.enemies.append(Enemy(self, render_queue, update_queue, (difficulty + 1) / 20))
+        # Which cells the enemies can see from which, and the ways to their patrol waypoints, map_grid does not change anymore
+        self.guard_vision.build_line_of_sight()
+        self.enemy_swarm.build_navigation(self.map_grid)
+        if self.debug_mode and self.enemies:
+            print(self.guard_vision.line_of_sight.get_report())
+            print(self.enemy_swarm.navigation.get_report())
 
     def generate_map_quota_algorithm(self):
         # Fills the map in a smart way, until a specific quota of filled space has been reached (slow)
@@ -82,80 +182,16 @@ class Map:
         self.map_grid[self.ending_point] = True
 
     def generate_map_digging_algorithm(self):
-        # Digs random points and tunnels in the map
-        self.map_grid[self.starting_point] = True
-        for y_i in range(self.map_grid.shape[1]):
-            self.map_grid[self.starting_point[0], y_i] = True
-        for _ in range(int(self.map_grid.shape[0] * self.map_grid.shape[1] * 0.6)):
-            self.map_grid[randint(0, self.map_grid.shape[0] - 1), randint(1, self.map_grid.shape[1] - 2)] = True
-        for _ in range(int(self.map_grid.shape[0] * self.map_grid.shape[1] * 0.05)):
-            rand_line = randint(0, self.map_grid.shape[0] - 1), randint(3, self.map_grid.shape[1] - 4), randint(2, int(self.map_grid.shape[1] / 4)),
-            for y_i in range(0, rand_line[2]):
-                try:
-                    self.map_grid[rand_line[0]][rand_line[1] + y_i] = True
-                except IndexError:
-                    pass
-        for x_i in range(self.map_grid.shape[0]):
-            for y_i in range(self.map_grid.shape[1]):
-                try:
-                    above = self.map_grid[x_i][y_i + 1]
-                except IndexError:
-                    above = False
-                try:
-                    bellow = self.map_grid[x_i][y_i - 1]
-                except IndexError:
-                    bellow = False
-                try:
-                    left = self.map_grid[x_i + 1][y_i]
-                except IndexError:
-                    left = False
-                try:
-                    right = self.map_grid[x_i + 1][y_i]
-                except IndexError:
-                    right = False
-                if not above and not bellow and not left and not right and self.map_grid[x_i][y_i]:
-                    self.map_grid[x_i][y_i] = False
-                if above and bellow and left and right and not self.map_grid[x_i][y_i]:
-                    self.map_grid[x_i][y_i] = True
+        # Digs random points and tunnels in the map, seeded from the random module so a seeded game gets the same map
+        dig_map_grid(self.map_grid, self.starting_point, np.random.default_rng(randint(0, 2 ** 32 - 1)))
 
     def generate_objects(self, render_queue):
-        # Make left wall
-        cube = SimpleObject('solid_cube')
-        cube.transform((-1.5, 0.5, self.map_grid.shape[0] - 1))
-        cube.set_color(self.wall_color)
-        cube.set_scale((0.5, 1.4, self.map_grid.shape[0] + 1))
-        self.objects.append(cube)
-        render_queue.subscribe(cube)
-
-        # Make right wall
-        cube = SimpleObject('solid_cube')
-        cube.transform((2 * self.map_grid.shape[1] - 0.5, 0.5, self.map_grid.shape[0] - 1))
-        cube.set_color(self.wall_color)
-        cube.set_scale((0.5, 1.4, self.map_grid.shape[0] + 1))
-        self.objects.append(cube)
-        render_queue.subscribe(cube)
-
         # Entrance door
-        cube = SimpleObject('solid_cube')
-        cube.transform((-1, -0.2, self.map_grid.shape[0] - 1))
-        cube.set_scale((0.1, 0.8, 0.8))
-        cube.set_color((1, 0, 0))
-        self.objects.append(cube)
-        render_queue.subscribe(cube)
+        self.static_boxes.append(((-1, -0.2, self.map_grid.shape[0] - 1), (0.1, 0.8, 0.8), (1, 0, 0)))
 
         # Exit door
-        cube = SimpleObject('solid_cube')
-        cube.transform((2 * self.map_grid.shape[1] - 1, -0.2, self.map_grid.shape[0] - 1))
-        cube.set_scale((0.1, 0.8, 0.8))
-        cube.set_color((0, 1, 0))
-        self.objects.append(cube)
-        render_queue.subscribe(cube)
-        cube = SimpleObject('solid_cube')
-        cube.transform((2 * self.map_grid.shape[1] - 2, -1, self.map_grid.shape[0] - 1))
-        cube.set_scale((0.8, 0.1, 0.8))
-        cube.set_color((0, 1, 0))
-        self.objects.append(cube)
-        render_queue.subscribe(cube)
+        self.static_boxes.append(((2 * self.map_grid.shape[1] - 1, -0.2, self.map_grid.shape[0] - 1), (0.1, 0.8, 0.8), (0, 1, 0)))
+        self.static_boxes.append(((2 * self.map_grid.shape[1] - 2, -1, self.map_grid.shape[0] - 1), (0.8, 0.1, 0.8), (0, 1, 0)))
 
         # Place key
         self.key_map = UIElement('assets/UI/key.png')
@@ -164,66 +200,163 @@ class Map:
         self.key_map.activate()
         render_queue.subscribe(self.key_map)
 
-        # Place a cube for every wall
-        for y_i in range(self.map_grid.shape[1]):
-            # Make top wall
-            cube = SimpleObject('solid_cube')
-            cube.transform((2 * y_i, 0.5, -1.5))
-            cube.set_color(self.wall_color)
-            cube.set_scale((1, 1.4, 0.5))
-            self.objects.append(cube)
-            render_queue.subscribe(cube)
-
-            # Make Bottom wall
-            cube = SimpleObject('solid_cube')
-            cube.transform((2 * y_i, 0.5, 2 * self.map_grid.shape[0] - 0.5))
-            cube.set_color(self.wall_color)
-            cube.set_scale((1, 1.4, 0.5))
-            self.objects.append(cube)
-            render_queue.subscribe(cube)
-
-            for x_i in range(self.map_grid.shape[0]):
-                if not self.map_grid[x_i][y_i]:
-                    # Place cube if there is a wall
-                    cube = SimpleObject('solid_cube')
-                    cube.transform((2 * y_i, 0, 2 * x_i))
-                    cube.set_color(self.wall_color)
-                    # cube.set_texture('./assets/textures/wall.png')
-                    self.objects.append(cube)
-                    render_queue.subscribe(cube)
-
-                    # Decorations
-                    plane = SimpleObject('wire_plane')
-                    plane.transform((2 * y_i, -0.99, 2 * x_i))
-                    plane.set_scale((1.01, 1, 1.01))
-                    self.objects.append(plane)
-                    render_queue.subscribe(plane)
-
-                    plane = SimpleObject('wire_plane')
-                    plane.transform((2 * y_i, 0.99, 2 * x_i))
-                    plane.set_scale((1.01, 1, 1.01))
-                    self.objects.append(plane)
-                    render_queue.subscribe(plane)
-
+        if not self.bake_static_geometry:
+            # Place a separate object for every part of the level
+            object_builder = ObjectBuilder()
+            for chunk_index in self.get_chunk_indices():
+                self.build_chunk_geometry(object_builder, chunk_index)
+            for static_object in object_builder.objects:
+                self.objects.append(static_object)
+                render_queue.subscribe(static_object)
+            if self.debug_mode:
+                print(self.get_wall_merge_report())
+            return
+
+        # Bake the level into chunks, which are rendered and culled as a whole
+        for chunk_index in self.get_chunk_indices():
+            rows, columns = self.get_chunk_slices(chunk_index)
+            # Chunks are padded by one unit, for the outer walls and doors
+            chunk = MeshChunk((columns.start + columns.stop - 1, 0, rows.start + rows.stop - 1),
+                              (columns.stop - columns.start + 1, rows.stop - rows.start + 1))
+            self.chunks[chunk_index] = chunk
+            self.bake_chunk(chunk_index)
+            self.objects.append(chunk)
+            render_queue.subscribe(chunk)
+
+        if self.debug_mode:
+            print(self.get_wall_merge_report())
+
+    def get_wall_merge_report(self):
+        wall_cell_count = int(np.sum(np.invert(self.map_grid)))
+        wall_box_count = sum(self.wall_box_counts.values())
+        return f"Wall merging: {wall_cell_count} wall cells in {wall_box_count} boxes " \
+               f"({wall_cell_count / max(wall_box_count, 1):.1f} times fewer)"
+
+    def get_chunk_indices(self):
+        return [(chunk_row, chunk_column)
+                for chunk_row in range(int(np.ceil(self.map_grid.shape[0] / self.chunk_size)))
+                for chunk_column in range(int(np.ceil(self.map_grid.shape[1] / self.chunk_size)))]
+
+    def get_chunk_slices(self, chunk_index):
+        # Returns the map_grid rows and columns covered by a chunk
+        return (slice(chunk_index[0] * self.chunk_size, min((chunk_index[0] + 1) * self.chunk_size, self.map_grid.shape[0])),
+                slice(chunk_index[1] * self.chunk_size, min((chunk_index[1] + 1) * self.chunk_size, self.map_grid.shape[1])))
+
+    def get_chunk_of_location(self, location):
+        grid_index = (int((location[2] + 1) // 2), int((location[0] + 1) // 2))
+        return (int(np.clip(grid_index[0], 0, self.map_grid.shape[0] - 1)) // self.chunk_size,
+                int(np.clip(grid_index[1], 0, self.map_grid.shape[1] - 1)) // self.chunk_size)
+
+    def build_chunk_geometry(self, builder, chunk_index):
+        # Adds all static geometry of the chunk to the builder, either a MeshBuilder or an ObjectBuilder
+        rows, columns = self.get_chunk_slices(chunk_index)
+        white = (1, 1, 1)
+
+        # Make top and bottom wall, one box along the width of the chunk. Only the top and the side facing the level can be seen,
+        # the ends are covered by the next piece of wall or by the left and right wall
+        wall_center, wall_size = columns.start + columns.stop - 1, columns.stop - columns.start
+        if rows.start == 0:
+            builder.add_box((wall_center, 0.5, -1.5), (wall_size, 1.4, 0.5), self.wall_color, faces=('y+', 'z+'))
+        if rows.stop == self.map_grid.shape[0]:
+            builder.add_box((wall_center, 0.5, 2 * self.map_grid.shape[0] - 0.5), (wall_size, 1.4, 0.5), self.wall_color, faces=('y+', 'z-'))
+
+        # Make left and right wall, one box along the height of the chunk, the first and last chunks also cover the corners
+        wall_start = -2 if rows.start == 0 else 2 * rows.start - 1
+        wall_end = 2 * self.map_grid.shape[0] if rows.stop == self.map_grid.shape[0] else 2 * rows.stop - 1
+        wall_center, wall_size = (wall_start + wall_end) / 2, (wall_end - wall_start) / 2
+        if columns.start == 0:
+            builder.add_box((-1.5, 0.5, wall_center), (0.5, 1.4, wall_size), self.wall_color, faces=('y+', 'x+'))
+        if columns.stop == self.map_grid.shape[1]:
+            builder.add_box((2 * self.map_grid.shape[1] - 0.5, 0.5, wall_center), (0.5, 1.4, wall_size), self.wall_color, faces=('y+', 'x-'))
+
+        for x_i in range(rows.start, rows.stop):
+            for y_i in range(columns.start, columns.stop):
                 if self.map_grid[x_i][y_i]:
                     # Make ground plane
-                    ground_plane = SimpleObject('solid_plane')
-                    ground_plane.transform((2 * y_i, -1, 2 * x_i))
-                    ground_plane.set_color(self.ground_color)
-                    # ground_plane.set_texture('./assets/textures/ground.png')
-                    self.objects.append(ground_plane)
-                    render_queue.subscribe(ground_plane)
+                    builder.add_plane((2 * y_i, -1, 2 * x_i), (1, 1, 1), self.ground_color)
                     if self.debug_mode:
-                        cube = SimpleObject('wire_cube')
-                        cube.transform((2 * y_i, 0, 2 * x_i))
-                        cube.set_color(self.wall_color)
-                        self.objects.append(cube)
-                        render_queue.subscribe(cube)
+                        builder.add_wire_box((2 * y_i, 0, 2 * x_i), (1, 1, 1), white)
+                else:
+                    # Decorations, the outline of every wall cell stays visible when the walls are merged into boxes
+                    builder.add_wire_plane((2 * y_i, -0.99, 2 * x_i), (1.01, 1, 1.01), white)
+                    builder.add_wire_plane((2 * y_i, 0.99, 2 * x_i), (1.01, 1, 1.01), white)
+
+        # Place a box for every rectangle of wall cells
+        wall_boxes = merge_walls(np.invert(self.map_grid[rows, columns]))
+        # Open cells around the map, cells outside of the map are covered by the outer walls
+        padded_grid = np.pad(self.map_grid, 1)
+        for row, column, height, width in wall_boxes:
+            self.add_wall_box(builder, padded_grid, (rows.start + row, columns.start + column), (height, width))
+        self.wall_box_counts[chunk_index] = len(wall_boxes)
+
+        for location, size, color in self.static_boxes:
+            if self.get_chunk_of_location(location) == chunk_index:
+                builder.add_box(location, size, color)
+
+    def add_wall_box(self, builder, padded_grid, grid_index, grid_size):
+        """
+        Adds a box of wall cells, with only the faces that can be seen. The top is always visible and the bottom never is. The sides
+        are only visible where the neighbouring cells are open, a side that is partly visible is split into a separate face per run.
+        :param builder: MeshBuilder or ObjectBuilder
+        :param padded_grid: map_grid padded with a border of walls, so neighbours can be looked up without bounds checks
+        :param grid_index: (row, column) of the first cell of the box
+        :param grid_size: (rows, columns) of the box
+        """
+        (x_i, y_i), (height, width) = grid_index, grid_size
+        location = (2 * y_i + width - 1, 0, 2 * x_i + height - 1)
+        # The open cells next to every side, in padded coordinates the box starts at (x_i + 1, y_i + 1)
+        sides = {'z-': padded_grid[x_i, y_i + 1:y_i + width + 1],
+                 'z+': padded_grid[x_i + height + 1, y_i + 1:y_i + width + 1],
+                 'x-': padded_grid[x_i + 1:x_i + height + 1, y_i],
+                 'x+': padded_grid[x_i + 1:x_i + height + 1, y_i + width + 1]}
+        faces = ['y+']
+        for side, open_cells in sides.items():
+            runs = true_runs(open_cells)
+            if len(runs) == 1 and runs[0][1] - runs[0][0] == len(open_cells):
+                faces.append(side)
+                continue
+            for start, stop in runs:
+                if side[0] == 'z':
+                    builder.add_box((2 * (y_i + start) + (stop - start) - 1, 0, location[2]), (stop - start, 1, height), self.wall_color,
+                                    faces=(side,))
+                else:
+                    builder.add_box((location[0], 0, 2 * (x_i + start) + (stop - start) - 1), (width, 1, stop - start), self.wall_color,
+                                    faces=(side,))
+        builder.add_box(location, (width, 1, height), self.wall_color, faces=tuple(faces))
+
+    def bake_chunk(self, chunk_index):
+        mesh_builder = MeshBuilder()
+        self.build_chunk_geometry(mesh_builder, chunk_index)
+        self.chunks[chunk_index].set_geometry(mesh_builder)
+
+    def set_cell(self, grid_index, is_open):
+        """
+        Opens or closes a cell of map_grid after the map was built. The chunk of the cell and the chunks with a cell next to it (of
+        which the visible wall faces depend on it) are re-baked on the next update_chunks. Only baked chunks follow the change, the
+        collision grid, line of sight and navigation of the map are built once.
+        :param grid_index: (row, column) of the cell
+        :param is_open: True to open the cell, False to make it a wall
+        """
+        if self.map_grid[grid_index] == is_open:
+            return
+        self.map_grid[grid_index] = is_open
+        if not self.bake_static_geometry:
+            return
+        for row in range(max(grid_index[0] - 1, 0), min(grid_index[0] + 2, self.map_grid.shape[0])):
+            for column in range(max(grid_index[1] - 1, 0), min(grid_index[1] + 2, self.map_grid.shape[1])):
+                self.dirty_chunks.add((row // self.chunk_size, column // self.chunk_size))
+
+    def update_chunks(self):
+        # Re-bakes only the chunks of which cells were changed with set_cell since they were baked
+        for chunk_index in self.dirty_chunks:
+            self.bake_chunk(chunk_index)
+        self.dirty_chunks.clear()
 
     def make_object(self):
         pass
 
     def set_player_object(self, player_object):
+        self.guard_vision.set_player_object(player_object)
         for enemy in self.enemies:
             enemy.set_player_object(player_object)
 
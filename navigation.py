@@ -0,0 +1,112 @@
+"""
+Navigation of the guards over map_grid. A flow field holds, for every open cell, the step to the next cell on the shortest way to a
+target cell. The flow fields of the patrol waypoints are computed once per map and shared by all guards walking to the same waypoint,
+so following a path costs one lookup per guard per tick.
+"""
+
+from timeit import default_timer as timer
+
+import numpy as np
+
+
+# Steps (rows, columns) a guard can take to a neighbouring cell, the first one is staying in its cell
+step_offsets = np.array(((0, 0), (-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)))
+step_offset_tuples = tuple(map(tuple, step_offsets.tolist()))
+
+
+def get_distance_maps(map_grid, targets):
+    """
+    Breadth first search from many target cells at once, over the open cells of map_grid in the 4 directions. Only the frontiers are
+    kept, as flat indices into a stack of padded grids, so every step costs as much as the cells it reaches.
+    :param map_grid: 2D boolean array, True where the map is open
+    :param targets: (targets, 2) array of open (row, column) cells
+    :return: (targets, rows, columns) array with the number of steps to the target, -1 for cells from which it cannot be reached
+    """
+    # The closed border keeps the searches inside their own grid of the stack
+    padded_grid = np.pad(map_grid, 1)
+    rows, columns = padded_grid.shape
+    open_cells = padded_grid.ravel()
+    neighbour_steps = np.array((-columns, columns, -1, 1))
+
+    distances = np.full(len(targets) * padded_grid.size, -1, np.int32)
+    frontier = np.arange(len(targets)) * padded_grid.size + (targets[:, 0] + 1) * columns + targets[:, 1] + 1
+    distances[frontier] = 0
+    steps = 0
+    while len(frontier):
+        steps += 1
+        reached = (frontier[:, np.newaxis] + neighbour_steps).ravel()
+        reached = reached[open_cells[reached % padded_grid.size]]
+        frontier = np.unique(reached[distances[reached] < 0])
+        distances[frontier] = steps
+    return distances.reshape(len(targets), rows, columns)[:, 1:-1, 1:-1]
+
+
+def get_flow_fields(map_grid, distance_maps):
+    """
+    :param map_grid: 2D boolean array, True where the map is open
+    :param distance_maps: (targets, rows, columns) array of get_distance_maps
+    :return: (targets, rows, columns) array with the index in step_offsets of the step to the neighbouring cell closest to the target.
+             Diagonal steps are only taken when both cells beside them are open, so no corner of a wall is cut. Targets and cells
+             that cannot reach the target stay in place.
+    """
+    unreachable = np.iinfo(np.int32).max
+    padded_distances = np.pad(np.where(distance_maps >= 0, distance_maps, unreachable), ((0, 0), (1, 1), (1, 1)),
+                              constant_values=unreachable)
+    padded_grid = np.pad(map_grid, 1)
+    rows, columns = map_grid.shape
+
+    best_distances = padded_distances[:, 1:-1, 1:-1].copy()
+    flow_fields = np.zeros(distance_maps.shape, np.int8)
+    for step_index, (row_offset, column_offset) in enumerate(step_offsets[1:], 1):
+        distances = padded_distances[:, 1 + row_offset:1 + row_offset + rows, 1 + column_offset:1 + column_offset + columns]
+        closer = distances < best_distances
+        if row_offset and column_offset:
+            closer &= padded_grid[1 + row_offset:1 + row_offset + rows, 1:-1] & padded_grid[1:-1, 1 + column_offset:1 + column_offset + columns]
+        best_distances[closer] = distances[closer]
+        flow_fields[closer] = step_index
+    return flow_fields
+
+
+class Navigation:
+    """
+    Flow fields to the patrol waypoints of a map. map_grid does not change during a round, so they are computed when waypoints are
+    added and then only looked up.
+    """
+
+    def __init__(self, map_grid, waypoints):
+        """
+        :param map_grid: 2D boolean array, True where the map is open
+        :param waypoints: Open (row, column) cells
+        """
+        self.map_grid = map_grid
+        self.waypoints = np.zeros((0, 2), np.intp)
+        self.reachable = np.zeros((0,) + map_grid.shape, bool)
+        self.flow_fields = np.zeros((0,) + map_grid.shape, np.int8)
+        self.build_time = 0
+        self.add_waypoints(waypoints)
+
+    def add_waypoints(self, waypoints):
+        start = timer()
+        waypoints = np.asarray(waypoints, np.intp).reshape(-1, 2)
+        distance_maps = get_distance_maps(self.map_grid, waypoints)
+        self.waypoints = np.concatenate((self.waypoints, waypoints))
+        self.reachable = np.concatenate((self.reachable, distance_maps >= 0))
+        self.flow_fields = np.concatenate((self.flow_fields, get_flow_fields(self.map_grid, distance_maps)))
+        self.build_time += timer() - start
+
+    def get_next_cells(self, waypoint_indices, cells):
+        # The cells to walk to from the (n, 2) array of cells, on the way to the waypoints with the (n,) indices
+        return cells + step_offsets[self.flow_fields[waypoint_indices, cells[:, 0], cells[:, 1]]]
+
+    def get_next_cell(self, waypoint_index, row, column):
+        # get_next_cells for a single cell, as a (row, column) tuple of ints
+        step_row, step_column = step_offset_tuples[self.flow_fields.item(waypoint_index, row, column)]
+        return row + step_row, column + step_column
+
+    def get_reachable_waypoints(self, cells):
+        # (n, waypoints) boolean array of the waypoints that can be reached from every one of the (n, 2) array of cells
+        return self.reachable[:, cells[:, 0], cells[:, 1]].T
+
+    def get_report(self):
+        return f"Navigation: {len(self.waypoints)} waypoints in {(self.reachable.nbytes + self.flow_fields.nbytes) / 1024:.1f} KiB, " \
+               f"built in {self.build_time * 1000:.1f} ms"
@@ -1,10 +1,11 @@
 from game_objects import SimpleObject, Parent, TextElement
 from game_util import move_distance_enemy
+from navigation import Navigation
 
+from math import hypot
 from random import uniform, randint, choice
 import numpy as np
-import copy
-from OpenGL.GL import *
+import graphics as gl
 
 
 def get_grid_index(position):
@@ -21,24 +22,287 @@ def get_location(location, distance, direction, bounding_box=0):
             location[1] - (direction[1] * (distance + abs(bounding_box))))
 
 
+class PersonAnimation:
+    """
+    Walk animation of all persons of a map, updated in one vectorized step per tick: the heading, the swing of the arms and legs
+    (limp rotation) and the states rendering interpolates between. The state of every person is a row of preallocated arrays, and the
+    step writes into preallocated scratch arrays, so a tick allocates no array data. Interpolation works the same way, only the
+    placing of the bodies gets the interpolated states as Python floats.
+    """
+
+    def __init__(self, update_queue, capacity=32):
+        self.persons = []
+        self.capacity = 0
+
+        # Arrays with one row per person, (name, columns)
+        self.array_shapes = (('location', 2), ('previous_location', 2), ('rotation', 1), ('previous_target_rotation', 1),
+                             ('limp_rotation', 1), ('limp_rotation_target', 1), ('rotation_speed', 1), ('leg_rotation_speed', 1),
+                             ('previous_state', 4), ('state', 4), ('render_state', 4),
+                             ('delta', 2), ('absolute_delta', 2), ('distance', 1), ('target_rotation', 1), ('scratch', 1))
+        self.mask_shapes = (('moved', 2), ('moving', 1), ('standing', 1), ('mask', 1))
+        for name, columns in self.array_shapes + self.mask_shapes:
+            setattr(self, name, np.zeros((0, columns) if columns > 1 else 0, bool if (name, columns) in self.mask_shapes else np.float64))
+        self.grow(capacity)
+
+        # Updated after all persons have moved in a tick, and interpolated before anything follows the persons
+        update_queue.subscribe(self, system=True)
+
+    def grow(self, capacity):
+        for name, columns in self.array_shapes + self.mask_shapes:
+            old_array = getattr(self, name)
+            new_array = np.zeros((capacity,) + old_array.shape[1:], old_array.dtype)
+            new_array[:self.capacity] = old_array
+            setattr(self, name, new_array)
+        self.capacity = capacity
+
+    def add(self, person, starting_location):
+        # Returns the row of the person
+        row = len(self.persons)
+        if row == self.capacity:
+            self.grow(self.capacity * 2)
+        self.persons.append(person)
+        self.location[row] = starting_location
+        self.previous_location[row] = starting_location
+        self.rotation[row] = 180
+        self.previous_target_rotation[row] = 180
+        self.limp_rotation[row] = 0
+        self.limp_rotation_target[row] = 45
+        self.rotation_speed[row] = 0.2
+        self.leg_rotation_speed[row] = 100
+        self.state[row] = (starting_location[0], starting_location[1], 180, 0)
+        self.previous_state[row] = self.state[row]
+        return row
+
+    def update_object(self, tick_duration):
+        count = len(self.persons)
+        if not count:
+            return
+        location, previous_location, delta = self.location[:count], self.previous_location[:count], self.delta[:count]
+        rotation, target_rotation, scratch = self.rotation[:count], self.target_rotation[:count], self.scratch[:count]
+        limp_rotation, limp_rotation_target = self.limp_rotation[:count], self.limp_rotation_target[:count]
+        moving, standing, mask = self.moving[:count], self.standing[:count], self.mask[:count]
+
+        # The locations are Python lists on the persons, which their movement and collision code works with fastest
+        for row, person in enumerate(self.persons):
+            location[row, 0], location[row, 1] = person.location
+        # Persons that moved more than 0.005 along x or z since the last tick walk, the others stand still
+        np.subtract(previous_location, location, out=delta)
+        np.abs(delta, out=self.absolute_delta[:count])
+        np.greater(self.absolute_delta[:count], 0.005, out=self.moved[:count])
+        np.logical_or(self.moved[:count, 0], self.moved[:count, 1], out=moving)
+        np.logical_not(moving, out=standing)
+
+        # Walking persons head in the direction they moved, standing persons keep their heading
+        np.arctan2(delta[:, 1], delta[:, 0], out=target_rotation)
+        np.rad2deg(target_rotation, out=target_rotation)
+        np.negative(target_rotation, out=target_rotation)
+        np.copyto(target_rotation, self.previous_target_rotation[:count], where=standing)
+
+        # The limbs swing between -45 and 45 degrees while walking, turning around at the ends, and stop while standing
+        np.equal(limp_rotation_target, 0, out=mask)
+        np.copyto(limp_rotation_target, 45, where=mask)
+        np.greater_equal(limp_rotation, 45, out=mask)
+        np.copyto(limp_rotation_target, -45, where=mask)
+        np.less_equal(limp_rotation, -45, out=mask)
+        np.copyto(limp_rotation_target, 45, where=mask)
+        np.copyto(limp_rotation_target, 0, where=standing)
+        # Rotation += leg speed * target / 45 * distance walked
+        np.hypot(delta[:, 0], delta[:, 1], out=self.distance[:count])
+        np.multiply(self.leg_rotation_speed[:count], limp_rotation_target, out=scratch)
+        np.multiply(scratch, self.distance[:count], out=scratch)
+        np.divide(scratch, 45, out=scratch)
+        np.add(limp_rotation, scratch, out=limp_rotation)
+
+        # Turn a part of the way to the target heading, the short way around
+        np.subtract(target_rotation, rotation, out=scratch)
+        np.greater(scratch, 180, out=mask)
+        np.add(rotation, 360, out=rotation, where=mask)
+        np.subtract(target_rotation, rotation, out=scratch)
+        np.less(scratch, -180, out=mask)
+        np.subtract(rotation, 360, out=rotation, where=mask)
+        np.subtract(target_rotation, rotation, out=scratch)
+        np.multiply(scratch, self.rotation_speed[:count], out=scratch)
+        np.add(rotation, scratch, out=rotation)
+
+        previous_location[:] = location
+        self.previous_target_rotation[:count] = target_rotation
+
+        # States of the last two ticks, rendering interpolates between them
+        state = self.state[:count]
+        self.previous_state[:count] = state
+        state[:, :2] = location
+        state[:, 2] = rotation
+        state[:, 3] = limp_rotation
+
+    def interpolate(self, alpha):
+        # Places every body between the states of its last two ticks, alpha is the fraction of a tick the frame is past the last one
+        count = len(self.persons)
+        if not count:
+            return
+        render_state = self.render_state[:count]
+        np.subtract(self.state[:count], self.previous_state[:count], out=render_state)
+        # Rotations are interpolated the short way around
+        rotation_difference = render_state[:, 2]
+        np.add(rotation_difference, 180, out=rotation_difference)
+        np.mod(rotation_difference, 360, out=rotation_difference)
+        np.subtract(rotation_difference, 180, out=rotation_difference)
+        np.multiply(render_state, alpha, out=render_state)
+        np.add(render_state, self.previous_state[:count], out=render_state)
+        for person, person_render_state in zip(self.persons, render_state.tolist()):
+            person.place_body(person_render_state)
+
+
+class EnemySwarm:
+    """
+    Walking of all enemies of a map in one vectorized step per tick. The location and patrol waypoint of every enemy are a row of
+    NumPy arrays. Every enemy walks to the center of the next cell on the flow field of its waypoint, and picks another waypoint it
+    can reach at random when it has arrived. The random draws of all enemies come from one NumPy generator. The locations are written
+    back to the enemies, for their bodies, names and vision.
+
+    A swarm of fewer than small_swarm_size enemies is walked one enemy at a time in plain Python instead, which costs less than the
+    fixed cost of the array operations, and takes the same steps up to rounding.
+    """
+
+    small_swarm_size = 10
+
+    def __init__(self, collision_grid, update_queue, capacity=32):
+        self.enemies = []
+        self.capacity = 0
+        self.collision_grid = collision_grid
+        self.navigation = None
+        # Seeded from the random module, so a seeded game plays the same
+        self.random = np.random.default_rng(randint(0, 2 ** 32 - 1))
+
+        self.location = np.zeros((0, 2))
+        self.waypoint = np.zeros(0, np.intp)
+        self.grow(capacity)
+
+        # Updated before the animation and vision of the persons in a tick
+        update_queue.subscribe(self, system=True)
+
+    def grow(self, capacity):
+        for name in ('location', 'waypoint'):
+            old_array = getattr(self, name)
+            new_array = np.zeros((capacity,) + old_array.shape[1:], old_array.dtype)
+            new_array[:self.capacity] = old_array
+            setattr(self, name, new_array)
+        self.capacity = capacity
+
+    def add(self, enemy, starting_location):
+        # Returns the row of the enemy
+        row = len(self.enemies)
+        if row == self.capacity:
+            self.grow(self.capacity * 2)
+        self.enemies.append(enemy)
+        self.location[row] = starting_location
+        self.waypoint[row] = -1
+        return row
+
+    def build_navigation(self, map_grid, waypoint_count=8):
+        # Call once all enemies are added. The waypoints are open cells at random, an enemy that can reach none of them guards the
+        # cell it started in instead
+        count = len(self.enemies)
+        if not count:
+            return
+        open_cells = np.argwhere(map_grid)
+        waypoints = open_cells[self.random.choice(len(open_cells), min(waypoint_count, len(open_cells)), replace=False)]
+        self.navigation = Navigation(map_grid, waypoints)
+        cells = self.get_cells(self.location[:count])
+        stranded = ~self.navigation.get_reachable_waypoints(cells).any(axis=1)
+        if stranded.any():
+            self.navigation.add_waypoints(np.unique(cells[stranded], axis=0))
+        self.choose_waypoints(np.arange(count), cells)
+
+    @staticmethod
+    def get_cells(locations):
+        # (row, column) of the cells of an (n, 2) array of (x, z) locations
+        return np.floor((locations[:, ::-1] + 1) / 2).astype(np.intp)
+
+    def choose_waypoints(self, rows, cells):
+        # Another waypoint for every row, at random out of the ones that can be reached from its cell. Without any, it keeps its own.
+        candidates = self.navigation.get_reachable_waypoints(cells)
+        current_waypoints = self.waypoint[rows]
+        has_waypoint = current_waypoints >= 0
+        candidates[np.flatnonzero(has_waypoint), current_waypoints[has_waypoint]] = False
+        cumulative_candidates = np.cumsum(candidates, axis=1)
+        draws = (self.random.random(len(rows)) * cumulative_candidates[:, -1]).astype(np.intp)
+        chosen = (cumulative_candidates <= draws[:, np.newaxis]).sum(axis=1)
+        self.waypoint[rows] = np.where(cumulative_candidates[:, -1] > 0, chosen, self.waypoint[rows])
+
+    def update_object(self, tick_duration):
+        count = len(self.enemies)
+        if not count or self.navigation is None:
+            return
+        if count < self.small_swarm_size:
+            self.walk_enemies(tick_duration)
+            return
+        location = self.location[:count]
+        cells = self.get_cells(location)
+        next_cells = self.navigation.get_next_cells(self.waypoint[:count], cells)
+        way = 2 * next_cells[:, ::-1] - location
+        way_length = np.hypot(way[:, 0], way[:, 1])
+        distance = move_distance_enemy(tick_duration)
+
+        # Enemies at the center of their waypoint pick the next one
+        arrived = (next_cells[:, 0] == cells[:, 0]) & (next_cells[:, 1] == cells[:, 1]) & (way_length <= distance)
+        if np.count_nonzero(arrived):
+            rows = np.flatnonzero(arrived)
+            self.choose_waypoints(rows, cells[rows])
+
+        moves = way * (np.minimum(way_length, distance) / np.maximum(way_length, 1e-9))[:, np.newaxis]
+        location[:] = self.collision_grid.slide(location, moves, Person.collision_radius)
+
+        for enemy, (location_x, location_z) in zip(self.enemies, location.tolist()):
+            enemy.location[0] = location_x
+            enemy.location[1] = location_z
+
+    def walk_enemies(self, tick_duration):
+        # update_object for a small swarm. CollisionGrid.move only slides enemies that the distance field does not show as clear.
+        distance = move_distance_enemy(tick_duration)
+        for row, enemy in enumerate(self.enemies):
+            location_x, location_z = self.location[row].tolist()
+            cell_row, cell_column = int((location_z + 1) // 2), int((location_x + 1) // 2)
+            next_row, next_column = self.navigation.get_next_cell(self.waypoint.item(row), cell_row, cell_column)
+            way_x, way_z = 2 * next_column - location_x, 2 * next_row - location_z
+            way_length = hypot(way_x, way_z)
+
+            if next_row == cell_row and next_column == cell_column and way_length <= distance:
+                self.choose_waypoints(np.array((row,)), np.array(((cell_row, cell_column),)))
+
+            scale = min(way_length, distance) / max(way_length, 1e-9)
+            location_x, location_z = self.collision_grid.move((location_x, location_z), (way_x * scale, way_z * scale),
+                                                              Person.collision_radius)
+            self.location[row] = location_x, location_z
+            enemy.location[0] = location_x
+            enemy.location[1] = location_z
+
+
+def animation_property(name):
+    # State of a person kept in the arrays of the person animation
+    def get_value(self):
+        return getattr(self.animation, name).item(self.animation_row)
+
+    def set_value(self, value):
+        getattr(self.animation, name)[self.animation_row] = value
+    return property(get_value, set_value)
+
+
 class Person:
 
+    # Persons collide with the walls as a circle of this radius
+    collision_radius = 0.25
+
     def __init__(self, map_object, render_queue, update_queue, color, starting_location):
         self.location = starting_location
-        self.rotation = 180
+        self.animation = map_object.person_animation
+        self.animation_row = self.animation.add(self, starting_location)
         self.map_grid = map_object.map_grid
+        self.collision_grid = map_object.collision_grid
         self.render_queue = render_queue
         self.update_queue = update_queue
 
         self.color = color
 
-        self.rotation_speed = 0.2
-
-        self.limp_rotation = 0
-        self.previous_limp_rotation = 0
-        self.limp_rotation_target = 45
-        self.leg_rotation_speed = 100
-
         self.body = Parent()
 
         self.torso = SimpleObject('solid_cube')
@@ -102,59 +366,32 @@ class Person:
         self.body.add_child(self.leg_jointR)
         self.body.add_child(self.head)
 
-        self.previous_location = copy.deepcopy(self.location)
-        self.previous_rotation = copy.deepcopy(self.rotation)
-        self.previous_target_rotation = copy.deepcopy(self.rotation)
-
-        render_queue.subscribe(self.body)
-        update_queue.subscribe(self)
-
-    def update_object(self, previous_frame_duration):
-        self.body.set_location((self.location[0], -0.5, self.location[1]))
-        if abs(self.location[0] - self.previous_location[0]) > 0.005 or abs(self.location[1] - self.previous_location[1]) > 0.005:
-            target_rotation = -np.rad2deg(np.arctan2(self.previous_location[1] - self.location[1], self.previous_location[0] - self.location[0]))
-            if self.limp_rotation_target == 0:
-                self.limp_rotation_target = 45
-            if self.limp_rotation >= 45:
-                self.limp_rotation_target = -45
-            if self.limp_rotation <= -45:
-                self.limp_rotation_target = 45
-            self.limp_rotation = self.previous_limp_rotation + (self.leg_rotation_speed *
-                                                                self.limp_rotation_target / 45 *
-                                                                np.sqrt((self.location[0] - self.previous_location[0]) ** 2 +
-                                                                        (self.location[1] - self.previous_location[1]) ** 2))
-        else:
-            self.limp_rotation_target = 0
-            self.limp_rotation = self.previous_limp_rotation + (self.leg_rotation_speed * - self.limp_rotation_target / 90)
-            target_rotation = copy.deepcopy(self.previous_target_rotation)
-        if (target_rotation - self.previous_rotation) > 180:
-            self.previous_rotation += 360
-        if (target_rotation - self.previous_rotation) < -180:
-            self.previous_rotation -= 360
-        self.rotation = self.previous_rotation + self.rotation_speed * (target_rotation - self.previous_rotation)
-        self.leg_jointR.set_rotation((0, 0, self.limp_rotation))
-        self.leg_jointL.set_rotation((0, 180, self.limp_rotation))
-        self.arm_jointR.set_rotation((0, 0, self.limp_rotation * 0.6))
-        self.arm_jointL.set_rotation((0, 180, self.limp_rotation * 0.6))
-        self.body.set_rotation((0, self.rotation, 0))
-        self.previous_location = copy.deepcopy(self.location)
-        self.previous_rotation = copy.deepcopy(self.rotation)
-        self.previous_limp_rotation = copy.deepcopy(self.limp_rotation)
-        self.previous_target_rotation = copy.deepcopy(target_rotation)
+        self.render_location = None
+        self.place_body(self.animation.state[self.animation_row].tolist())
 
-    def move(self, distance, direction):
-        if not self.check_collision(distance, direction, 0.25):
-            self.location[0] -= direction[0] * distance
-            self.location[1] -= direction[1] * distance
+        render_queue.subscribe(self.body, dynamic=True)
 
-    def check_collision(self, distance, direction, bounding_box):
-        new_position = get_location(self.location, distance, direction, bounding_box)
+    # Walking state, animated for all persons at once by PersonAnimation
+    rotation = animation_property('rotation')
+    rotation_speed = animation_property('rotation_speed')
+    limp_rotation = animation_property('limp_rotation')
+    leg_rotation_speed = animation_property('leg_rotation_speed')
 
-        grid_position = get_grid_index(new_position)
-        if 0 <= grid_position[0] < self.map_grid.shape[0] and 0 <= grid_position[1] < self.map_grid.shape[1]:
-            return not self.map_grid[grid_position]
-        else:
-            return True
+    def place_body(self, render_state):
+        # Places the body and limbs in the (x, z, rotation, limp rotation) state rendering interpolated to
+        location_x, location_z, rotation, limp_rotation = render_state
+        self.render_location = [location_x, location_z]
+        self.body.set_location((location_x, -0.5, location_z))
+        self.leg_jointR.set_rotation((0, 0, limp_rotation))
+        self.leg_jointL.set_rotation((0, 180, limp_rotation))
+        self.arm_jointR.set_rotation((0, 0, limp_rotation * 0.6))
+        self.arm_jointL.set_rotation((0, 180, limp_rotation * 0.6))
+        self.body.set_rotation((0, rotation, 0))
+
+    def move(self, distance, direction):
+        # Walks the distance against the direction, sliding along the walls it runs into
+        self.location[0], self.location[1] = self.collision_grid.move(self.location, (-direction[0] * distance, -direction[1] * distance),
+                                                                      self.collision_radius)
 
 
 class Player(Person):
@@ -163,19 +400,15 @@ class Player(Person):
         self.seen = False
         self.got_key = False
         self.scroll_level = 1
+        # Location the camera follows, it moves with the interpolated body
+        self.camera_location = None
         super().__init__(map_object, render_queue, update_queue, (0, 0, 1), [map_object.starting_point[1], 2 * map_object.starting_point[0]])
 
-    def update_object(self, previous_frame_duration):
-        glTranslatef(self.previous_location[0], 0, self.previous_location[1])
-        glTranslatef(-self.location[0], 0, -self.location[1])
-        super().update_object(previous_frame_duration)
-
-    def is_here(self, location):
-        distance = np.sqrt((self.location[0] - location[0]) ** 2 + (self.location[1] - location[1]) ** 2)
-        if distance < 0.1:
-            return True
-        else:
-            return False
+    def place_body(self, render_state):
+        super().place_body(render_state)
+        if self.camera_location is not None:
+            gl.glTranslatef(self.camera_location[0] - self.render_location[0], 0, self.camera_location[1] - self.render_location[1])
+        self.camera_location = self.render_location
 
     def spotted(self):
         self.body.set_color((0, 0, 0, 0.5))
@@ -185,7 +418,7 @@ class Player(Person):
 class Enemy(Person):
 
     def __init__(self, map_object, render_queue, update_queue, rotation_speed):
-        self.walking_direction = (randint(-1, 1), randint(-1, 1))
+        self.name = None
         place_found = False
         start_grid_index = [3, map_object.map_grid.shape[1] - 1]
         while not place_found:
@@ -195,12 +428,17 @@ class Enemy(Person):
             else:
                 place_found = map_object.map_grid[start_grid_index[0]][start_grid_index[1]]
         super().__init__(map_object, render_queue, update_queue, (1, 0, 0), get_grid_position(start_grid_index))
+        # The walking of all enemies is done at once
+        self.swarm = map_object.enemy_swarm
+        self.swarm_row = self.swarm.add(self, self.location)
 
         self.vision_slices = []
 
         self.vision_slice_subdivision = 10
         self.enemy_fov = 60
         self.enemy_sight_distance = 4
+        # A cone that hits no wall within the sight distance is drawn, and sees, this far
+        self.enemy_view_distance = self.enemy_sight_distance + 3
         self.vision_slices_width = 0.21
         self.vision_slices_height = 0.5 + uniform(-0.01, 0.01)
 
@@ -211,7 +449,8 @@ class Enemy(Person):
 
         self.name = TextElement(choice(names), activated=True)
         self.name.set_scale((0.4, 0.4, 0.4))
-        self.render_queue.subscribe(self.name)
+        self.name.set_location((self.location[0], 0.5, self.location[1] - 0.25))
+        self.render_queue.subscribe(self.name, dynamic=True)
 
         self.player_object = None
 
@@ -231,48 +470,13 @@ class Enemy(Person):
 
         self.rotation_speed = rotation_speed
 
-    def update_object(self, previous_frame_duration):
-        def get_new_walking_direction():
-            direction = [randint(-1, 1), randint(-1, 1)]
-            if sum(direction) == 0 and uniform(0, 1) < 0.9:
-                # If direction is opposite or otherwise zero, have another direction
-                addition = randint(2, 3)
-                if addition == 2:
-                    addition = -1
-                elif addition == 3:
-                    addition = 1
-                direction[1] = addition
-            return tuple(direction)
-
-        if uniform(0, 1) > 0.99:
-            self.walking_direction = get_new_walking_direction()
-
-        while super().check_collision(0.3, self.walking_direction, 0.25):
-            self.walking_direction = get_new_walking_direction()
-
-        super().move(move_distance_enemy(previous_frame_duration), self.walking_direction)
-
-        self.trace_vision_cones()
-
-        super().update_object(previous_frame_duration)
-
-        self.name.set_location((self.location[0], 0.5, self.location[1] - 0.25))
+        # The vision cones of all enemies are traced at once
+        map_object.guard_vision.add(self)
 
-    def trace_vision_cones(self):
-        def trace(enemy_sight_distance, trace_direction):
-            step_division = 10
-            for trace_step in range(enemy_sight_distance * step_division):
-                if self.player_object.is_here(get_location(self.location, 2 * trace_step / step_division, trace_direction)):
-                    self.player_object.spotted()
-                if self.check_collision(trace_step / step_division, trace_direction, 0.1):
-                    return (trace_step + 3) / step_division
-            return enemy_sight_distance + 3
-
-        for vision_slice in self.vision_slices:
-            direction_angle = self.rotation + vision_slice.rotation[1]
-            direction = (np.cos(np.deg2rad(direction_angle)), -np.sin(np.deg2rad(direction_angle)))
-            distance = trace(self.enemy_sight_distance, direction)
-            vision_slice.set_scale((distance, 1, distance / self.enemy_sight_distance * self.vision_slices_width))
+    def place_body(self, render_state):
+        super().place_body(render_state)
+        if self.name is not None:
+            self.name.set_location((self.render_location[0], 0.5, self.render_location[1] - 0.25))
 
     def set_player_object(self, player_object):
         if isinstance(player_object, Player):
@@ -0,0 +1,370 @@
+"""
+Frame profiler. Named scopes are timed into a fixed-size ring buffer, so recording costs the same every frame and old samples are
+overwritten. From the buffer it reports rolling percentiles per scope and writes Chrome trace files (open them in chrome://tracing
+or https://ui.perfetto.dev).
+
+Usage:
+    profiler = FrameProfiler()
+    with profiler.scope('update'):
+        ...
+    print(profiler.get_report())
+    profiler.export_chrome_trace('trace.json')
+
+For slow frames, FrameCapture measures the cost of every object in the render and update queue over a few frames, together with a
+cProfile of the whole game. RoundMemoryReport compares the memory and live objects before and after the end of every round.
+"""
+
+import cProfile
+import gc
+import io
+import json
+import pstats
+import tracemalloc
+import numpy as np
+from timeit import default_timer as timer
+
+
+class ProfilerScope:
+    # Context manager that records one named scope, reused for every time the scope is entered
+
+    def __init__(self, profiler, name_index):
+        self.profiler = profiler
+        self.name_index = name_index
+        self.start = 0
+
+    def __enter__(self):
+        self.start = timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.record(self.name_index, self.start, timer())
+
+
+class DisabledScope:
+    # Scope that records nothing, used when the profiler is turned off
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+disabled_scope = DisabledScope()
+
+
+class FrameProfiler:
+
+    def __init__(self, capacity=8192, enabled=True, counter_capacity=1024, max_counters=16):
+        """
+        :param capacity: Amount of scope samples kept, the oldest are overwritten
+        :param enabled: Record scopes, when off the scopes do nothing
+        :param counter_capacity: Amount of frames of counters kept (like the GL calls per frame)
+        :param max_counters: Amount of different counters that can be recorded
+        """
+        self.capacity = capacity
+        self.enabled = enabled
+
+        self.names = []
+        self.scopes = {}
+
+        # Ring buffer of samples, one row per recorded scope
+        self.sample_names = np.zeros(capacity, dtype=np.int16)
+        self.sample_starts = np.zeros(capacity, dtype=np.float64)
+        self.sample_durations = np.zeros(capacity, dtype=np.float64)
+        self.sample_frames = np.zeros(capacity, dtype=np.int64)
+        self.write_index = 0
+        self.sample_count = 0
+
+        # Ring buffer of counter values, one row per frame the counters were recorded
+        self.counter_names = []
+        self.counter_capacity = counter_capacity
+        self.counter_times = np.zeros(counter_capacity, dtype=np.float64)
+        self.counter_values = np.zeros((counter_capacity, max_counters), dtype=np.float64)
+        self.counter_write_index = 0
+        self.counter_count = 0
+
+        self.frame = 0
+        self.start_time = timer()
+
+    def scope(self, name):
+        # Returns the context manager that times the scope 'name'
+        if not self.enabled:
+            return disabled_scope
+        scope = self.scopes.get(name)
+        if scope is None:
+            scope = ProfilerScope(self, len(self.names))
+            self.names.append(name)
+            self.scopes[name] = scope
+        return scope
+
+    def record(self, name_index, start, end):
+        index = self.write_index
+        self.sample_names[index] = name_index
+        self.sample_starts[index] = start
+        self.sample_durations[index] = end - start
+        self.sample_frames[index] = self.frame
+        self.write_index = (index + 1) % self.capacity
+        if self.sample_count < self.capacity:
+            self.sample_count += 1
+
+    def record_counters(self, counters):
+        # Records the values of a dict of counters for the current frame
+        if not self.enabled:
+            return
+        index = self.counter_write_index
+        self.counter_times[index] = timer()
+        self.counter_values[index] = 0
+        for name, value in counters.items():
+            if name not in self.counter_names:
+                self.counter_names.append(name)
+            self.counter_values[index, self.counter_names.index(name)] = value
+        self.counter_write_index = (index + 1) % self.counter_capacity
+        if self.counter_count < self.counter_capacity:
+            self.counter_count += 1
+
+    def next_frame(self):
+        self.frame += 1
+
+    def get_samples(self):
+        # Returns the (names, starts, durations, frames) of the kept samples, oldest first
+        if self.sample_count < self.capacity:
+            order = slice(0, self.sample_count)
+            return (self.sample_names[order], self.sample_starts[order], self.sample_durations[order], self.sample_frames[order])
+        order = np.roll(np.arange(self.capacity), -self.write_index)
+        return self.sample_names[order], self.sample_starts[order], self.sample_durations[order], self.sample_frames[order]
+
+    def get_counters(self):
+        # Returns the (times, values) of the kept counter rows, oldest first
+        if self.counter_count < self.counter_capacity:
+            order = slice(0, self.counter_count)
+        else:
+            order = np.roll(np.arange(self.counter_capacity), -self.counter_write_index)
+        return self.counter_times[order], self.counter_values[order, :len(self.counter_names)]
+
+    def get_percentiles(self, percentiles=(50, 95, 99)):
+        """
+        :return: Dict of scope name -> (sample count, durations in ms at the percentiles), over the kept samples
+        """
+        sample_names, sample_starts, sample_durations, sample_frames = self.get_samples()
+        statistics = {}
+        for name_index, name in enumerate(self.names):
+            durations = sample_durations[sample_names == name_index]
+            if len(durations):
+                statistics[name] = (len(durations), np.percentile(durations, percentiles) * 1000)
+        return statistics
+
+    def get_report(self, percentiles=(50, 95, 99)):
+        report = [f"{'scope':<12}{'samples':>8}" + ''.join(f"{f'p{percentile}':>10}" for percentile in percentiles)]
+        for name, (count, values) in self.get_percentiles(percentiles).items():
+            report.append(f'{name:<12}{count:>8}' + ''.join(f'{value:>8.2f}ms' for value in values))
+        if self.counter_count:
+            counter_values = self.get_counters()[1]
+            report.append(f"{'counter':<12}{'frames':>8}" + ''.join(f"{f'p{percentile}':>10}" for percentile in percentiles))
+            for counter_i, name in enumerate(self.counter_names):
+                values = np.percentile(counter_values[:, counter_i], percentiles)
+                report.append(f'{name:<12}{self.counter_count:>8}' + ''.join(f'{value:>10.0f}' for value in values))
+        return '\n'.join(report)
+
+    def export_chrome_trace(self, filename):
+        # Writes the kept samples as complete events in the Chrome trace event format, times in microseconds
+        sample_names, sample_starts, sample_durations, sample_frames = self.get_samples()
+        events = [{'name': self.names[name_index], 'ph': 'X', 'pid': 0, 'tid': 0,
+                   'ts': (start - self.start_time) * 1e6, 'dur': duration * 1e6, 'args': {'frame': int(frame)}}
+                  for name_index, start, duration, frame in zip(sample_names, sample_starts, sample_durations, sample_frames)]
+        # Counters are shown as graphs above the scopes
+        counter_times, counter_values = self.get_counters()
+        events += [{'name': 'counters', 'ph': 'C', 'pid': 0, 'ts': (time - self.start_time) * 1e6,
+                    'args': {name: float(value) for name, value in zip(self.counter_names, values)}}
+                   for time, values in zip(counter_times, counter_values)]
+        with open(filename, 'w') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
+        return len(events)
+
+    def clear(self):
+        self.write_index = 0
+        self.sample_count = 0
+        self.counter_write_index = 0
+        self.counter_count = 0
+
+
+def get_object_label(measured_object):
+    # Readable name of an object instance, for the reports
+    label = type(measured_object).__name__
+    object_type = getattr(measured_object, 'object_type', None)
+    if object_type is not None:
+        label += f' {object_type}'
+    location = getattr(measured_object, 'location', None)
+    try:
+        label += ' at (' + ', '.join(f'{coordinate:.1f}' for coordinate in location) + ')'
+    except (TypeError, ValueError):
+        # No location, or not a single point (like the location arrays of PersonAnimation)
+        pass
+    return f'{label} [{id(measured_object):x}]'
+
+
+class CostAccounting:
+    """
+    Time spent and calls per object class and per object instance, grouped per phase (like 'update' or 'draw'). The render and
+    update queue add to it while it is set as their 'cost_accounting', without it they do not measure anything.
+    """
+
+    def __init__(self):
+        # (phase, class name) -> [calls, seconds], and (phase, object id) -> [label, calls, seconds]
+        self.class_costs = {}
+        self.instance_costs = {}
+
+    def add(self, phase, measured_object, duration, calls=1):
+        class_cost = self.class_costs.setdefault((phase, type(measured_object).__name__), [0, 0])
+        class_cost[0] += calls
+        class_cost[1] += duration
+        instance_cost = self.instance_costs.get((phase, id(measured_object)))
+        if instance_cost is None:
+            instance_cost = self.instance_costs[(phase, id(measured_object))] = [get_object_label(measured_object), 0, 0]
+        instance_cost[1] += calls
+        instance_cost[2] += duration
+
+    def add_batch(self, phase, measured_objects, duration):
+        # Work drawn in one call is divided evenly over the objects in it
+        for measured_object in measured_objects:
+            self.add(phase, measured_object, duration / len(measured_objects))
+
+    def get_report(self, top=20, frames=1):
+        """
+        :param top: Amount of classes and instances to list, the most expensive first
+        :param frames: Amount of frames the costs were collected over, the times are given per frame
+        """
+        report = [f'Costs per class, per frame over {frames} frames',
+                  f"{'phase':<12}{'class':<30}{'calls':>10}{'time':>12}"]
+        for (phase, class_name), (calls, duration) in sorted(self.class_costs.items(), key=lambda item: -item[1][1])[:top]:
+            report.append(f'{phase:<12}{class_name:<30}{calls / frames:>10.1f}{duration / frames * 1000:>10.3f}ms')
+        report += ['', f'Top {top} instances, per frame',
+                   f"{'phase':<12}{'instance':<60}{'calls':>10}{'time':>12}"]
+        for (phase, _), (label, calls, duration) in sorted(self.instance_costs.items(), key=lambda item: -item[1][2])[:top]:
+            report.append(f'{phase:<12}{label:<60}{calls / frames:>10.1f}{duration / frames * 1000:>10.3f}ms')
+        return '\n'.join(report)
+
+
+class FrameCapture:
+    """
+    Captures the next frames of the game: cost accounting in the given queues and a cProfile of everything. When the frames are
+    done, the top of the cost report is printed and written to a text file, and the cProfile statistics to a pstats file (read them
+    with 'python -m pstats <file>' or snakeviz).
+    """
+
+    def __init__(self, queues, frames=120, top=20, report_filename='frame_costs.txt', stats_filename='frame_capture.pstats'):
+        self.queues = queues
+        self.frames = frames
+        self.top = top
+        self.report_filename = report_filename
+        self.stats_filename = stats_filename
+
+        self.running = False
+        self.starting = False
+        self.frames_left = 0
+        self.cost_accounting = None
+        self.profile = None
+
+    def start(self):
+        # The capture starts at the next frame, so only whole frames are measured
+        if not self.running:
+            self.starting = True
+
+    def next_frame(self):
+        # Call at the start of every frame, stops the capture and writes the reports after the last frame
+        if self.running:
+            self.frames_left -= 1
+            if self.frames_left <= 0:
+                self.stop()
+        if self.starting:
+            self.starting = False
+            self.cost_accounting = CostAccounting()
+            for queue in self.queues:
+                queue.cost_accounting = self.cost_accounting
+            self.profile = cProfile.Profile()
+            self.running = True
+            self.frames_left = self.frames
+            self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self.running = False
+        for queue in self.queues:
+            queue.cost_accounting = None
+
+        report = self.cost_accounting.get_report(self.top, self.frames - self.frames_left)
+        stats_report = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=stats_report)
+        stats.dump_stats(self.stats_filename)
+        stats.sort_stats('cumulative').print_stats(self.top)
+        with open(self.report_filename, 'w') as report_file:
+            report_file.write(report + '\n\n' + stats_report.getvalue())
+        print(report)
+        print(f'Wrote the frame costs to {self.report_filename} and the cProfile statistics to {self.stats_filename}')
+
+
+def count_objects():
+    # Amount of live objects per type name, of the objects tracked by the garbage collector (instances of classes and containers)
+    counts = {}
+    for tracked_object in gc.get_objects():
+        type_name = type(tracked_object).__name__
+        counts[type_name] = counts.get(type_name, 0) + 1
+    return counts
+
+
+class RoundMemoryReport:
+    """
+    Memory accounting per round with tracemalloc, to find leaks over many rounds. Around the end of a round it compares the traced
+    memory and the live objects per type before and after, and after every round it compares with the previous round and the first
+    one: memory that keeps growing round after round is a leak. Tracing slows down every allocation, so only use it to look for leaks.
+    """
+
+    def __init__(self, top=10):
+        """
+        :param top: Amount of types and allocation sites to list
+        """
+        self.top = top
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+        self.before_bytes = 0
+        self.before_counts = {}
+        self.previous_snapshot = None
+        # Traced bytes after the end of every round
+        self.round_bytes = []
+
+    def before_end_round(self):
+        gc.collect()
+        self.before_bytes = tracemalloc.get_traced_memory()[0]
+        self.before_counts = count_objects()
+
+    def after_end_round(self, round_number):
+        # Call after the objects of the round have been deleted, prints and returns the report
+        gc.collect()
+        after_bytes = tracemalloc.get_traced_memory()[0]
+        after_counts = count_objects()
+        snapshot = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+
+        report = [f'Memory at the end of round {round_number}: {self.before_bytes / 2 ** 20:.2f} MiB before, {after_bytes / 2 ** 20:.2f} MiB '
+                  f'after, {(self.before_bytes - after_bytes) / 2 ** 20:.2f} MiB freed']
+        if self.round_bytes:
+            report.append(f'Growth since the previous round {(after_bytes - self.round_bytes[-1]) / 2 ** 10:+.1f} KiB, '
+                          f'since the first round {(after_bytes - self.round_bytes[0]) / 2 ** 10:+.1f} KiB over {len(self.round_bytes)} rounds')
+        self.round_bytes.append(after_bytes)
+
+        changed_types = sorted(set(self.before_counts) | set(after_counts),
+                               key=lambda type_name: -abs(after_counts.get(type_name, 0) - self.before_counts.get(type_name, 0)))
+        report.append(f"{'type':<30}{'before':>10}{'after':>10}")
+        for type_name in changed_types[:self.top]:
+            report.append(f'{type_name:<30}{self.before_counts.get(type_name, 0):>10}{after_counts.get(type_name, 0):>10}')
+
+        if self.previous_snapshot is not None:
+            report.append('Allocation sites that grew since the previous round:')
+            for statistic in snapshot.compare_to(self.previous_snapshot, 'lineno')[:self.top]:
+                if statistic.size_diff > 0:
+                    report.append(f'    {statistic}')
+        self.previous_snapshot = snapshot
+
+        report = '\n'.join(report)
+        print(report)
+        return report
@@ -24,20 +24,14 @@ setup(
 
     include_package_data=True,
 
-    python_requires='>=3.5, <4',
+    python_requires='>=3.7, <4',
 
     install_requires=['pygame', 'numpy', 'pillow', 'pyopengl', 'pyopengl-accelerate'],
 
     classifiers=[
         'License :: OSI Approved :: MIT License',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 2',
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Operating System :: Microsoft :: Windows',
         'Operating System :: POSIX :: Linux',
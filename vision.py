@@ -0,0 +1,230 @@
+"""
+Vision of the guards. The rays of the vision cones of all guards are traced through map_grid in one vectorized grid traversal per tick.
+Which cells can be seen from which is computed once per map in a line of sight table, the player is spotted when the cell of the
+player can be seen from the cell of a guard, within the angle and reach of its vision cone.
+"""
+
+from timeit import default_timer as timer
+
+import numpy as np
+
+from game_objects import object_store
+
+
+def cast_rays(map_grid, origins, directions, max_distance):
+    """
+    Exact grid traversal (Amanatides and Woo) of many rays at once. Every step moves all rays that have not ended yet into the next
+    cell they cross, a ray ends in the first wall cell or outside of the map. A cell of map_grid is 2 units wide, cell (row, column)
+    covers x from 2 * column - 1 to 2 * column + 1 and z from 2 * row - 1 to 2 * row + 1.
+    :param map_grid: 2D boolean array, True where the map is open
+    :param origins: (rays, 2) array of (x, z) start points
+    :param directions: (rays, 2) array of (x, z) unit directions
+    :param max_distance: Rays are traced up to this distance
+    :return: (rays,) array with the distance to the first wall, or inf for rays that hit no wall within max_distance
+    """
+    # Cells outside of the map are walls, so a ray always ends within the padding and needs no bounds checks
+    padded_grid = np.pad(map_grid, 1)
+    ray_count = len(origins)
+    # Position in cells, in padded coordinates
+    position = (np.asarray(origins, np.float64) + 1) / 2 + 1
+    directions = np.asarray(directions, np.float64)
+    cell = np.floor(position).astype(np.intp)
+    step = np.where(directions >= 0, 1, -1)
+
+    # Distance along the ray to the next cell boundary on each axis, and between boundaries
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta = np.abs(2 / directions)
+        next_boundary = np.where(directions >= 0, cell + 1 - position, position - cell) * delta
+    next_boundary[np.isnan(next_boundary)] = np.inf
+
+    distance = np.full(ray_count, np.inf)
+    # Rays starting in a wall end at once
+    active = padded_grid[cell[:, 1], cell[:, 0]]
+    distance[~active] = 0
+    rows = np.arange(ray_count)
+    # A ray crosses at most this many cell boundaries within max_distance
+    for _ in range(2 * int(np.ceil(max_distance / 2)) + 2):
+        if not active.any():
+            break
+        axis = (next_boundary[:, 1] < next_boundary[:, 0]).astype(np.intp)
+        travelled = next_boundary[rows, axis]
+        active &= travelled <= max_distance
+        cell[rows, axis] += step[rows, axis] * active
+        next_boundary[rows, axis] += delta[rows, axis]
+        hit = active & ~padded_grid[cell[:, 1], cell[:, 0]]
+        distance[hit] = travelled[hit]
+        active &= ~hit
+    return distance
+
+
+def get_cells(locations):
+    # (row, column) of the cells of (x, z) locations, an array of shape (..., 2)
+    return np.floor((np.asarray(locations, np.float64)[..., ::-1] + 1) / 2).astype(np.intp)
+
+
+class LineOfSightTable:
+    """
+    Which open cells of map_grid can be seen from every open cell, within a view distance. A cell can see another when the line
+    between their centers crosses no wall cell, in both directions. The cells around a cell within the view distance form a round
+    stencil of offsets, every cell has a bitset with a bit per offset, packed into bytes. The lines of all cells and offsets are traced
+    in batches with cast_rays.
+    """
+
+    def __init__(self, map_grid, view_distance, batch_size=4096):
+        """
+        :param map_grid: 2D boolean array, True where the map is open
+        :param view_distance: The furthest distance between the centers of two cells that see each other
+        :param batch_size: Number of cells of which the lines are traced at once
+        """
+        start = timer()
+        self.view_distance = view_distance
+        # Offsets (rows, columns) of the stencil, and the index of every offset in the bitsets, -1 for offsets outside of the stencil
+        self.reach = int(view_distance // 2)
+        row_offsets, column_offsets = np.mgrid[-self.reach:self.reach + 1, -self.reach:self.reach + 1]
+        in_stencil = 2 * np.hypot(row_offsets, column_offsets) <= view_distance
+        self.offsets = np.stack((row_offsets[in_stencil], column_offsets[in_stencil]), axis=1)
+        self.offset_indices = np.full(in_stencil.shape, -1, np.intp)
+        self.offset_indices[in_stencil] = np.arange(len(self.offsets))
+
+        self.bits = np.zeros(map_grid.shape + ((len(self.offsets) + 7) // 8,), np.uint8)
+        lengths = 2 * np.hypot(self.offsets[:, 0], self.offsets[:, 1])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            directions = np.nan_to_num(2 * self.offsets[:, ::-1] / lengths[:, np.newaxis])
+        open_cells = np.argwhere(map_grid)
+        for batch_start in range(0, len(open_cells), batch_size):
+            cells = open_cells[batch_start:batch_start + batch_size]
+            targets = cells[:, np.newaxis] + self.offsets
+            in_map = (targets >= 0).all(axis=2) & (targets < map_grid.shape).all(axis=2)
+            target_open = np.zeros(in_map.shape, bool)
+            target_open[in_map] = map_grid[targets[in_map][:, 0], targets[in_map][:, 1]]
+
+            # Trace a line from the center of every cell to every open cell in its stencil, it is clear when it hits no wall on the way
+            origins = np.repeat(2 * cells[:, ::-1].astype(np.float64), len(self.offsets), axis=0)
+            wall_distances = cast_rays(map_grid, origins, np.tile(directions, (len(cells), 1)), view_distance)
+            visible = target_open & (wall_distances.reshape(in_map.shape) > lengths)
+            self.bits[cells[:, 0], cells[:, 1]] = np.packbits(visible, axis=1)
+
+        # A line through the exact corner of two cells is traced along one of them, which depends on its direction. A cell only sees
+        # another when that one sees it back, so the table is the same both ways
+        visible = np.unpackbits(self.bits, axis=2, count=len(self.offsets)).astype(bool)
+        padded_visible = np.pad(visible, ((self.reach, self.reach), (self.reach, self.reach), (0, 0)))
+        opposite_indices = self.offset_indices[::-1, ::-1][in_stencil]
+        for index, (row_offset, column_offset) in enumerate(self.offsets):
+            visible[:, :, index] &= padded_visible[self.reach + row_offset:self.reach + row_offset + map_grid.shape[0],
+                                                   self.reach + column_offset:self.reach + column_offset + map_grid.shape[1],
+                                                   opposite_indices[index]]
+        self.bits = np.packbits(visible, axis=2)
+
+        self.cell_count = len(open_cells)
+        self.build_time = timer() - start
+
+    def is_visible(self, from_cells, to_cell):
+        """
+        :param from_cells: (n, 2) array of open (row, column) cells
+        :param to_cell: (row, column) of one cell
+        :return: (n,) boolean array, True where to_cell can be seen from the cell
+        """
+        offsets = np.asarray(to_cell) - from_cells
+        in_reach = (np.abs(offsets) <= self.reach).all(axis=1)
+        offset_indices = self.offset_indices[tuple(np.clip(offsets + self.reach, 0, 2 * self.reach).T)]
+        in_reach &= offset_indices >= 0
+        offset_indices = np.maximum(offset_indices, 0)
+        # Bits are packed with the first offset in the highest bit of the first byte
+        packed = self.bits[from_cells[:, 0], from_cells[:, 1], offset_indices >> 3]
+        return in_reach & ((packed >> (7 - (offset_indices & 7))) & 1).astype(bool)
+
+    def get_report(self):
+        return f"Line of sight: {self.cell_count} open cells x {len(self.offsets)} offsets in {self.bits.nbytes / 1024:.1f} KiB, " \
+               f"built in {self.build_time * 1000:.1f} ms"
+
+
+class GuardVision:
+    """
+    Vision cones of all guards of a map, traced in one vectorized step per tick. Every cone is a fan of vision slices, the ray along
+    the middle of each slice is cast through map_grid and the slice is scaled to where it hits a wall. The player is spotted when the
+    line of sight table says its cell can be seen from the cell of a guard, and it is within the angle and view distance of the cone.
+    """
+
+    def __init__(self, map_grid, person_animation, update_queue):
+        self.map_grid = map_grid
+        self.person_animation = person_animation
+        self.enemies = []
+        self.player_object = None
+        self.line_of_sight = None
+
+        # Per enemy: the row of its animation, the cosine of half its field of view and its view distance
+        self.enemy_animation_rows = np.zeros(0, np.intp)
+        self.half_fov_cosines = np.zeros(0)
+        self.view_distances = np.zeros(0)
+
+        # Per ray: the enemy it belongs to, the row of the animation of that enemy, its angle from the heading of the enemy and the
+        # object store row of its vision slice
+        self.ray_enemies = np.zeros(0, np.intp)
+        self.animation_rows = np.zeros(0, np.intp)
+        self.ray_angles = np.zeros(0)
+        self.slice_rows = np.zeros(0, np.intp)
+        self.sight_distances = np.zeros(0)
+        self.ray_view_distances = np.zeros(0)
+        self.slice_widths = np.zeros(0)
+
+        # Updated after the persons have moved and turned in a tick
+        update_queue.subscribe(self, system=True)
+
+    def add(self, enemy):
+        enemy_index = len(self.enemies)
+        self.enemies.append(enemy)
+        self.enemy_animation_rows = np.append(self.enemy_animation_rows, enemy.animation_row)
+        self.half_fov_cosines = np.append(self.half_fov_cosines, np.cos(np.deg2rad(enemy.enemy_fov / 2)))
+        self.view_distances = np.append(self.view_distances, enemy.enemy_view_distance)
+
+        slice_count = len(enemy.vision_slices)
+        self.ray_enemies = np.concatenate((self.ray_enemies, np.full(slice_count, enemy_index)))
+        self.animation_rows = np.concatenate((self.animation_rows, np.full(slice_count, enemy.animation_row)))
+        self.ray_angles = np.concatenate((self.ray_angles, [vision_slice.rotation[1] for vision_slice in enemy.vision_slices]))
+        self.slice_rows = np.concatenate((self.slice_rows, [vision_slice.row for vision_slice in enemy.vision_slices]))
+        self.sight_distances = np.concatenate((self.sight_distances, np.full(slice_count, enemy.enemy_sight_distance)))
+        self.ray_view_distances = np.concatenate((self.ray_view_distances, np.full(slice_count, enemy.enemy_view_distance)))
+        self.slice_widths = np.concatenate((self.slice_widths, np.full(slice_count, enemy.vision_slices_width)))
+
+    def set_player_object(self, player_object):
+        self.player_object = player_object
+
+    def build_line_of_sight(self):
+        # Call once all enemies are added, map_grid does not change during a round
+        if self.enemies:
+            self.line_of_sight = LineOfSightTable(self.map_grid, self.view_distances.max())
+
+    def get_rays(self, enemy_locations):
+        # Origins and directions of the rays of all vision slices, a slice points along -x in the body of the enemy
+        angles = np.deg2rad(self.person_animation.rotation[self.animation_rows] + self.ray_angles)
+        return enemy_locations[self.ray_enemies], np.stack((-np.cos(angles), np.sin(angles)), axis=1)
+
+    def sees_player(self, enemy_locations):
+        # The player is seen from a cell in the line of sight, in the direction the cone points and not further than the cone can reach
+        relative = np.asarray(self.player_object.location, np.float64) - enemy_locations
+        distances = np.hypot(relative[:, 0], relative[:, 1])
+        rotations = np.deg2rad(self.person_animation.rotation[self.enemy_animation_rows])
+        facing = relative[:, 0] * -np.cos(rotations) + relative[:, 1] * np.sin(rotations) >= distances * self.half_fov_cosines
+        in_sight = facing & (distances <= self.view_distances)
+        if not in_sight.any():
+            return False
+        return self.line_of_sight.is_visible(get_cells(enemy_locations[in_sight]), get_cells(self.player_object.location)).any()
+
+    def update_object(self, tick_duration):
+        if not self.enemies:
+            return
+        enemy_locations = np.array([enemy.location for enemy in self.enemies], np.float64)
+        origins, directions = self.get_rays(enemy_locations)
+        max_distance = self.sight_distances.max()
+        wall_distances = cast_rays(self.map_grid, origins, directions, max_distance)
+
+        # A cone reaches a little into the wall it hits, a cone that hits no wall within sight is drawn up to its view distance
+        hit = wall_distances <= self.sight_distances
+        lengths = np.where(hit, wall_distances + 0.2, self.ray_view_distances)
+        sizes = object_store.size
+        sizes[self.slice_rows, 0] = lengths
+        sizes[self.slice_rows, 2] = lengths / self.sight_distances * self.slice_widths
+        object_store.matrix_dirty[self.slice_rows] = True
+
+        if self.player_object is not None and self.sees_player(enemy_locations):
+            self.player_object.spotted()